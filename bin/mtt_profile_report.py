@@ -0,0 +1,78 @@
+# coding: utf8
+"""
+utility script for combining the structured profiling reports written by
+`mtt.profiling_tools.SpanRecorder` (e.g. for many chunks, branches or datasets)
+into per-section statistics
+"""
+import argparse
+import glob
+import json
+import os
+
+from law.util import human_bytes, human_duration
+
+from mtt.profiling_tools import merge_span_reports
+
+
+def find_reports(paths):
+    # expand directories to the JSON reports they contain (skipping trace and metrics files)
+    reports = []
+    for path in paths:
+        if os.path.isdir(path):
+            reports.extend(sorted(
+                fname
+                for fname in glob.glob(os.path.join(path, "**", "*.json"), recursive=True)
+                if not fname.endswith((".trace.json", ".metrics.json"))
+            ))
+        else:
+            reports.append(path)
+    return reports
+
+
+def print_stats(stats, percentiles):
+    for path, s in sorted(stats.items()):
+        print(f"{path}")
+        durations = ", ".join(
+            f"{key} {human_duration(seconds=s[key])}"
+            for key in ("total", "mean", *(f"p{q:g}" for q in percentiles), "max")
+        )
+        print(f"  {s['count']} calls: {durations}")
+        if s["throughput"] is not None:
+            print(f"  {s['n_events']} events, {s['throughput']:.1f} events/s")
+        if s["mem_peak"] is not None:
+            print(f"  memory peak: {human_bytes(s['mem_peak'], fmt=True)}")
+        if s["rss_peak"] is not None:
+            print(f"  rss peak: {human_bytes(s['rss_peak'], fmt=True)}")
+        for name, value in sorted(s["counters"].items()):
+            print(f"  {name}: {value}")
+        for name, value in sorted(s.get("gauges", {}).items()):
+            print(f"  {name} (max): {value}")
+
+
+def main(paths, group_by=None, percentiles=(50, 90, 99), output=None):
+    reports = find_reports(paths)
+    stats = merge_span_reports(reports, group_by=group_by, percentiles=percentiles)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(stats, f, indent=2)
+
+    print(f"combined {len(reports)} reports")
+    if group_by is None:
+        print_stats(stats, percentiles)
+        return
+
+    for key, group_stats in sorted(stats.items(), key=lambda item: str(item[0])):
+        print(f"\n== {group_by}: {key} ==")
+        print_stats(group_stats, percentiles)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("paths", nargs="+", help="JSON reports or directories containing them")
+    parser.add_argument("--group-by", help="metadata key for grouping reports, e.g. 'dataset'")
+    parser.add_argument("--percentiles", type=float, nargs="+", default=[50, 90, 99])
+    parser.add_argument("--output", help="write combined statistics to this JSON file")
+    args = parser.parse_args()
+
+    main(args.paths, group_by=args.group_by, percentiles=args.percentiles, output=args.output)
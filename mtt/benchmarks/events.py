@@ -0,0 +1,540 @@
+# coding: utf-8
+"""
+Generator of synthetic NanoAOD-like events for benchmarking and profiling the
+producers and selectors offline, without input files or a grid proxy.
+
+Each event contains a semileptonic ttbar decay, generated with simple two-body
+decay kinematics, from which the reconstructed objects are derived by smearing,
+complemented by additional jets. The events contain the columns used by the default
+selection and by the `ttbar`, `neutrino_candidates`, `choose_lepton` and `ml_inputs`
+producers (see `generate_events`).
+
+Usage:
+
+    python -m mtt.benchmarks.events --n-events 100000 --boosted-frac 0.3 --output events.parquet
+"""
+import argparse
+
+import awkward as ak
+import numpy as np
+
+from mtt.production.util import (
+    p4_from_ptetaphim, p4_to_ptetaphim, p4_where, p4_boost, p4_boostvec, delta_r_any_within,
+)
+
+
+# channel ids (see `config_2017`)
+CHANNEL_IDS = {"e": 1, "mu": 2}
+
+# trigger paths and MET filters of the 2017 config
+HLT_PATHS = {
+    "e": ("Ele35_WPTight_Gsf", "Ele115_CaloIdVT_GsfTrkIdT"),
+    "mu": ("IsoMu27", "Mu50", "TkMu100", "OldMu100"),
+    "photon": ("Photon200",),
+}
+MET_FILTERS = (
+    "goodVertices", "globalSuperTightHalo2016Filter", "HBHENoiseFilter", "HBHENoiseIsoFilter",
+    "EcalDeadCellTriggerPrimitiveFilter", "BadPFMuonFilter", "BadPFMuonDzFilter",
+    "eeBadScFilter", "ecalBadCalibFilter",
+)
+
+# working points for b-tagging and top-tagging (DeepJet medium, DeepAK8 mass-decorrelated)
+BTAG_WP = 0.3040
+TOPTAG_WP = 0.725
+
+# masses and widths used for generating the decays
+M_TOP, W_TOP = 172.5, 1.4
+M_W, W_W = 80.4, 2.1
+M_B = 4.8
+M_LEP = {"e": 0.000511, "mu": 0.10566}
+
+# generator status flags (bit positions as in NanoAOD)
+_FLAGS_HARD = (1 << 0) | (1 << 7) | (1 << 8) | (1 << 12) | (1 << 13)
+_FLAGS_DECAY = (1 << 0) | (1 << 8) | (1 << 12) | (1 << 13)
+
+
+def draw_multiplicities(rng, n, dist, max_count=None):
+    """
+    Draw `n` object multiplicities from `dist`, given either as the mean of a Poisson
+    distribution or as a sequence of probabilities for 0, 1, 2, ... objects, optionally
+    clipped to `max_count`.
+    """
+    if np.ndim(dist) == 0:
+        counts = rng.poisson(dist, n)
+    else:
+        probs = np.asarray(dist, dtype=np.float64)
+        counts = rng.choice(len(probs), size=n, p=probs / probs.sum())
+    if max_count is not None:
+        counts = np.minimum(counts, max_count)
+    return counts.astype(np.int64)
+
+
+def _two_body_decay(rng, p4, m_1, m_2):
+    """
+    Decay the particles with four-vectors `p4` (tuple of component arrays) isotropically
+    in their rest frame into two particles with masses `m_1` and `m_2`, and return the
+    four-vectors of the decay products in the lab frame.
+    """
+    n = len(p4[0])
+    m = np.sqrt(np.maximum(p4[3] ** 2 - p4[0] ** 2 - p4[1] ** 2 - p4[2] ** 2, 0))
+    p = np.sqrt(np.maximum((m ** 2 - (m_1 + m_2) ** 2) * (m ** 2 - (m_1 - m_2) ** 2), 0)) / (2 * m)
+
+    cos_theta = rng.uniform(-1, 1, n)
+    sin_theta = np.sqrt(1 - cos_theta ** 2)
+    phi = rng.uniform(-np.pi, np.pi, n)
+    px, py, pz = p * sin_theta * np.cos(phi), p * sin_theta * np.sin(phi), p * cos_theta
+
+    boostvec = p4_boostvec(p4)
+    return (
+        p4_boost((px, py, pz, np.hypot(p, m_1)), boostvec),
+        p4_boost((-px, -py, -pz, np.hypot(p, m_2)), boostvec),
+    )
+
+
+def _truncated_exponential(rng, scale, low, high, n):
+    # exponential distribution with `scale`, truncated to [low, high)
+    u = rng.uniform(size=n)
+    span = 1 - np.exp(-(high - low) / scale)
+    return low - scale * np.log1p(-u * span)
+
+
+def _zip(fields, counts):
+    # jagged record array from flat field arrays and counts
+    return ak.unflatten(ak.zip(fields), counts)
+
+
+def _smear(rng, values, rel):
+    return values * np.maximum(rng.normal(1, rel, len(values)), 0.1)
+
+
+def generate_events(
+    n_events,
+    seed=0,
+    n_jet_dist=5.0,
+    max_jets=15,
+    n_fatjet_dist=(0.7, 0.25, 0.05),
+    boosted_frac=0.3,
+    electron_frac=0.5,
+    is_mc=True,
+    with_selected_objects=True,
+):
+    """
+    Generate `n_events` synthetic semileptonic ttbar events as an awkward array with
+    NanoAOD-like columns, using a random number generator seeded with `seed`.
+
+    The number of AK4 jets per event is drawn from `n_jet_dist` (at most `max_jets`, see
+    `draw_multiplicities`). The jets are obtained from the b quarks and the quarks from the
+    hadronic W boson decay (in random order, as long as the multiplicity allows), and from
+    additional jets. In a fraction `boosted_frac` of the events, the hadronically decaying top
+    quark is produced with a high transverse momentum and appears as a top-tagged AK8 jet.
+    The number of additional (not top-tagged) AK8 jets is drawn from `n_fatjet_dist`. The
+    charged lepton is an electron in a fraction `electron_frac` of the events, and a muon
+    otherwise, and the ``channel_id`` is set accordingly.
+
+    The events contain the columns ``event``, ``run``, ``luminosityBlock``, ``channel_id``,
+    ``Jet``, ``FatJet``, ``Electron``, ``Muon``, ``Photon``, ``MET``, ``HLT`` and ``Flag``. If
+    `is_mc` is set, the generator-level columns ``genWeight``, ``Generator``, ``LHE``,
+    ``Pileup``, ``GenPart``, ``GenJet`` and ``GenJetAK8`` are added. If `with_selected_objects`
+    is set, the object collections written by the default selection (``BJet``, ``LightJet``,
+    ``FatJetTopTag`` and ``FatJetTopTagDeltaRLepton``) are added as well, as needed by the
+    producers run after the selection (e.g. `ttbar`).
+    """
+    rng = np.random.default_rng(seed)
+    n = n_events
+
+    # -- generator-level ttbar decay
+
+    is_boosted = rng.uniform(size=n) < boosted_frac
+    is_electron = rng.uniform(size=n) < electron_frac
+    lep_mass = np.where(is_electron, M_LEP["e"], M_LEP["mu"])
+
+    # hadronic top: high pt and central for boosted events
+    pt_had = np.where(
+        is_boosted,
+        420 + rng.exponential(150, n),
+        _truncated_exponential(rng, 80, 0, 350, n),
+    )
+    eta_had = np.where(is_boosted, rng.uniform(-2.2, 2.2, n), rng.normal(0, 1.2, n))
+    phi_had = rng.uniform(-np.pi, np.pi, n)
+
+    # leptonic top: approximately back-to-back in the transverse plane
+    pt_lep = pt_had * rng.uniform(0.7, 1.2, n)
+    eta_lep = rng.normal(0, 1.0, n)
+    phi_lep = np.mod(phi_had + np.pi + rng.normal(0, 0.3, n) + np.pi, 2 * np.pi) - np.pi
+
+    m_top = rng.normal(M_TOP, W_TOP, (2, n))
+    top_had = p4_from_ptetaphim(pt_had, eta_had, phi_had, m_top[0])
+    top_lep = p4_from_ptetaphim(pt_lep, eta_lep, phi_lep, m_top[1])
+
+    m_w = np.clip(rng.normal(M_W, W_W, (2, n)), 60, 100)
+    w_had, b_had = _two_body_decay(rng, top_had, m_w[0], M_B)
+    w_lep, b_lep = _two_body_decay(rng, top_lep, m_w[1], M_B)
+    q_1, q_2 = _two_body_decay(rng, w_had, 0, 0)
+    lep, nu = _two_body_decay(rng, w_lep, lep_mass, 0)
+
+    # top decaying leptonically is the top quark (not antiquark) in half of the events
+    lep_sign = np.where(rng.uniform(size=n) < 0.5, 1, -1)
+
+    # -- reconstructed leptons
+
+    lep_pt, lep_eta, lep_phi, _ = p4_to_ptetaphim(lep)
+    lep_pt = _smear(rng, lep_pt, 0.01)
+    lep_charge = lep_sign.astype(np.int32)
+
+    def lepton_collection(mask, flavor, extra):
+        counts = mask.astype(np.int64)
+        fields = {
+            "pt": lep_pt[mask].astype(np.float32),
+            "eta": lep_eta[mask].astype(np.float32),
+            "phi": lep_phi[mask].astype(np.float32),
+            "mass": np.full(counts.sum(), M_LEP[flavor], dtype=np.float32),
+            "charge": lep_charge[mask],
+            "pdgId": (-lep_charge[mask] * (11 if flavor == "e" else 13)).astype(np.int32),
+        }
+        fields.update({name: func(counts.sum()) for name, func in extra.items()})
+        return _zip(fields, counts)
+
+    electron = lepton_collection(is_electron, "e", {
+        "cutBased": lambda k: np.full(k, 4, dtype=np.int32),
+        "deltaEtaSC": lambda k: rng.normal(0, 0.01, k).astype(np.float32),
+        "mvaFall17V2Iso_WP80": lambda k: rng.uniform(size=k) < 0.95,
+        "mvaFall17V2noIso_WP80": lambda k: rng.uniform(size=k) < 0.97,
+    })
+    muon = lepton_collection(~is_electron, "mu", {
+        "tightId": lambda k: rng.uniform(size=k) < 0.97,
+        "highPtId": lambda k: np.full(k, 2, dtype=np.uint8),
+        "pfIsoId": lambda k: np.full(k, 4, dtype=np.uint8),
+    })
+
+    # -- MET from neutrino
+
+    met_x = nu[0] + rng.normal(0, 15, n)
+    met_y = nu[1] + rng.normal(0, 15, n)
+    met = ak.zip({
+        "pt": np.hypot(met_x, met_y).astype(np.float32),
+        "phi": np.arctan2(met_y, met_x).astype(np.float32),
+    })
+
+    # -- AK4 jets from quarks and additional jets
+
+    n_jet = draw_multiplicities(rng, n, n_jet_dist, max_count=max_jets)
+
+    # quarks in random order per event: (b_had, q_1, q_2, b_lep)
+    quarks = np.stack([np.stack(p4_to_ptetaphim(p4), axis=-1) for p4 in (b_had, q_1, q_2, b_lep)], axis=1)
+    quarks[:, :, 3] = [M_B, 0, 0, M_B]
+    quark_is_b = np.array([True, False, False, True])
+    quark_order = np.argsort(rng.uniform(size=(n, 4)), axis=1)
+    n_quark_jet = np.minimum(n_jet, 4)
+    take_quark = np.arange(4)[None, :] < n_quark_jet[:, None]
+    quark_idx = quark_order[take_quark]
+    event_idx = np.repeat(np.arange(n), n_quark_jet)
+    quark_jets = quarks[event_idx, quark_idx]
+    quark_jets_b = quark_is_b[quark_idx]
+
+    n_extra_jet = n_jet - n_quark_jet
+    n_extra = n_extra_jet.sum()
+    extra_jets = np.stack([
+        30 + rng.exponential(40, n_extra),
+        rng.uniform(-2.5, 2.5, n_extra),
+        rng.uniform(-np.pi, np.pi, n_extra),
+        np.zeros(n_extra),
+    ], axis=-1)
+
+    # combine and sort jets by pt (quark jets first within each event before sorting)
+    jet_event = np.concatenate([event_idx, np.repeat(np.arange(n), n_extra_jet)])
+    jet_kin = np.concatenate([quark_jets, extra_jets])
+    jet_is_b = np.concatenate([quark_jets_b, np.zeros(n_extra, dtype=bool)])
+    jet_pt = _smear(rng, jet_kin[:, 0], 0.1)
+    order = np.lexsort((-jet_pt, jet_event))
+    jet_pt, jet_kin, jet_is_b = jet_pt[order], jet_kin[order], jet_is_b[order]
+    n_jet_total = len(jet_pt)
+    jet_mass = np.hypot(jet_kin[:, 3], 0.1 * jet_pt * rng.uniform(0.5, 1.5, n_jet_total))
+    jet = _zip({
+        "pt": jet_pt.astype(np.float32),
+        "eta": jet_kin[:, 1].astype(np.float32),
+        "phi": jet_kin[:, 2].astype(np.float32),
+        "mass": jet_mass.astype(np.float32),
+        "btagDeepFlavB": np.where(
+            jet_is_b,
+            rng.beta(5, 1, n_jet_total),
+            rng.beta(1, 8, n_jet_total),
+        ).astype(np.float32),
+        "rawFactor": rng.uniform(0, 0.2, n_jet_total).astype(np.float32),
+        "jetId": np.full(n_jet_total, 6, dtype=np.int32),
+        "hadronFlavour": np.where(jet_is_b, 5, 0).astype(np.int32),
+        "electronIdx1": np.full(n_jet_total, -1, dtype=np.int32),
+        "electronIdx2": np.full(n_jet_total, -1, dtype=np.int32),
+        "muonIdx1": np.full(n_jet_total, -1, dtype=np.int32),
+        "muonIdx2": np.full(n_jet_total, -1, dtype=np.int32),
+    }, n_jet)
+
+    # -- AK8 jets: top-tagged hadronic top (boosted events) and additional jets
+
+    n_extra_fatjet = draw_multiplicities(rng, n, n_fatjet_dist)
+    n_fatjet = n_extra_fatjet + is_boosted
+    n_extra_fj = n_extra_fatjet.sum()
+    n_top_fj = is_boosted.sum()
+    top_pt, top_eta, top_phi, _ = p4_to_ptetaphim(tuple(c[is_boosted] for c in top_had))
+    fatjet_event = np.concatenate([np.flatnonzero(is_boosted), np.repeat(np.arange(n), n_extra_fatjet)])
+    fatjet_pt = np.concatenate([
+        np.maximum(_smear(rng, top_pt, 0.05), 401),
+        200 + rng.exponential(100, n_extra_fj),
+    ])
+    fatjet_msoftdrop = np.concatenate([
+        np.clip(rng.normal(M_TOP, 12, n_top_fj), 106, 209),
+        rng.exponential(40, n_extra_fj),
+    ])
+    fatjet_fields = {
+        "pt": fatjet_pt,
+        "eta": np.concatenate([top_eta, rng.uniform(-2.5, 2.5, n_extra_fj)]),
+        "phi": np.concatenate([top_phi, rng.uniform(-np.pi, np.pi, n_extra_fj)]),
+        "mass": fatjet_msoftdrop * rng.uniform(1.0, 1.15, n_top_fj + n_extra_fj),
+        "msoftdrop": fatjet_msoftdrop,
+        "deepTagMD_TvsQCD": np.concatenate([
+            rng.uniform(TOPTAG_WP + 0.01, 1, n_top_fj),
+            rng.uniform(0, TOPTAG_WP - 0.01, n_extra_fj),
+        ]),
+        "tau1": rng.uniform(0.2, 0.6, n_top_fj + n_extra_fj),
+    }
+    fatjet_fields["tau2"] = fatjet_fields["tau1"] * rng.uniform(0.3, 0.9, n_top_fj + n_extra_fj)
+    fatjet_fields["tau3"] = fatjet_fields["tau2"] * rng.uniform(0.4, 0.9, n_top_fj + n_extra_fj)
+    order = np.lexsort((-fatjet_pt, fatjet_event))
+    fatjet = _zip(
+        {name: values[order].astype(np.float32) for name, values in fatjet_fields.items()},
+        n_fatjet,
+    )
+
+    # -- photons (rare)
+
+    n_photon = draw_multiplicities(rng, n, 0.1, max_count=2)
+    n_pho = n_photon.sum()
+    photon = _zip({
+        "pt": (20 + rng.exponential(30, n_pho)).astype(np.float32),
+        "eta": rng.uniform(-2.5, 2.5, n_pho).astype(np.float32),
+        "phi": rng.uniform(-np.pi, np.pi, n_pho).astype(np.float32),
+        "mass": np.zeros(n_pho, dtype=np.float32),
+    }, n_photon)
+
+    # -- trigger decisions and MET filters
+
+    hlt = {}
+    for channel, paths in HLT_PATHS.items():
+        in_channel = is_electron if channel == "e" else ~is_electron if channel == "mu" else False
+        for path in paths:
+            hlt[path] = rng.uniform(size=n) < np.where(in_channel, 0.95, 0.02)
+    flag = {name: rng.uniform(size=n) < 0.995 for name in MET_FILTERS}
+
+    events = {
+        "event": np.arange(n, dtype=np.uint64) + np.uint64(seed) * np.uint64(1 << 32),
+        "run": (
+            np.ones(n, dtype=np.uint32)
+            if is_mc else
+            rng.integers(297050, 306461, n).astype(np.uint32)
+        ),
+        "luminosityBlock": rng.integers(1, 2000, n).astype(np.uint32),
+        "channel_id": np.where(is_electron, CHANNEL_IDS["e"], CHANNEL_IDS["mu"]).astype(np.int8),
+        "Jet": jet,
+        "FatJet": fatjet,
+        "Electron": electron,
+        "Muon": muon,
+        "Photon": photon,
+        "MET": met,
+        "HLT": ak.zip(hlt),
+        "Flag": ak.zip(flag),
+    }
+
+    # -- object collections written by the default selection
+
+    if with_selected_objects:
+        events["BJet"] = jet[(jet.btagDeepFlavB >= BTAG_WP) & (abs(jet.eta) < 2.5) & (jet.pt > 30)]
+        events["LightJet"] = jet[(jet.btagDeepFlavB < BTAG_WP) & (abs(jet.eta) < 2.5) & (jet.pt > 30)]
+        toptag = fatjet[
+            (fatjet.pt > 400) &
+            (abs(fatjet.eta) < 2.5) &
+            (fatjet.deepTagMD_TvsQCD > TOPTAG_WP) &
+            (fatjet.msoftdrop > 105) &
+            (fatjet.msoftdrop < 210)
+        ]
+        lep_fields = ["pt", "eta", "phi", "mass"]
+        lepton = ak.concatenate([electron[lep_fields], muon[lep_fields]], axis=1)
+        events["FatJetTopTag"] = toptag
+        events["FatJetTopTagDeltaRLepton"] = toptag[~delta_r_any_within(toptag, lepton, 0.8)]
+
+    # -- generator-level information
+
+    if is_mc:
+        events.update(_generator_columns(
+            rng, n, is_boosted, is_electron, lep_sign, lep_mass,
+            top_had, top_lep, w_had, w_lep, b_had, b_lep, q_1, q_2, lep, nu, m_top, m_w,
+            quarks, quark_is_b, n_extra_jet, extra_jets,
+        ))
+
+    return ak.zip(events, depth_limit=1)
+
+
+def _generator_columns(
+    rng, n, is_boosted, is_electron, lep_sign, lep_mass,
+    top_had, top_lep, w_had, w_lep, b_had, b_lep, q_1, q_2, lep, nu, m_top, m_w,
+    quarks, quark_is_b, n_extra_jet, extra_jets,
+):
+    """
+    Return the generator-level columns for the decays generated in `generate_events`.
+    """
+    # generator particles per event, ordered by charge as in NanoAOD, with indices of the
+    # mother particles: 0: top quark, 1: top antiquark, 2: W+, 3: b quark, 4: W-, 5: b antiquark,
+    # 6-7: W+ decay products, 8-9: W- decay products (leptons or quarks)
+    is_top_lep = lep_sign > 0
+    lep_pdg = np.where(is_electron, 11, 13)
+    zeros = np.zeros(n)
+
+    def by_charge(lep_value, had_value):
+        # value for the particle from the leptonic decay if the top quark decays leptonically
+        return np.where(is_top_lep, lep_value, had_value)
+
+    particles = [
+        # (four-vector components, mass, pdg id, status)
+        (p4_where(is_top_lep, top_lep, top_had), by_charge(m_top[1], m_top[0]), 6, 22),
+        (p4_where(is_top_lep, top_had, top_lep), by_charge(m_top[0], m_top[1]), -6, 22),
+        (p4_where(is_top_lep, w_lep, w_had), by_charge(m_w[1], m_w[0]), 24, 22),
+        (p4_where(is_top_lep, b_lep, b_had), np.full(n, M_B), 5, 23),
+        (p4_where(is_top_lep, w_had, w_lep), by_charge(m_w[0], m_w[1]), -24, 22),
+        (p4_where(is_top_lep, b_had, b_lep), np.full(n, M_B), -5, 23),
+        (p4_where(is_top_lep, lep, q_1), by_charge(lep_mass, zeros), by_charge(-lep_pdg, 2), by_charge(1, 23)),
+        (p4_where(is_top_lep, nu, q_2), zeros, by_charge(lep_pdg + 1, -1), by_charge(1, 23)),
+        (p4_where(is_top_lep, q_1, lep), by_charge(zeros, lep_mass), by_charge(1, lep_pdg), by_charge(23, 1)),
+        (p4_where(is_top_lep, q_2, nu), zeros, by_charge(-2, -lep_pdg - 1), by_charge(23, 1)),
+    ]
+    kin = np.stack([np.stack(p4_to_ptetaphim(p4)[:3], axis=-1) for p4, _, _, _ in particles], axis=1)
+    masses = np.stack([mass for _, mass, _, _ in particles], axis=1)
+    pdg_id = np.stack([np.broadcast_to(pdg, n) for _, _, pdg, _ in particles], axis=1).astype(np.int32)
+    status = np.stack([np.broadcast_to(st, n) for _, _, _, st in particles], axis=1).astype(np.int32)
+    mother = np.array([-1, -1, 0, 0, 1, 1, 2, 2, 4, 4], dtype=np.int32)
+    flags = np.array([_FLAGS_HARD] * 6 + [_FLAGS_DECAY] * 4, dtype=np.int32)
+    counts = np.full(n, 10, dtype=np.int64)
+    gen_part = _zip({
+        "pt": kin[:, :, 0].ravel().astype(np.float32),
+        "eta": kin[:, :, 1].ravel().astype(np.float32),
+        "phi": kin[:, :, 2].ravel().astype(np.float32),
+        "mass": masses.ravel().astype(np.float32),
+        "pdgId": pdg_id.ravel(),
+        "status": status.ravel(),
+        "statusFlags": np.tile(flags, n),
+        "genPartIdxMother": np.tile(mother, n),
+    }, counts)
+
+    # generator jets from all quarks and the additional jets
+    n_gen_jet = 4 + n_extra_jet
+    gen_jet_event = np.concatenate([np.repeat(np.arange(n), 4), np.repeat(np.arange(n), n_extra_jet)])
+    gen_jet_kin = np.concatenate([quarks.reshape(-1, 4), extra_jets])
+    gen_jet_b = np.concatenate([np.tile(quark_is_b, n), np.zeros(len(extra_jets), dtype=bool)])
+    order = np.lexsort((-gen_jet_kin[:, 0], gen_jet_event))
+    gen_jet_kin, gen_jet_b = gen_jet_kin[order], gen_jet_b[order]
+    gen_jet = _zip({
+        "pt": gen_jet_kin[:, 0].astype(np.float32),
+        "eta": gen_jet_kin[:, 1].astype(np.float32),
+        "phi": gen_jet_kin[:, 2].astype(np.float32),
+        "mass": gen_jet_kin[:, 3].astype(np.float32),
+        "partonFlavour": np.where(gen_jet_b, 5, 0).astype(np.int32),
+        "hadronFlavour": np.where(gen_jet_b, 5, 0).astype(np.uint8),
+    }, n_gen_jet)
+
+    # large-radius generator jets from boosted hadronic tops
+    top_pt, top_eta, top_phi, top_mass = p4_to_ptetaphim(tuple(c[is_boosted] for c in top_had))
+    gen_jet_ak8 = _zip({
+        "pt": top_pt.astype(np.float32),
+        "eta": top_eta.astype(np.float32),
+        "phi": top_phi.astype(np.float32),
+        "mass": top_mass.astype(np.float32),
+    }, is_boosted.astype(np.int64))
+
+    # positive generator weights, except for a small fraction
+    gen_weight = np.where(rng.uniform(size=n) < 0.005, -1.0, 1.0).astype(np.float32)
+
+    return {
+        "genWeight": gen_weight,
+        "Generator": ak.zip({
+            "weight": gen_weight,
+            "x1": rng.uniform(0, 0.3, n).astype(np.float32),
+            "x2": rng.uniform(0, 0.3, n).astype(np.float32),
+            "id1": np.full(n, 21, dtype=np.int32),
+            "id2": np.full(n, 21, dtype=np.int32),
+            "scalePDF": np.full(n, M_TOP, dtype=np.float32),
+        }),
+        "LHE": ak.zip({
+            "HT": quarks[:, :, 0].sum(axis=1).astype(np.float32),
+        }),
+        "Pileup": ak.zip({
+            "nTrueInt": rng.normal(32, 10, n).clip(0).astype(np.float32),
+            "nPU": rng.poisson(32, n).astype(np.int32),
+        }),
+        "GenPart": gen_part,
+        "GenJet": gen_jet,
+        "GenJetAK8": gen_jet_ak8,
+    }
+
+
+def summarize(events):
+    """
+    Return a short summary of the multiplicities in the generated `events`.
+    """
+    n_jet = np.asarray(ak.num(events.Jet, axis=1))
+    lines = [
+        f"{len(events)} events",
+        f"jets per event: mean {n_jet.mean():.2f}, max {n_jet.max(initial=0)}",
+        f"fat jets per event: mean {ak.mean(ak.num(events.FatJet, axis=1)):.2f}",
+        f"electron channel: {ak.mean(events.channel_id == CHANNEL_IDS['e']):.3f}",
+    ]
+    if "FatJetTopTagDeltaRLepton" in events.fields:
+        lines.append(
+            f"boosted (top-tagged AK8 jet): {ak.mean(ak.num(events.FatJetTopTagDeltaRLepton, axis=1) > 0):.3f}",
+        )
+    return "\n".join(lines)
+
+
+def main(n_events, seed=0, output=None, **kwargs):
+    events = generate_events(n_events, seed=seed, **kwargs)
+    print(summarize(events))
+
+    if output:
+        ak.to_parquet(events, output)
+        print(f"written to {output}")
+
+    return events
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--n-events", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--n-jet-dist",
+        type=float,
+        nargs="+",
+        default=[5.0],
+        help="mean number of AK4 jets (Poisson), or probabilities for 0, 1, 2, ... jets",
+    )
+    parser.add_argument("--max-jets", type=int, default=15)
+    parser.add_argument(
+        "--n-fatjet-dist",
+        type=float,
+        nargs="+",
+        default=[0.7, 0.25, 0.05],
+        help="probabilities for 0, 1, 2, ... additional AK8 jets, or their mean number (Poisson)",
+    )
+    parser.add_argument("--boosted-frac", type=float, default=0.3)
+    parser.add_argument("--electron-frac", type=float, default=0.5)
+    parser.add_argument("--data", action="store_true", help="generate data-like events (no generator columns)")
+    parser.add_argument("--output", help="parquet file to write the events to")
+    args = parser.parse_args()
+
+    main(
+        args.n_events,
+        seed=args.seed,
+        output=args.output,
+        n_jet_dist=args.n_jet_dist[0] if len(args.n_jet_dist) == 1 else args.n_jet_dist,
+        max_jets=args.max_jets,
+        n_fatjet_dist=args.n_fatjet_dist[0] if len(args.n_fatjet_dist) == 1 else args.n_fatjet_dist,
+        boosted_frac=args.boosted_frac,
+        electron_frac=args.electron_frac,
+        is_mc=not args.data,
+    )
@@ -0,0 +1,160 @@
+# coding: utf-8
+"""
+Benchmark of the strategies for merging the per-round results of the
+combinatoric ttbar reconstruction (see `mtt.production.ttbar_reco`).
+
+The results of each jet multiplicity round are generated randomly with the
+same layout as the output of `ttbar_combinatorics`, and merged with
+
+  - ``"eager"``: `merge_sequential` after each round,
+  - ``"lazy"``: `merge_all` after all rounds,
+  - ``"inplace"``: `TTbarRecoBuffers.merge` after each round.
+
+Usage:
+
+    python -m mtt.benchmarks.merge_modes --n-events 100000 --n-rounds 9
+"""
+import argparse
+import itertools
+
+import awkward as ak
+import coffea.nanoevents.methods.nanoaod
+import numpy as np
+
+from mtt.production.ttbar_reco import TTbarRecoBuffers, merge_all, merge_sequential
+from mtt.profiling_tools import Profiler
+
+
+# jet multiplicity ranges of the default reconstruction settings
+# (see `ttbar_reco_settings` in `config_2017`)
+N_JET_LEP_RANGE = (1, 2)
+N_JET_HAD_RANGE = (1, 6)
+N_JET_TTBAR_RANGE = (2, 6)
+
+
+def resolved_rounds(
+    n_jet_lep_range=N_JET_LEP_RANGE,
+    n_jet_had_range=N_JET_HAD_RANGE,
+    n_jet_ttbar_range=N_JET_TTBAR_RANGE,
+):
+    """
+    Return the jet multiplicity rounds (`n_jet_lep`, `n_jet_had`) of the resolved regime
+    for the given ranges, in the order in which the `ttbar` producer considers them.
+    """
+    return [
+        n_jets
+        for n_jets in itertools.product(
+            range(n_jet_lep_range[0], n_jet_lep_range[1] + 1),
+            range(n_jet_had_range[0], n_jet_had_range[1] + 1),
+        )
+        if n_jet_ttbar_range[0] <= sum(n_jets) <= n_jet_ttbar_range[1]
+    ]
+
+
+def make_round_results(rng, n_events, n_jet_lep, n_jet_had, missing_frac=0.05):
+    """
+    Return random results for one round of `ttbar_combinatorics`, with a
+    fraction `missing_frac` of events without any hypotheses.
+    """
+    valid = rng.random(n_events) >= missing_frac
+
+    def masked(arr):
+        return ak.mask(arr, valid)
+
+    def random_lv():
+        return masked(ak.zip(
+            {c: rng.normal(0, 100, n_events) for c in ("x", "y", "z")} | {"t": rng.uniform(200, 1000, n_events)},
+            with_name="LorentzVector",
+            behavior=coffea.nanoevents.methods.nanoaod.behavior,
+        ))
+
+    def random_jet_idxs(n_jet):
+        counts = np.where(valid, n_jet, 0)
+        return ak.unflatten(rng.integers(0, 10, counts.sum()).astype(np.uint8), counts)
+
+    top_lep_chi2 = rng.exponential(50, n_events)
+    top_had_chi2 = rng.exponential(50, n_events)
+    return {
+        "top_had": random_lv(),
+        "top_lep": random_lv(),
+        "n_jet_had": masked(np.full(n_events, n_jet_had, dtype=np.uint8)),
+        "n_jet_lep": masked(np.full(n_events, n_jet_lep, dtype=np.uint8)),
+        "jet_idxs_had": random_jet_idxs(n_jet_had),
+        "jet_idxs_lep": random_jet_idxs(n_jet_lep),
+        "top_had_chi2": masked(top_had_chi2),
+        "top_lep_chi2": masked(top_lep_chi2),
+        "chi2": masked(top_had_chi2 + top_lep_chi2),
+    }
+
+
+def merge(mode, rounds, round_results, n_events):
+    """
+    Merge the `round_results` for all `rounds` with merge strategy `mode` and
+    return the merged results as a dictionary of awkward arrays.
+    """
+    if mode == "eager":
+        best_results = None
+        for n_jets in rounds:
+            best_results = merge_sequential(best_results, round_results[n_jets])
+        return best_results
+
+    if mode == "lazy":
+        return merge_all(round_results)
+
+    if mode == "inplace":
+        buffers = TTbarRecoBuffers(
+            n_events,
+            n_jet_lep_max=max(n_jets[0] for n_jets in rounds),
+            n_jet_had_max=max(n_jets[1] for n_jets in rounds),
+        )
+        for n_jets in rounds:
+            buffers.merge(round_results[n_jets])
+        return buffers.to_ak()
+
+    raise ValueError(f"unknown merge mode '{mode}'")
+
+
+def main(n_events, n_rounds, modes, seed=0):
+    rng = np.random.default_rng(seed)
+
+    # jet multiplicity rounds of the default reconstruction settings
+    rounds = resolved_rounds()[:n_rounds]
+    round_results = {
+        n_jets: make_round_results(rng, n_events, *n_jets)
+        for n_jets in rounds
+    }
+
+    merged = {}
+    for mode in modes:
+        with Profiler(
+            task_name=f"merge {len(rounds)} rounds for {n_events} events ({mode})",
+            msg_func=print,
+            prof_mem=True,
+            prof_time=True,
+        ):
+            merged[mode] = merge(mode, rounds, round_results, n_events)
+
+    # check that all strategies agree
+    ref_mode, *other_modes = modes
+    for mode in other_modes:
+        for key, arr in merged[ref_mode].items():
+            if not ak.all(ak.is_none(arr, axis=0) == ak.is_none(merged[mode][key], axis=0)):
+                raise RuntimeError(f"merge modes '{ref_mode}' and '{mode}' disagree on missing '{key}'")
+            if ak.to_list(ak.drop_none(arr)) != ak.to_list(ak.drop_none(merged[mode][key])):
+                raise RuntimeError(f"merge modes '{ref_mode}' and '{mode}' disagree on '{key}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--n-events", type=int, default=100000)
+    parser.add_argument(
+        "--n-rounds",
+        type=int,
+        default=None,
+        help="number of rounds to merge (default: all rounds of the default settings)",
+    )
+    parser.add_argument("--modes", nargs="+", default=["eager", "lazy", "inplace"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.n_events, args.n_rounds, args.modes, seed=args.seed)
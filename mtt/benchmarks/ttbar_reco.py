@@ -0,0 +1,526 @@
+# coding: utf-8
+"""
+Benchmark suite for the combinatoric ttbar reconstruction (see `mtt.production.ttbar_reco`)
+across reconstruction settings presets, merge modes, sub-chunk memory budgets and jet
+multiplicity distributions.
+
+The body of the `ttbar` producer (including the `choose_lepton` and `neutrino_candidates`
+dependencies) is run outside of any law task, on synthetic events (see
+`mtt.benchmarks.events`) or on cached event arrays stored as parquet files. Each point of the
+grid is run in a separate process, and the throughput in events and hypotheses per second
+and the peak memory (RSS) are written to a JSON results file. Two results files can be
+compared to flag regressions.
+
+Usage:
+
+    python -m mtt.benchmarks.ttbar_reco run --presets minimal default --merge-modes eager kernel \\
+        --output results.json
+    python -m mtt.benchmarks.ttbar_reco compare baseline.json results.json
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import awkward as ak
+import numpy as np
+
+from columnflow.util import DotDict
+from law.util import human_bytes, human_duration
+
+from mtt.benchmarks.events import generate_events
+from mtt.production.lepton import choose_lepton
+from mtt.production.neutrino import neutrino_candidates
+from mtt.production.ttbar_reco import ttbar
+from mtt.profiling_tools import Profiler
+
+
+# settings presets for the reconstruction (see `ttbar_reco_settings` in `config_2017`)
+PRESETS = {
+    "minimal": {
+        "n_jet_max": 9,
+        "n_jet_lep_range": (1, 1),
+        "n_jet_had_range": (3, 3),
+        "n_jet_ttbar_range": (4, 4),
+    },
+    "default": {
+        "n_jet_max": 9,
+        "n_jet_lep_range": (1, 2),
+        "n_jet_had_range": (1, 6),
+        "n_jet_ttbar_range": (2, 6),
+    },
+    "maxed_out": {
+        "n_jet_max": 10,
+        "n_jet_lep_range": (1, 8),
+        "n_jet_had_range": (1, 9),
+        "n_jet_ttbar_range": (2, 10),
+    },
+}
+
+# merge modes that are feasible for each preset (all if not listed)
+PRESET_MERGE_MODES = {
+    "maxed_out": ("kernel",),
+}
+
+# chi2 parameters of the reconstruction (see `chi2_parameters` in `config_2017`)
+CHI2_PARAMETERS = {
+    "resolved": {"m_had": 175.4, "s_had": 20.7, "m_lep": 175.0, "s_lep": 23.3},
+    "boosted": {"m_had": 182.3, "s_had": 16.1, "m_lep": 172.2, "s_lep": 21.7},
+}
+
+# jet multiplicity distributions of the synthetic events (see `generate_events`)
+JET_DISTS = {
+    "low": 4.0,
+    "nominal": 5.5,
+    "high": 7.5,
+}
+
+# metrics compared between results files, and whether larger values are better
+COMPARED_METRICS = {
+    "events_per_s": True,
+    "hypotheses_per_s": True,
+    "rss_increase": False,
+}
+
+
+class _Config(object):
+    # stand-in for the config instance, providing auxiliary data
+    def __init__(self, aux, name="benchmark"):
+        self.name = name
+        self.x = DotDict.wrap(aux)
+
+    def get_aux(self, key, default=None):
+        return self.x.get(key, default)
+
+
+class _Dataset(object):
+    # stand-in for a data dataset instance
+    name = "benchmark"
+    is_mc = False
+    is_data = True
+
+    def has_tag(self, tag):
+        return False
+
+
+class _Task(object):
+    # stand-in for the task running the producer, collecting the published messages
+    branch = 0
+
+    def __init__(self):
+        self.messages = []
+
+    def publish_message(self, msg):
+        self.messages.append(msg)
+
+
+class StandaloneProducer(object):
+    """
+    Stand-in for an instance of the producer class `producer_cls`, for calling the producer
+    function (see `__call__`) outside of a law task. The dependencies called via
+    ``self[...]`` are wrapped in the same way, sharing the config, dataset and task, except
+    for `category_ids`, which is skipped. Other attributes are looked up on the producer class.
+    """
+
+    # skipped dependencies, returning the events unchanged
+    skipped_dependencies = ("category_ids",)
+
+    def __init__(self, producer_cls, config_inst, dataset_inst=None, task=None):
+        self.producer_cls = producer_cls
+        self.cls_name = producer_cls.__name__
+        self.config_inst = config_inst
+        self.dataset_inst = dataset_inst or _Dataset()
+        self.task = task or _Task()
+        self._dependencies = {}
+        self._columns = None
+
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(self.producer_cls, attr)
+
+    def __call__(self, events, **kwargs):
+        return self.producer_cls.call_func(self, events, **kwargs)
+
+    def __getitem__(self, producer_cls):
+        if producer_cls.__name__ in self.skipped_dependencies:
+            return lambda events, **kwargs: events
+
+        if producer_cls not in self._dependencies:
+            # distinct class per dependency, as producers are identified by their type
+            # (e.g. for memoization, see `mtt.memo`)
+            dep_cls = type(f"Standalone_{producer_cls.__name__}", (StandaloneProducer,), {})
+            self._dependencies[producer_cls] = dep_cls(
+                producer_cls,
+                self.config_inst,
+                dataset_inst=self.dataset_inst,
+                task=self.task,
+            )
+        return self._dependencies[producer_cls]
+
+    def _init_columns(self):
+        if self._columns is None:
+            inst = self.producer_cls(inst_dict={})
+            self._columns = (inst.used_columns, inst.produced_columns)
+        return self._columns
+
+    @property
+    def used_columns(self):
+        return self._init_columns()[0]
+
+    @property
+    def produced_columns(self):
+        return self._init_columns()[1]
+
+
+def run_ttbar(events, preset, merge_mode, max_chunk_bytes, **kwargs):
+    """
+    Run the `ttbar` producer with the settings `preset` (see `PRESETS`), `merge_mode` and
+    `max_chunk_bytes` on `events`, and return the resulting events and the producer stand-in
+    (see `StandaloneProducer`). Additional `kwargs` are passed to the producer.
+    """
+    settings = dict(PRESETS[preset], max_chunk_bytes=max_chunk_bytes)
+    config_inst = _Config({
+        "ttbar_reco_settings": settings,
+        "chi2_parameters": copy.deepcopy(CHI2_PARAMETERS),
+    })
+    inst = StandaloneProducer(ttbar, config_inst)
+    kwargs.setdefault("verbose_level", 0)
+    return inst(events, merge_mode=merge_mode, **kwargs), inst
+
+
+def _run_point(events, preset, merge_mode, max_chunk_bytes, repeat, rss_sample_interval):
+    # run one benchmark point and return the measurements
+    durations = []
+    rss_start = None
+    rss_peak = 0
+    hypotheses = None
+    for i in range(repeat):
+        with tempfile.TemporaryDirectory() as report_dir:
+            with Profiler(
+                task_name=f"{preset}/{merge_mode}",
+                msg_func=None,
+                prof_mem=False,
+                prof_rss=True,
+                rss_sample_interval=rss_sample_interval,
+                prof_time=True,
+                gc_on_exit=False,
+            ) as prof:
+                run_ttbar(
+                    events,
+                    preset,
+                    merge_mode,
+                    max_chunk_bytes,
+                    profile_time=False,
+                    profile_report_dir=report_dir,
+                )
+            durations.append(prof.duration)
+            if rss_start is None:
+                rss_start = prof.rss_start
+            rss_peak = max(rss_peak, prof.rss_peak or 0)
+
+            # number of evaluated hypotheses from the reconstruction metrics
+            if hypotheses is None:
+                for root, _, fnames in os.walk(report_dir):
+                    for fname in fnames:
+                        if fname.endswith(".metrics.json"):
+                            with open(os.path.join(root, fname), "r") as f:
+                                counters = json.load(f)["counters"]
+                            hypotheses = sum(
+                                counters.get(f"{regime} hypotheses", 0)
+                                for regime in ("resolved", "boosted")
+                            )
+
+    duration = min(durations)
+    return {
+        "durations": durations,
+        "duration": duration,
+        "events_per_s": len(events) / duration if duration > 0 else None,
+        "hypotheses": hypotheses,
+        "hypotheses_per_s": hypotheses / duration if hypotheses is not None and duration > 0 else None,
+        "rss_start": rss_start,
+        "rss_peak": rss_peak,
+        "rss_increase": rss_peak - rss_start if rss_start is not None else None,
+    }
+
+
+def _run_isolated(func, *args):
+    """
+    Run `func` with `args` in a forked process and return its result, or a dictionary with
+    the error message if it failed. The arguments are inherited by the forked process.
+    """
+    ctx = multiprocessing.get_context("fork")
+    recv_conn, send_conn = ctx.Pipe(duplex=False)
+
+    def target():
+        try:
+            result = func(*args)
+        except BaseException as e:
+            result = {"error": f"{e.__class__.__name__}: {e}"}
+        send_conn.send(result)
+        send_conn.close()
+
+    proc = ctx.Process(target=target)
+    proc.start()
+    send_conn.close()
+    try:
+        result = recv_conn.recv()
+    except EOFError:
+        result = None
+    proc.join()
+    if result is None:
+        result = {"error": f"process exited with code {proc.exitcode}"}
+    return result
+
+
+def _git_revision():
+    # current git revision of the repository, if available
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    presets=("minimal", "default"),
+    merge_modes=("eager", "kernel"),
+    max_chunk_bytes=(1024 ** 3,),
+    jet_dists=("nominal",),
+    event_files=None,
+    n_events=10000,
+    seed=0,
+    boosted_frac=0.3,
+    repeat=1,
+    rss_sample_interval=0.01,
+    isolate=True,
+    msg_func=print,
+):
+    """
+    Run the ttbar reconstruction for all combinations of `presets`, `merge_modes`,
+    `max_chunk_bytes` and event samples, and return the results as a dictionary.
+
+    The event samples are either synthetic events (`n_events` events generated with `seed`
+    and `boosted_frac`) for each of the jet multiplicity distributions `jet_dists` (names in
+    `JET_DISTS`), or cached event arrays read from the parquet files `event_files`. Merge
+    modes not feasible for a preset (see `PRESET_MERGE_MODES`) are skipped.
+
+    Each point is run `repeat` times, in a forked process if `isolate` is set, so that the
+    peak memory of the points does not depend on each other. The shortest duration is used
+    for computing the throughput. The RSS is sampled every `rss_sample_interval` seconds.
+    """
+    # event samples
+    samples = {}
+    if event_files:
+        for path in event_files:
+            samples[os.path.splitext(os.path.basename(path))[0]] = ak.from_parquet(path)
+    else:
+        for name in jet_dists:
+            samples[name] = generate_events(
+                n_events,
+                seed=seed,
+                n_jet_dist=JET_DISTS[name],
+                boosted_frac=boosted_frac,
+            )
+
+    results = []
+    for sample_name, events in samples.items():
+        for preset in presets:
+            for merge_mode in merge_modes:
+                if merge_mode not in PRESET_MERGE_MODES.get(preset, (merge_mode,)):
+                    msg_func(f"skipping merge mode '{merge_mode}' for preset '{preset}'")
+                    continue
+
+                # warm up (e.g. load compiled kernels) before forking
+                run_ttbar(events[:100], preset, merge_mode, max(max_chunk_bytes))
+
+                for chunk_bytes in max_chunk_bytes:
+                    key = f"{preset}/{merge_mode}/{chunk_bytes}/{sample_name}"
+                    args = (events, preset, merge_mode, chunk_bytes, repeat, rss_sample_interval)
+                    result = _run_isolated(_run_point, *args) if isolate else _run_point(*args)
+                    result = {
+                        "key": key,
+                        "preset": preset,
+                        "merge_mode": merge_mode,
+                        "max_chunk_bytes": chunk_bytes,
+                        "sample": sample_name,
+                        "n_events": len(events),
+                        **result,
+                    }
+                    results.append(result)
+                    msg_func(format_result(result))
+
+    return {
+        "version": 1,
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "awkward": ak.__version__,
+            "revision": _git_revision(),
+            "n_events": n_events if not event_files else None,
+            "seed": seed,
+            "boosted_frac": boosted_frac,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def format_result(result):
+    """
+    Return a one-line summary of the benchmark `result`.
+    """
+    if "error" in result:
+        return f"{result['key']}: failed ({result['error']})"
+
+    parts = [
+        human_duration(seconds=result["duration"]),
+        f"{result['events_per_s']:.1f} events/s",
+    ]
+    if result["hypotheses_per_s"] is not None:
+        parts.append(f"{result['hypotheses_per_s']:.3g} hypotheses/s")
+    if result["rss_increase"] is not None:
+        parts.append(f"rss +{human_bytes(result['rss_increase'], fmt=True)}")
+    return f"{result['key']}: {', '.join(parts)}"
+
+
+def compare_results(baseline, results, threshold=0.1, memory_threshold=0.2):
+    """
+    Compare the benchmark `results` to the `baseline` (both dictionaries as returned by
+    `run_benchmarks`, or paths to results files), and return a list of comparisons for all
+    points and metrics in `COMPARED_METRICS` present in both. Each comparison is a dictionary
+    with the point key, the metric, both values, the relative change and whether it is a
+    regression, i.e. a throughput decreased by more than the fraction `threshold`, or the
+    peak memory increased by more than the fraction `memory_threshold`.
+    """
+    baseline, results = (
+        _load_results(res) for res in (baseline, results)
+    )
+    baseline_points = {res["key"]: res for res in baseline["results"]}
+
+    comparisons = []
+    for res in results["results"]:
+        base = baseline_points.get(res["key"])
+        if base is None or "error" in base or "error" in res:
+            continue
+        for metric, larger_is_better in COMPARED_METRICS.items():
+            old, new = base.get(metric), res.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if larger_is_better:
+                regression = change < -threshold
+            else:
+                regression = change > memory_threshold
+            comparisons.append({
+                "key": res["key"],
+                "metric": metric,
+                "baseline": old,
+                "value": new,
+                "change": change,
+                "regression": regression,
+            })
+
+    return comparisons
+
+
+def _load_results(results):
+    if isinstance(results, str):
+        with open(results, "r") as f:
+            results = json.load(f)
+    return results
+
+
+def main_run(args):
+    results = run_benchmarks(
+        presets=args.presets,
+        merge_modes=args.merge_modes,
+        max_chunk_bytes=[int(mib * 1024 ** 2) for mib in args.chunk_mib],
+        jet_dists=args.jet_dists,
+        event_files=args.events,
+        n_events=args.n_events,
+        seed=args.seed,
+        boosted_frac=args.boosted_frac,
+        repeat=args.repeat,
+        isolate=not args.no_isolate,
+    )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"written results to {args.output}")
+
+
+def main_compare(args):
+    comparisons = compare_results(
+        args.baseline,
+        args.results,
+        threshold=args.threshold,
+        memory_threshold=args.memory_threshold,
+    )
+    n_regressions = 0
+    for comp in comparisons:
+        flag = "REGRESSION" if comp["regression"] else ""
+        n_regressions += comp["regression"]
+        print(
+            f"{comp['key']:<50} {comp['metric']:<18} {comp['baseline']:>12.4g} "
+            f"{comp['value']:>12.4g} {100 * comp['change']:>+8.1f}% {flag}",
+        )
+    print(f"{len(comparisons)} comparisons, {n_regressions} regressions")
+    return 1 if n_regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and write a results file")
+    run_parser.add_argument("--presets", nargs="+", default=["minimal", "default"], choices=list(PRESETS))
+    run_parser.add_argument("--merge-modes", nargs="+", default=["eager", "kernel"])
+    run_parser.add_argument(
+        "--chunk-mib",
+        type=float,
+        nargs="+",
+        default=[1024],
+        help="memory budgets for sub-chunks in MiB",
+    )
+    run_parser.add_argument("--jet-dists", nargs="+", default=["nominal"], choices=list(JET_DISTS))
+    run_parser.add_argument("--events", nargs="+", help="parquet files with cached events to use instead")
+    run_parser.add_argument("--n-events", type=int, default=10000)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--boosted-frac", type=float, default=0.3)
+    run_parser.add_argument("--repeat", type=int, default=1)
+    run_parser.add_argument("--no-isolate", action="store_true", help="run all points in this process")
+    run_parser.add_argument("--output", default="ttbar_reco_benchmark.json")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative throughput decrease flagged as regression",
+    )
+    compare_parser.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=0.2,
+        help="relative peak memory increase flagged as regression",
+    )
+
+    args = parser.parse_args()
+    if args.command == "run":
+        main_run(args)
+    else:
+        sys.exit(main_compare(args))
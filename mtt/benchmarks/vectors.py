@@ -0,0 +1,126 @@
+# coding: utf-8
+"""
+Micro-benchmark of the behavior-free four-vector functions in
+`mtt.production.util` against the equivalent operations using the
+coffea nanoaod behaviors.
+
+Usage:
+
+    python -m mtt.benchmarks.vectors --n-events 200000
+"""
+import argparse
+
+from functools import partial
+
+import awkward as ak
+import coffea.nanoevents.methods.nanoaod
+import numpy as np
+
+from mtt.production.util import (
+    lv_xyzt, lv_mass, lv_sum,
+    p4_from_ptetaphim, p4_to_ptetaphim, p4_add, p4_sum_mass, delta_r, p4_cos_theta_star,
+)
+from mtt.profiling_tools import Profiler
+
+
+def make_objects(rng, n_events, mean_count=4.0):
+    """
+    Return a jagged array of random objects with fields `pt`, `eta`, `phi` and `mass`.
+    """
+    counts = rng.poisson(mean_count, n_events)
+    n = counts.sum()
+    return ak.unflatten(ak.zip({
+        "pt": rng.exponential(50, n) + 20,
+        "eta": rng.uniform(-2.5, 2.5, n),
+        "phi": rng.uniform(-np.pi, np.pi, n),
+        "mass": rng.exponential(10, n),
+    }, with_name="PtEtaPhiMLorentzVector", behavior=coffea.nanoevents.methods.nanoaod.behavior), counts)
+
+
+def benchmarks(objs):
+    """
+    Return a dictionary mapping benchmark names to dictionaries of functions computing
+    the same quantity
+      - with the coffea behaviors (``"coffea"``),
+      - with the behavior-free functions on the jagged leaf arrays (``"plain"``),
+      - with the behavior-free functions on the flat numpy leaf arrays (``"flat"``).
+    """
+    pairs = ak.combinations(objs, 2)
+    first, second = ak.unzip(pairs)
+
+    # leaf arrays (pt, eta, phi, mass) for the plain and flat variants
+    fields = ("pt", "eta", "phi", "mass")
+    leaves = {
+        "plain": [tuple(obj[f] for f in fields) for obj in (first, second)],
+        "flat": [tuple(ak.to_numpy(ak.flatten(obj[f])) for f in fields) for obj in (first, second)],
+    }
+
+    def coffea_sum_mass():
+        return lv_sum([lv_xyzt(first), lv_xyzt(second)]).mass
+
+    def sum_mass(first, second):
+        return p4_sum_mass([p4_from_ptetaphim(*first), p4_from_ptetaphim(*second)])[1]
+
+    def coffea_delta_r():
+        return first.delta_r(second)
+
+    def delta_r_(first, second):
+        return delta_r(first[1], first[2], second[1], second[2])
+
+    def coffea_cos_theta_star():
+        system = lv_mass(first + second)
+        first_rest = first.boost(-system.boostvec)
+        return system.pvec.dot(first_rest.pvec) / (system.pvec.p * first_rest.pvec.p)
+
+    def cos_theta_star(first, second):
+        first_p4 = p4_from_ptetaphim(*first)
+        system = p4_to_ptetaphim(p4_add(first_p4, p4_from_ptetaphim(*second)))
+        return p4_cos_theta_star(first_p4, p4_from_ptetaphim(*system))
+
+    return {
+        name: {
+            "coffea": coffea_func,
+            **{
+                label: partial(func, *leaves[label])
+                for label in ("plain", "flat")
+            },
+        }
+        for name, coffea_func, func in (
+            ("sum and mass", coffea_sum_mass, sum_mass),
+            ("delta-R", coffea_delta_r, delta_r_),
+            ("cos(theta*)", coffea_cos_theta_star, cos_theta_star),
+        )
+    }
+
+
+def main(n_events, seed=0):
+    rng = np.random.default_rng(seed)
+    objs = make_objects(rng, n_events)
+
+    for name, funcs in benchmarks(objs).items():
+        results = {}
+        for label, func in funcs.items():
+            with Profiler(
+                task_name=f"{name} for {n_events} events ({label})",
+                msg_func=print,
+                prof_mem=True,
+                prof_time=True,
+            ):
+                results[label] = func()
+
+        # check that all implementations agree exactly
+        coffea_values = ak.to_numpy(ak.flatten(results.pop("coffea")))
+        for label, values in results.items():
+            if isinstance(values, ak.Array):
+                values = ak.to_numpy(ak.flatten(values))
+            if not np.array_equal(coffea_values, values, equal_nan=True):
+                raise RuntimeError(f"results for '{name}' differ between coffea and {label} implementations")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--n-events", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.n_events, seed=args.seed)
@@ -10,7 +10,10 @@ from columnflow.util import maybe_import
 from columnflow.production.util import attach_coffea_behavior
 from columnflow.columnar_util import set_ak_column
 
-from mtt.production.util import lv_xyzt, lv_mass
+from mtt.production.util import (
+    p4_from_ptetaphim, p4_to_ptetaphim, p4_subtract, p4_where,
+    p4_pt, p4_p, p4_eta, p4_phi, delta_r,
+)
 
 
 ak = maybe_import("awkward")
@@ -71,68 +74,67 @@ def jet_lepton_cleaner(self: Calibrator, events: ak.Array, **kwargs) -> ak.Array
     Calibrator to clean jet four-vectors from contributions from nearby leptons
     """
 
-    # load coffea behaviors for simplified arithmetic with vectors
-    events["Electron"] = ak.with_name(events.Electron, "PtEtaPhiMLorentzVector")
-    events["Muon"] = ak.with_name(events.Muon, "PtEtaPhiMLorentzVector")
-    events["Jet"] = ak.with_name(events.Jet, "PtEtaPhiMLorentzVector")
-
     # revert JEC for jet pt and jet mass,
     # set correction factor to 0
     events = set_ak_column(events, "Jet.pt", events.Jet.pt * (1 - events.Jet.rawFactor))
     events = set_ak_column(events, "Jet.mass", events.Jet.mass * (1 - events.Jet.rawFactor))
     events = set_ak_column(events, "Jet.rawFactor", 0)
 
-    # build jet lorentz vectors
-    jet_lv = lv_xyzt(events.Jet)
+    # the cleaning is done on the flat per-jet arrays
+    n_jets = ak.num(events.Jet, axis=1)
+
+    def flat(arr):
+        return ak.to_numpy(ak.flatten(arr, axis=1))
 
-    # create arrays with indices of leptons that are matched to jet,
-    # non if no matched lepton
-    idx_e1 = ak.mask(events.Jet.electronIdx1, events.Jet.electronIdx1 >= 0)
-    idx_e2 = ak.mask(events.Jet.electronIdx2, events.Jet.electronIdx2 >= 0)
-    idx_m1 = ak.mask(events.Jet.muonIdx1, events.Jet.muonIdx1 >= 0)
-    idx_m2 = ak.mask(events.Jet.muonIdx2, events.Jet.muonIdx2 >= 0)
+    # build jet four-vectors (x, y, z, t)
+    jet_p4 = p4_from_ptetaphim(*(flat(events.Jet[var]) for var in ("pt", "eta", "phi", "mass")))
+
+    # four-vectors of leptons matched to jets, and mask
+    # indicating whether there is a matched lepton
+    def matched_lepton_p4(leptons, idx):
+        has_lepton = flat(idx >= 0)
+        matched = ak.flatten(leptons[ak.mask(idx, idx >= 0)], axis=1)
+        p4 = p4_from_ptetaphim(*(
+            ak.to_numpy(ak.fill_none(matched[var], 0))
+            for var in ("pt", "eta", "phi", "mass")
+        ))
+        return p4, has_lepton
 
     # list with matched leptons
     jet_leptons_types = [
-        (events.Electron[idx_e1], "e"),
-        (events.Electron[idx_e2], "e"),
-        (events.Muon[idx_m1], "mu"),
-        (events.Muon[idx_m2], "mu"),
+        (matched_lepton_p4(events.Electron, events.Jet.electronIdx1), "e"),
+        (matched_lepton_p4(events.Electron, events.Jet.electronIdx2), "e"),
+        (matched_lepton_p4(events.Muon, events.Jet.muonIdx1), "mu"),
+        (matched_lepton_p4(events.Muon, events.Jet.muonIdx2), "mu"),
     ]
 
     # total energy from clustered leptonic PF candidates
     jet_pf_energies = {
-        "mu": jet_lv.energy * events.Jet.muEF,
-        "e": jet_lv.energy * events.Jet.chEmEF,
+        "mu": jet_p4[3] * flat(events.Jet.muEF),
+        "e": jet_p4[3] * flat(events.Jet.chEmEF),
     }
 
     # subtract lepton contributions from jets
     tolerance = 0.1
-    for jet_lepton, jet_lepton_type in jet_leptons_types:
-        jet_lepton_lv = lv_xyzt(jet_lepton)
-        jet_lv_cleaned = lv_xyzt(jet_lv - jet_lepton_lv)
+    for (jet_lepton_p4, has_lepton), jet_lepton_type in jet_leptons_types:
+        jet_p4_cleaned = p4_subtract(jet_p4, jet_lepton_p4)
 
         jet_pf_energy = jet_pf_energies[jet_lepton_type]
-        jet_pf_energy_cleaned = jet_pf_energy - jet_lepton_lv.energy
+        jet_pf_energy_cleaned = jet_pf_energy - jet_lepton_p4[3]
 
         # only perform the cleaning of the current lepton
         # if the following conditions are met
 
         # lepton energy compatible with PF energy fraction (within tolerance)
-        lep_energy_pf_compatible = (jet_lepton_lv.energy < (1 + tolerance) * jet_pf_energy)
+        lep_energy_pf_compatible = (jet_lepton_p4[3] < (1 + tolerance) * jet_pf_energy)
 
         # calculate square of cleaned jet mass
-        jet_lv_cleaned_mass_sq = jet_lv_cleaned.energy**2 - jet_lv_cleaned.rho**2
-        # mask values that would lead to imaginary masses,
-        # but substitute absolute value if the mass square is only negative within
-        # tolerance (high probablility that this was a lepton fake)
-        jet_lv_cleaned_mass = ak.mask(
-            np.sqrt(abs(jet_lv_cleaned_mass_sq)),
-            jet_lv_cleaned_mass_sq >= -tolerance,
-        )
+        jet_p4_cleaned_mass_sq = jet_p4_cleaned[3]**2 - p4_p(jet_p4_cleaned)**2
 
         # cleaning does not result in a negative/imaginary/undefined mass
-        mass_stays_positive = ~ak.is_none(jet_lv_cleaned_mass, axis=1)
+        # (accept mass squares that are only negative within tolerance, since
+        # there is a high probablility that this was a lepton fake)
+        mass_stays_positive = (jet_p4_cleaned_mass_sq >= -tolerance)
 
         # angle before/after cleaning is similar (delta_r < max_angle_diff)
         #
@@ -152,8 +154,8 @@ def jet_lepton_cleaner(self: Calibrator, events: ak.Array, **kwargs) -> ak.Array
         # clean only if angle difference below fixed threshold OR the cleaned pt is very low
         # (high probablility that this was a lepton fake)
         angle_change_small = (
-            (jet_lv.delta_r(jet_lv_cleaned) <= np.pi / 2) |
-            (jet_lv_cleaned.pt < 10)
+            (delta_r(p4_eta(jet_p4), p4_phi(jet_p4), p4_eta(jet_p4_cleaned), p4_phi(jet_p4_cleaned)) <= np.pi / 2) |
+            (p4_pt(jet_p4_cleaned) < 10)
         )
 
         #
@@ -172,30 +174,27 @@ def jet_lepton_cleaner(self: Calibrator, events: ak.Array, **kwargs) -> ak.Array
         # # clean only if angle difference passes the check
         # angle_change_small = jet_lv.delta_phi(jet_lv_cleaned) <= max_angle_diff
 
-        # AND of cleaning conditions
-        do_clean = mass_stays_positive & angle_change_small & lep_energy_pf_compatible
-        # `None` if no matched lepton -> no cleaning
-        do_clean = ak.fill_none(do_clean, False)
+        # AND of cleaning conditions (no cleaning if no matched lepton)
+        do_clean = has_lepton & mass_stays_positive & angle_change_small & lep_energy_pf_compatible
 
-        # update jet LV
-        jet_lv = ak.where(
+        # update jet four-vectors
+        jet_p4 = p4_where(
             do_clean,
-            jet_lv_cleaned,
-            jet_lv,
+            jet_p4_cleaned,
+            jet_p4,
         )
 
         # update jet PF energies
-        jet_pf_energies[jet_lepton_type] = ak.where(
+        jet_pf_energies[jet_lepton_type] = np.where(
             do_clean,
             jet_pf_energy_cleaned,
             jet_pf_energy,
         )
 
     # save updated jet variables
-    jet_lv = lv_mass(jet_lv)
-    for var in ["pt", "eta", "phi", "mass"]:
+    for var, value in zip(["pt", "eta", "phi", "mass"], p4_to_ptetaphim(jet_p4)):
         # ensure no missing values
-        value = ak.fill_none(ak.nan_to_none(getattr(jet_lv, var)), 0.0)
-        events = set_ak_column(events, f"Jet.{var}", value)
+        value = np.where(np.isnan(value), 0.0, value)
+        events = set_ak_column(events, f"Jet.{var}", ak.unflatten(value, n_jets))
 
     return events
@@ -0,0 +1,255 @@
+# coding: utf-8
+"""
+Cache for the columns of producers that are invariant under certain shifts (e.g. gen-level
+producers under jet energy shifts), stored as local parquet files. Tasks processing the same
+events with a different (invariant) shift load the cached columns instead of recomputing them.
+
+The cache is opt-in and only used if the environment variable ``MTT_COLUMN_CACHE_DIR`` is set.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+
+import law
+
+from columnflow.util import maybe_import
+from columnflow.columnar_util import Route, set_ak_column
+
+ak = maybe_import("awkward")
+np = maybe_import("numpy")
+
+logger = law.logger.get_logger(__name__)
+
+# bump to invalidate all existing cache files
+CACHE_VERSION = 1
+
+# columns identifying the events in a chunk
+EVENT_ID_COLUMNS = ("run", "luminosityBlock", "event")
+
+
+def column_cache_dir():
+    """
+    Return the directory for storing cached columns, given by the environment variable
+    ``MTT_COLUMN_CACHE_DIR``. If not set or empty, caching is disabled and *None* is returned.
+    """
+    cache_dir = os.getenv("MTT_COLUMN_CACHE_DIR")
+    if not cache_dir:
+        return None
+    return os.path.expandvars(os.path.expanduser(cache_dir))
+
+
+def chunk_fingerprint(events):
+    """
+    Return a digest identifying the chunk of *events* by its event identifiers
+    (see `EVENT_ID_COLUMNS`), or *None* if the events have no ``event`` column.
+    """
+    if "event" not in events.fields:
+        return None
+
+    digest = hashlib.sha1()
+    digest.update(str(len(events)).encode())
+    for column in EVENT_ID_COLUMNS:
+        if column in events.fields:
+            values = np.ascontiguousarray(ak.to_numpy(events[column]))
+            digest.update(column.encode())
+            digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+# digests of local files, keyed by path, modification time and size
+_file_digests = {}
+
+
+def _file_digest(path):
+    # digest of the contents of a local file, or *None* if it does not exist
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _file_digests:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _file_digests[key] = digest.hexdigest()
+    return _file_digests[key]
+
+
+def external_files_fingerprint(config_inst, keys):
+    """
+    Return a digest of the entries *keys* of the external files of *config_inst*, including
+    the contents of the files that are available locally.
+    """
+    external_files = config_inst.x("external_files", {})
+    digest = hashlib.sha1()
+    for key in sorted(keys):
+        entry = external_files.get(key)
+        digest.update(json.dumps([key, entry], sort_keys=True, default=str).encode())
+        for location in law.util.flatten(entry):
+            if isinstance(location, str) and os.path.isfile(location):
+                digest.update((_file_digest(location) or "").encode())
+    return digest.hexdigest()
+
+
+def _func_digest(func):
+    # digest of the source code of a function (or of its bytecode if the source is unavailable)
+    try:
+        code = inspect.getsource(func).encode()
+    except (OSError, TypeError):
+        code = func.__code__.co_code
+    return hashlib.sha1(code).hexdigest()
+
+
+def _current_shift(inst):
+    # shift of the task the producer is run in (if any)
+    task = getattr(inst, "task", None)
+    return getattr(task, "local_shift_inst", None) or getattr(task, "global_shift_inst", None)
+
+
+def validate_shift_invariance(inst, shift_inst):
+    """
+    Check that *shift_inst* does not affect any columns used by the producer *inst* via
+    column aliases, and raise a *ValueError* otherwise.
+    """
+    used_columns = [Route(route).column for route in inst.used_columns]
+    aliased_columns = [
+        column
+        for column in shift_inst.x("column_aliases", {})
+        if law.util.multi_match(Route(column).column, used_columns)
+    ]
+    if aliased_columns:
+        raise ValueError(
+            f"{inst.cls_name} is declared invariant under shift '{shift_inst.name}', but the shift "
+            f"changes the used columns {', '.join(sorted(aliased_columns))}",
+        )
+
+
+def shift_invariant_cached(shifts, version=1, external_files=None, aux=None):
+    """
+    Decorator for the function of a producer whose produced columns do not change under the
+    given *shifts* (names or patterns). When called in a task with one of these shifts, the
+    produced columns are loaded from a local cache file (see `column_cache_dir`) if available,
+    and computed and stored otherwise. The nominal shift is never cached, since its columns are
+    not shared with other tasks.
+
+    The cache files are keyed by the config, dataset, task branch (i.e. the input file) and
+    version, the chunk of events (see `chunk_fingerprint`), the used and produced columns of
+    the producer, the source code of the decorated function and the producer *version*, which
+    should be increased when changing code outside of the function that affects the produced
+    columns. Producers depending on external inputs should list the keys of the external files
+    (see `external_files_fingerprint`) and of the auxiliary config entries they read in
+    *external_files* and *aux*, respectively, so that changes to these invalidate the cache.
+
+    Whether the shift actually leaves the used columns unchanged is validated using the column
+    aliases of the shift (see `validate_shift_invariance`).
+
+    .. code-block:: python
+
+        @producer(uses={"GenPart.*"}, produces={"GenTopDecay.*"})
+        @shift_invariant_cached(["jec_*", "jer_*"])
+        def gen_top_decay_products(self, events, **kwargs):
+            ...
+
+    """
+    shifts = law.util.make_list(shifts)
+    external_files = law.util.make_list(external_files or [])
+    aux = law.util.make_list(aux or [])
+
+    def decorator(func):
+        code_digest = _func_digest(func)
+
+        @functools.wraps(func)
+        def wrapper(self, events, *args, **kwargs):
+            path = _cache_path(
+                self,
+                events,
+                shifts,
+                version=version,
+                code_digest=code_digest,
+                external_files=external_files,
+                aux=aux,
+            )
+            if path is None:
+                return func(self, events, *args, **kwargs)
+
+            produced_fields = sorted({Route(route).fields[0] for route in self.produced_columns})
+
+            # load cached columns
+            if os.path.exists(path):
+                cached = ak.from_parquet(path)
+                if sorted(cached.fields) == produced_fields and len(cached) == len(events):
+                    for field in produced_fields:
+                        events = set_ak_column(events, field, cached[field])
+                    return events
+                logger.warning(f"ignoring incompatible column cache file {path}")
+
+            # compute and store columns
+            events = func(self, events, *args, **kwargs)
+            _write_atomic(
+                ak.zip({field: events[field] for field in produced_fields}, depth_limit=1),
+                path,
+            )
+
+            return events
+
+        return wrapper
+
+    return decorator
+
+
+def _cache_path(inst, events, shifts, version=1, code_digest=None, external_files=(), aux=()):
+    """
+    Return the path of the cache file for the call of producer *inst* on *events*, or *None*
+    if the columns should not be cached.
+    """
+    cache_dir = column_cache_dir()
+    shift_inst = _current_shift(inst)
+    dataset_inst = getattr(inst, "dataset_inst", None)
+    if not cache_dir or shift_inst is None or dataset_inst is None:
+        return None
+
+    # only cache for invariant shifts, never for nominal
+    if shift_inst.name == "nominal" or not law.util.multi_match(shift_inst.name, shifts):
+        return None
+    validate_shift_invariance(inst, shift_inst)
+
+    fingerprint = chunk_fingerprint(events)
+    if fingerprint is None:
+        return None
+
+    config_inst = inst.config_inst
+    key = json.dumps({
+        "version": CACHE_VERSION,
+        "config": config_inst.name,
+        "dataset": dataset_inst.name,
+        "branch": getattr(inst.task, "branch", None),
+        "task_version": getattr(inst.task, "version", None),
+        "chunk": fingerprint,
+        "uses": sorted(Route(route).column for route in inst.used_columns),
+        "produces": sorted(Route(route).column for route in inst.produced_columns),
+        "producer_version": version,
+        "code": code_digest,
+        "external_files": external_files_fingerprint(config_inst, external_files) if external_files else None,
+        "aux": {aux_key: config_inst.x(aux_key, None) for aux_key in aux},
+    }, sort_keys=True, default=str)
+    digest = hashlib.sha1(key.encode()).hexdigest()
+
+    return os.path.join(cache_dir, inst.config_inst.name, dataset_inst.name, inst.cls_name, f"{digest}.parquet")
+
+
+def _write_atomic(arr, path):
+    # write to a temporary file first so that concurrent tasks never read partial files
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".parquet.tmp")
+    os.close(fd)
+    try:
+        ak.to_parquet(arr, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -331,9 +331,6 @@ for dataset_name in dataset_names:
     if dataset.name.startswith("tt"):
         dataset.add_tag({"has_top", "has_ttbar", "is_sm_ttbar"})
 
-    if dataset.name == "tt_sl_powheg":
-        dataset.add_tag("has_memory_intensive_reco")
-
     # single top
     if dataset.name.startswith("st"):
         dataset.add_tag("has_top")
@@ -685,25 +682,29 @@ config_2017.set_aux("ttbar_reco_settings", DotDict.wrap({
     # "n_jet_lep_range": (1, 1),
     # "n_jet_had_range": (3, 3),
     # "n_jet_ttbar_range": (4, 4),
-    # "max_chunk_size": 100000,
+    # "max_chunk_bytes": 1024 ** 3,  # 1 GiB
 
     # -- default settings
     "n_jet_max": 9,
     "n_jet_lep_range": (1, 2),
     "n_jet_had_range": (1, 6),
     "n_jet_ttbar_range": (2, 6),
-    "max_chunk_size": (
-        lambda dataset_inst:
-            10000 if dataset_inst.has_tag("has_memory_intensive_reco")
-            else 30000
-    ),
+    # sub-chunks sized according to predicted memory use
+    "max_chunk_bytes": 1024 ** 3,  # 1 GiB
+
+    # -- process sub-chunks in parallel (optional)
+    # "executor": {
+    #     "n_workers": 8,
+    #     "start_method": "fork",
+    #     "max_in_flight": 8,
+    # },
 
-    # -- "maxed out" settings (very slow)
+    # -- "maxed out" settings (only feasible with `merge_mode="kernel"`)
     # "n_jet_max": 10,
     # "n_jet_lep_range": (1, 8),
     # "n_jet_had_range": (1, 9),
     # "n_jet_ttbar_range": (2, 10),
-    # "max_chunk_size": 10000,
+    # "max_chunk_bytes": 1024 ** 3,  # 1 GiB
 }))
 
 # L1 prefiring configuration
@@ -0,0 +1,229 @@
+# coding: utf-8
+"""
+Chunk-scoped memoization of producers and selectors that are called as a dependency
+of several other producers or selectors while processing the same chunk of events.
+"""
+import contextlib
+import functools
+
+import law
+
+from columnflow.util import maybe_import
+from columnflow.columnar_util import Route, set_ak_column
+
+ak = maybe_import("awkward")
+
+logger = law.logger.get_logger(__name__)
+
+
+class ChunkMemo(object):
+    """
+    Cache for the results of memoized producers and selectors (see `chunk_memoized`).
+
+    Entries are keyed by the producer or selector class. Each entry stores the identity
+    of the input columns the result was computed from, i.e. the structure and the memory
+    addresses of the buffers of all top-level fields of the events array that contain used
+    columns (except for the ones that are also produced, see `_input_identity`). The
+    buffers are kept alive by the entry, so their addresses are never reused while the
+    entry exists. If an input column is overwritten (e.g. via `set_ak_column`), its
+    buffers change and the entry is invalidated on the next call.
+
+    The memo only lives for one chunk (see `chunk_memo`) and keeps track of the number
+    of cache hits, misses and invalidations.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def lookup(self, key, identity):
+        """
+        Return the cached value for *key* if it was computed from inputs with the same
+        *identity*, and *None* otherwise.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            cached_identity, _, value = entry
+            if cached_identity == identity:
+                self.hits += 1
+                return value
+
+            # inputs have changed, drop outdated entry
+            del self._entries[key]
+            self.invalidations += 1
+
+        self.misses += 1
+        return None
+
+    def store(self, key, identity, buffers, value) -> None:
+        self._entries[key] = (identity, buffers, value)
+
+
+# memo of the chunk currently being processed
+_active_memo = None
+
+
+@contextlib.contextmanager
+def chunk_memo(msg_func=None):
+    """
+    Context manager activating a `ChunkMemo` for processing one chunk of events, to be
+    entered by the top-level producer or selector. Nested scopes share the memo of the
+    outermost one. On exit of the outermost scope, the memo is cleared, and a summary of
+    the hit and miss counts is passed to *msg_func* (defaults to debug logging).
+
+    Can also be used as a decorator for the function of the top-level producer or selector:
+
+    .. code-block:: python
+
+        @producer(uses={...}, produces={...})
+        @chunk_memo()
+        def default(self, events, **kwargs):
+            ...
+
+    """
+    global _active_memo
+
+    # reuse the memo of an outer scope
+    if _active_memo is not None:
+        yield _active_memo
+        return
+
+    _active_memo = memo = ChunkMemo()
+    try:
+        yield memo
+    finally:
+        _active_memo = None
+        memo.clear()
+        (msg_func or logger.debug)(
+            f"chunk memo: {memo.hits} hits, {memo.misses} misses, "
+            f"{memo.invalidations} invalidations",
+        )
+
+
+def _top_level_fields(routes):
+    return {Route(route).fields[0] for route in routes}
+
+
+def _memo_fields(inst):
+    """
+    Return the top-level fields of the events array containing columns used by the
+    producer or selector *inst* (excluding the ones it produces itself), and the
+    top-level fields containing the columns it produces.
+    """
+    fields = getattr(inst, "_chunk_memo_fields", None)
+    if fields is None:
+        produced_fields = _top_level_fields(inst.produced_columns)
+        input_fields = _top_level_fields(inst.used_columns) - produced_fields
+        fields = inst._chunk_memo_fields = (sorted(input_fields), sorted(produced_fields))
+    return fields
+
+
+def _layout_identity(layout, buffers):
+    """
+    Return a tuple describing the structure of the awkward *layout* and the memory
+    addresses of its buffers, and append the buffers to the list *buffers*. Unlike
+    the layout nodes themselves, which are rebuilt when fields are added to the events
+    array, the buffers are shared between all views of a column.
+    """
+    identity = [type(layout).__name__, layout.length]
+    for attr in ("offsets", "starts", "stops", "index", "mask", "tags"):
+        index = getattr(layout, attr, None)
+        if isinstance(index, ak.index.Index):
+            buffers.append(index.data)
+            identity.append((index.data.ctypes.data, index.data.nbytes))
+    if isinstance(layout, ak.contents.NumpyArray):
+        buffers.append(layout.data)
+        identity.append((layout.data.ctypes.data, layout.data.shape, layout.data.dtype.str))
+    if isinstance(layout, (ak.contents.RecordArray, ak.contents.UnionArray)):
+        identity.append(tuple(layout.fields or ()))
+        identity.extend(_layout_identity(content, buffers) for content in layout.contents)
+    elif hasattr(layout, "content"):
+        identity.append(_layout_identity(layout.content, buffers))
+    return tuple(identity)
+
+
+def _input_identity(events, fields):
+    """
+    Return the identity of the top-level *fields* of *events* (see `_layout_identity`)
+    and the list of their buffers, or *None* if the events array is not a record array.
+    """
+    layout = ak.to_layout(events)
+    if not isinstance(layout, ak.contents.RecordArray):
+        return None
+
+    buffers = []
+    identity = tuple(
+        _layout_identity(layout.content(field), buffers) if layout.has_field(field) else None
+        for field in fields
+    )
+    return identity, buffers
+
+
+def chunk_memoized(func):
+    """
+    Decorator for the function of a producer or selector, caching its results in the
+    `ChunkMemo` of the active `chunk_memo` scope. Subsequent calls with unchanged input
+    columns return the cached produced columns (and selection result, for selectors)
+    instead of calling the function again. Without an active scope, the function is
+    always called.
+
+    The produced columns are restored on top of the events array passed to the call,
+    so memoized functions should only add their produced columns to the events array
+    and return results that only depend on the used columns (not on keyword arguments).
+    Cached selection results are shared between the callers and should not be modified.
+
+    .. code-block:: python
+
+        @producer(uses={...}, produces={"Lepton.*"})
+        @chunk_memoized
+        def choose_lepton(self, events, **kwargs):
+            ...
+
+    """
+    @functools.wraps(func)
+    def wrapper(self, events, *args, **kwargs):
+        memo = _active_memo
+        inputs = None
+        if memo is not None:
+            input_fields, produced_fields = _memo_fields(self)
+            inputs = _input_identity(events, input_fields)
+
+        # no memoization possible
+        if inputs is None:
+            return func(self, events, *args, **kwargs)
+
+        key = type(self)
+        identity, buffers = inputs
+        cached = memo.lookup(key, identity)
+
+        if cached is None:
+            result = func(self, events, *args, **kwargs)
+            result_events, rest = (result[0], result[1:]) if isinstance(result, tuple) else (result, None)
+            columns = {field: result_events[field] for field in produced_fields}
+            memo.store(key, identity, buffers, (columns, rest))
+            return result
+
+        # restore produced columns
+        columns, rest = cached
+        for field, column in columns.items():
+            events = set_ak_column(events, field, column)
+
+        return events if rest is None else (events, *rest)
+
+    return wrapper
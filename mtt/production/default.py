@@ -8,6 +8,7 @@ from columnflow.production import Producer, producer
 from columnflow.production.categories import category_ids
 from columnflow.util import maybe_import
 
+from mtt.memo import chunk_memo
 from mtt.production.features import features
 from mtt.production.weights import weights
 from mtt.production.ttbar_reco import ttbar
@@ -23,6 +24,7 @@ ak = maybe_import("awkward")
         features, category_ids, weights, ttbar,
     },
 )
+@chunk_memo()
 def default(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
 
     # ttbar reconstruction
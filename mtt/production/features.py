@@ -9,7 +9,7 @@ from columnflow.util import maybe_import
 from columnflow.columnar_util import set_ak_column, EMPTY_FLOAT
 from columnflow.production.util import attach_coffea_behavior
 from mtt.production.ttbar_reco import choose_lepton
-from mtt.selection.util import masked_sorted_indices
+from mtt.production.util import delta_r_nearest
 
 ak = maybe_import("awkward")
 coffea = maybe_import("coffea")
@@ -78,8 +78,6 @@ def jet_lepton_features(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
     # load coffea behaviors for simplified arithmetic with vectors
     events = ak.Array(events, behavior=coffea.nanoevents.methods.nanoaod.behavior)
     events["Jet"] = ak.with_name(events.Jet, "PtEtaPhiMLorentzVector")
-    events["Electron"] = ak.with_name(events.Electron, "PtEtaPhiMLorentzVector")
-    events["Muon"] = ak.with_name(events.Muon, "PtEtaPhiMLorentzVector")
 
     # select jets with pT > 15
     jets_mask = (events.Jet.pt > 15)
@@ -92,13 +90,12 @@ def jet_lepton_features(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
     # attach lorentz vector behavior to lepton
     lepton = ak.with_name(lepton, "PtEtaPhiMLorentzVector")
 
-    # calculate deltaR between lepton and every jet
-    lepton_jet_deltar = ak.firsts(jets.metric_table(lepton), axis=-1)
-
-    # define closest lepton to jet
-    lepton_closest_jet = ak.firsts(
-        jets[masked_sorted_indices(jets_mask, lepton_jet_deltar, ascending=True)],
+    # define closest jet to lepton (note: `jets_mask` refers to all jets and
+    # is applied to the positions of the selected jets)
+    lepton_closest_jet_idx = delta_r_nearest(
+        lepton, jets, other_mask=jets_mask[ak.local_index(jets)],
     )
+    lepton_closest_jet = ak.firsts(jets[ak.singletons(lepton_closest_jet_idx)])
 
     # calculate pTrel and deltaR
     jet_lep_pt_rel = lepton.cross(lepton_closest_jet).pt / lepton_closest_jet.p
@@ -7,6 +7,8 @@ from columnflow.production import Producer, producer
 from columnflow.util import maybe_import
 from columnflow.columnar_util import set_ak_column
 
+from mtt.column_cache import shift_invariant_cached
+
 ak = maybe_import("awkward")
 np = maybe_import("numpy")
 coffea = maybe_import("coffea")
@@ -18,6 +20,7 @@ maybe_import("coffea.nanoevents.methods.nanoaod")
     produces={"GenTopDecay.*"},
     mc_only=True,
 )
+@shift_invariant_cached(["jec_*", "jer_*"])
 def gen_top_decay_products(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
     """
     Creates a new ragged column "GenTopDecay" with one element per hard top quark.
@@ -129,6 +132,7 @@ def gen_top_decay_products_skip(self: Producer) -> bool:
         "GenPartonTop.pdgId",
     },
 )
+@shift_invariant_cached(["jec_*", "jer_*"])
 def gen_parton_top(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
     """
     Produce parton-level top quarks (before showering and detector simulation).
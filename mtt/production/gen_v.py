@@ -10,6 +10,7 @@ from columnflow.production import Producer, producer
 from columnflow.util import maybe_import, InsertableDict, DotDict
 from columnflow.columnar_util import set_ak_column
 
+from mtt.column_cache import shift_invariant_cached
 
 np = maybe_import("numpy")
 ak = maybe_import("awkward")
@@ -26,6 +27,7 @@ ak = maybe_import("awkward")
     },
     mc_only=True,
 )
+@shift_invariant_cached(["jec_*", "jer_*"])
 def gen_v_boson(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
     """
     Produce gen-level Z or W bosons from `GenParticle` collection.
@@ -109,6 +111,7 @@ def gen_v_boson_skip(self: Producer) -> bool:
     # function to determine the correction file
     get_vjets_reweighting_config=(lambda self: self.config_inst.x.vjets_reweighting),
 )
+@shift_invariant_cached(["jec_*", "jer_*"], external_files=["vjets_reweighting"], aux=["vjets_reweighting"])
 def vjets_weight(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
     """
     Producer for V+jets K factor weights. Requires an external file in the config as under ``vjets_reweighting``:
@@ -16,6 +16,8 @@ from columnflow.production.util import attach_coffea_behavior
 from columnflow.util import maybe_import, InsertableDict, DotDict
 from columnflow.columnar_util import set_ak_column, flat_np_view, layout_ak_array
 
+from mtt.production.util import delta_r_any_within
+
 
 np = maybe_import("numpy")
 ak = maybe_import("awkward")
@@ -83,7 +85,7 @@ def l1_prefiring_weights(
 
     # identify jets that overlap with a photon
     pho_for_jet_cleaning = events.Photon[events.Photon.pt > 20]
-    jet_has_photon_overlap = ~ak.all(events.Jet.metric_table(pho_for_jet_cleaning) > 0.4, axis=-1)
+    jet_has_photon_overlap = delta_r_any_within(events.Jet, pho_for_jet_cleaning, 0.4)
     jet_photon = ak.mask(events.Jet, jet_has_photon_overlap, valid_when=True)
 
     def get_eff(obj_name, key, obj):
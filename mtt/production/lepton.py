@@ -7,6 +7,8 @@ from columnflow.production import Producer, producer
 from columnflow.util import maybe_import
 from columnflow.columnar_util import set_ak_column
 
+from mtt.memo import chunk_memoized
+
 ak = maybe_import("awkward")
 np = maybe_import("numpy")
 coffea = maybe_import("coffea")
@@ -23,6 +25,7 @@ maybe_import("coffea.nanoevents.methods.nanoaod")
         "Lepton.*",
     },
 )
+@chunk_memoized
 def choose_lepton(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
     """
     Choose either muon or electron as the main lepton per event
@@ -8,110 +8,170 @@ from columnflow.util import maybe_import
 from columnflow.columnar_util import set_ak_column
 
 from mtt.production.lepton import choose_lepton
+from mtt.production.util import p4_from_ptetaphim
 
 ak = maybe_import("awkward")
 np = maybe_import("numpy")
-coffea = maybe_import("coffea")
-maybe_import("coffea.nanoevents.methods.nanoaod")
+
+
+# levels for the sanity checks of the neutrino candidates
+VALIDATION_LEVELS = ("off", "sampled", "full")
+
+
+def solve_neutrino_pz(lep_p4, met_x, met_y, m_w=80.0):
+    """
+    Solve the W boson mass constraint for the longitudinal momentum of the neutrino,
+    assuming its transverse components `met_x` and `met_y` are equal to those of the
+    missing transverse momentum. The lepton four-vectors `lep_p4` are given by their
+    Cartesian components `(x, y, z, t)`. All inputs are flat numpy arrays.
+
+    Returns a regular array of shape `(n_events, 2)` with the `pz` solutions, and the
+    number of candidates per event: both real solutions if the discriminant is positive,
+    or only the real part of the complex solutions otherwise (unused slots are NaN).
+    Events with missing lepton components (NaN) have no candidates.
+    """
+    lep_x, lep_y, lep_z, lep_t = lep_p4
+
+    # helper mass
+    lnu_mu = 0.5 * m_w ** 2 + (met_x * lep_x + met_y * lep_y)
+
+    # real part of solution
+    lep_pt2 = lep_x * lep_x + lep_y * lep_y
+    lnu_pz_0 = lnu_mu * lep_z / lep_pt2
+
+    # calculate discriminant
+    met_pt2 = met_x * met_x + met_y * met_y
+    lnu_delta_e_sq = (lep_t * lep_t * met_pt2 - lnu_mu * lnu_mu) / lep_pt2
+    lnu_disc = lnu_pz_0 * lnu_pz_0 - lnu_delta_e_sq
+
+    # quadratic solutions, or real part of complex solutions
+    has_two = lnu_disc > 0
+    lnu_sqrt_disc = np.sqrt(np.where(has_two, lnu_disc, 0))
+    pz = np.empty((len(lnu_pz_0), 2), dtype=np.float64)
+    pz[:, 0] = lnu_pz_0 + lnu_sqrt_disc
+    pz[:, 1] = np.where(has_two, lnu_pz_0 - lnu_sqrt_disc, np.nan)
+
+    # number of candidates
+    has_lepton = ~np.isnan(lep_t)
+    n_cands = np.where(has_lepton, np.where(has_two, 2, 1), 0).astype(np.int8)
+    pz[~has_lepton, 0] = np.nan
+
+    return pz, n_cands
+
+
+def validate_neutrino_pz(
+    lep_p4,
+    met_x,
+    met_y,
+    pz,
+    n_cands,
+    m_w=80.0,
+    level="full",
+    n_sample=1000,
+    seed=0,
+    rtol=1e-6,
+):
+    """
+    Sanity checks for the neutrino candidates computed by `solve_neutrino_pz`.
+    The candidates of events with two solutions should solve the quadratic equation
+    for the W boson mass constraint, and the candidates of all events with a lepton of
+    nonzero transverse momentum should be finite. With *level* ``"sampled"``, only a
+    random subset of *n_sample* events, drawn with a generator initialized from *seed*,
+    is checked, and with ``"off"``, the checks are skipped.
+    """
+    assert level in VALIDATION_LEVELS, f"invalid validation level '{level}'"
+    if level == "off":
+        return
+
+    # select events to check
+    if level == "sampled" and len(n_cands) > n_sample:
+        idxs = np.sort(np.random.default_rng(seed).choice(len(n_cands), n_sample, replace=False))
+        lep_p4 = tuple(c[idxs] for c in lep_p4)
+        met_x, met_y, pz, n_cands = met_x[idxs], met_y[idxs], pz[idxs], n_cands[idxs]
+
+    lep_x, lep_y, lep_z, lep_t = lep_p4
+    has_lep_pt = (lep_x != 0) | (lep_y != 0)
+    is_valid = np.arange(2) < n_cands[:, np.newaxis]
+    assert np.all(np.isfinite(pz[is_valid & has_lep_pt[:, np.newaxis]])), \
+        "Sanity check failed: neutrino candidates are not finite"
+
+    # both solutions should solve the quadratic equation for the W mass constraint
+    two = n_cands == 2
+    lep_pt2 = (lep_x * lep_x + lep_y * lep_y)[two, np.newaxis]
+    lnu_mu = (0.5 * m_w ** 2 + (met_x * lep_x + met_y * lep_y))[two, np.newaxis]
+    terms = (
+        lep_pt2 * pz[two] * pz[two],
+        -2 * lnu_mu * lep_z[two, np.newaxis] * pz[two],
+        (lep_t * lep_t * (met_x * met_x + met_y * met_y))[two, np.newaxis] - lnu_mu * lnu_mu,
+    )
+    assert np.all(np.abs(sum(terms)) <= rtol * sum(np.abs(term) for term in terms)), \
+        "Sanity check failed: neutrino candidates do not fulfill the W mass constraint"
 
 
 @producer(
     uses={
         choose_lepton,
+        "event",
         "MET.pt", "MET.phi",
     },
     produces={
         choose_lepton,
         "NeutrinoCandidates.*",
     },
+    # sanity checks of the candidates: "off", "sampled" or "full"
+    validation_level="sampled",
+    # number of events checked per call for validation level "sampled"
+    validation_sample_size=1000,
 )
 def neutrino_candidates(self: Producer, events: ak.Array, **kwargs) -> ak.Array:
     """
     Reconstruct possible candidates for the neutrino, assuming the azimuthal
     and radial components are equal to those of the missing transverse momentum.
-    """
 
-    # load coffea behaviors for simplified arithmetic with vectors
-    events = ak.Array(events, behavior=coffea.nanoevents.methods.nanoaod.behavior)
-    events["Electron"] = ak.with_name(events.Electron, "PtEtaPhiMLorentzVector")
-    events["Muon"] = ak.with_name(events.Muon, "PtEtaPhiMLorentzVector")
-    events["MET"] = ak.with_name(events.MET, "MissingET")
+    The candidates are stored as Cartesian four-vectors (fields `x`, `y`, `z` and `t`),
+    which can be used directly by the ttbar reconstruction.
+    """
 
     # choose lepton
     events = self[choose_lepton](events, **kwargs)
     lepton = events["Lepton"]
 
-    # attach lorentz vector behavior to lepton
-    lepton = ak.with_name(lepton, "PtEtaPhiMLorentzVector")
-
-    lnu_delta_phi = lepton.delta_phi(events.MET)
-
     # TODO: move to config
     m_w = 80.0  # GeV
 
-    # -- calculate longitudinal component of neutrino
-
-    # helper mass
-    lnu_mu = (
-        0.5 * m_w ** 2 +
-        events.MET.pt * lepton.pt * np.cos(lnu_delta_phi)
+    def to_numpy(arr):
+        return np.asarray(ak.to_numpy(ak.fill_none(arr, np.nan)), dtype=np.float64)
+
+    # flat input arrays
+    lep_p4 = p4_from_ptetaphim(*(to_numpy(lepton[f]) for f in ("pt", "eta", "phi", "mass")))
+    met_pt, met_phi = to_numpy(events.MET.pt), to_numpy(events.MET.phi)
+    met_x, met_y = met_pt * np.cos(met_phi), met_pt * np.sin(met_phi)
+
+    # calculate longitudinal component of neutrino
+    pz, n_cands = solve_neutrino_pz(lep_p4, met_x, met_y, m_w=m_w)
+
+    # sanity checks; the sampled events are drawn depending on the chunk
+    # (via its size and first and last event numbers)
+    event = np.asarray(events.event)
+    validate_neutrino_pz(
+        lep_p4, met_x, met_y, pz, n_cands,
+        m_w=m_w,
+        level=self.validation_level,
+        n_sample=self.validation_sample_size,
+        seed=[len(event), int(event[0]), int(event[-1])] if len(event) else 0,
     )
 
-    # real part of solution
-    lnu_pz_0 = lnu_mu * lepton.z / (lepton.pt ** 2)
-
-    # calculate discriminant
-    lnu_delta_e_sq = ((lepton.energy * events.MET.pt) ** 2 - lnu_mu ** 2) / (lepton.pt ** 2)
-    lnu_disc = lnu_pz_0 ** 2 - lnu_delta_e_sq
-
-    # quadratic solutions
-    # (truncate discriminant at 0 to discard imaginary part)
-    lnu_disc_nonneg = ak.where(lnu_disc > 0, lnu_disc, 0)
-    lnu_pz_p = lnu_pz_0 + np.sqrt(lnu_disc_nonneg)
-    lnu_pz_m = lnu_pz_0 - np.sqrt(lnu_disc_nonneg)
-
-    # pack solutions into a nested list
-    lnu_pz_pm = ak.concatenate([
-        ak.singletons(lnu_pz_p),
-        ak.singletons(lnu_pz_m),
-    ], axis=1)
-
-    # choose either 2 real solutions as candidates,
-    # or real part of complex solutions
-    lnu_pz_cands = ak.where(
-        lnu_disc > 0,
-        lnu_pz_pm,
-        ak.singletons(lnu_pz_0),
+    # build neutrino candidate four-vectors (massless)
+    is_valid = np.arange(2) < n_cands[:, np.newaxis]
+    nu_x = np.repeat(met_x, n_cands)
+    nu_y = np.repeat(met_y, n_cands)
+    nu_z = pz[is_valid]
+    nu_t = np.sqrt(nu_x * nu_x + nu_y * nu_y + nu_z * nu_z)
+    nu_cands_lv = ak.unflatten(
+        ak.zip({"x": nu_x, "y": nu_y, "z": nu_z, "t": nu_t}, with_name="LorentzVector"),
+        n_cands,
     )
 
-    # replace null values (no lepton available) with empty lists
-    lnu_pz_cands = ak.fill_none(lnu_pz_cands, [], axis=0)
-
-    nu_cands = ak.zip({
-        "x": events.MET.x,
-        "y": events.MET.y,
-        "z": lnu_pz_cands,
-    })
-
-    # attach three-vector behavior to neutrino candidates
-    nu_cands = ak.with_name(nu_cands, "ThreeVector")
-
-    # sanity checks: pt and phi of all neutrino candidates
-    # should be equal to those of MET
-    assert ak.all((abs(nu_cands.delta_phi(events.MET)) < 1e-3)), \
-        "Sanity check failed: neutrino candidates and MET 'phi' differ"
-    assert ak.all((abs(nu_cands.pt - events.MET.pt) < 1e-3)), \
-        "Sanity check failed: neutrino candidates and MET 'pt' differ"
-
-    # build neutrino candidate four-vectors
-    nu_cands_lv = ak.zip({
-        "pt": nu_cands.pt,
-        # no shortcut for pseudorapitiy
-        "eta": -np.log(np.tan(nu_cands.theta / 2)),
-        "phi": nu_cands.phi,
-        "mass": 0,
-    }, with_name="PtEtaPhiMLorentzVector")
-
     # commit neutrino candidates to events array
     events = set_ak_column(events, "NeutrinoCandidates", nu_cands_lv)
 
@@ -7,7 +7,8 @@ from columnflow.production import Producer, producer
 from columnflow.util import maybe_import
 from columnflow.columnar_util import set_ak_column
 
-from mtt.production.util import lv_mass, delta_r_match, delta_r_match_multiple
+from mtt.column_cache import shift_invariant_cached
+from mtt.production.util import lv_mass, delta_r_match, delta_r_match_multiple, GenPartAncestry
 
 ak = maybe_import("awkward")
 np = maybe_import("numpy")
@@ -27,6 +28,7 @@ maybe_import("coffea.nanoevents.methods.nanoaod")
         "GenTTbar.*",
     },
 )
+@shift_invariant_cached(["jec_*", "jer_*"])
 def ttbar_gen(
     self: Producer,
     events: ak.Array,
@@ -55,21 +57,8 @@ def ttbar_gen(
         """
         return gen_part[gen_part.genPartIdxMotherMasked]
 
-    def is_descended_from(gen_part, idx):
-        """
-        Return an array with the same structure as `gen_part` that indicated whether the
-        respective generator particle is part of the decay chain of the particle at position `idx`.
-        """
-        idx = ak.fill_none(idx, -1)
-        result = ak.zeros_like(gen_part.index, dtype=bool)
-
-        # apply `parents` repeatedly and check index
-        gen_parent = gen_part
-        while ak.any(~ak.is_none(gen_parent.index, axis=1)):
-            result = result | ak.fill_none(gen_parent.index == idx, False)
-            gen_parent = gen_part[gen_parent.genPartIdxMotherMasked]
-
-        return result
+    # ancestry index for decay chain queries
+    ancestry = GenPartAncestry(gen_part.genPartIdxMother)
 
     # extract bool flags
     is_hard_proc = gen_part.hasFlags("isHardProcess")
@@ -90,8 +79,7 @@ def ttbar_gen(
     gen_top_2 = gen_top[:, 1]
 
     # identify top quark decay products
-    is_top_1_decay = is_descended_from(gen_part, gen_top_1.index)
-    is_top_2_decay = is_descended_from(gen_part, gen_top_2.index)
+    is_top_1_decay, is_top_2_decay = ancestry.is_descendant([gen_top_1.index, gen_top_2.index])
     gen_part["is_top_decay"] = (is_top_1_decay | is_top_2_decay)
 
     # b quarks
@@ -105,8 +93,7 @@ def ttbar_gen(
     gen_w_2 = ak.firsts(gen_part[is_w & is_top_2_decay])
 
     # identify W boson decay products
-    is_w_1_decay = is_descended_from(gen_part, gen_w_1.index)
-    is_w_2_decay = is_descended_from(gen_part, gen_w_2.index)
+    is_w_1_decay, is_w_2_decay = ancestry.is_descendant([gen_w_1.index, gen_w_2.index])
     gen_part["is_w_decay"] = (is_w_1_decay | is_w_2_decay)
 
     # charged leptons (e, mu only)
@@ -0,0 +1,707 @@
+# coding: utf-8
+
+"""
+Compiled kernels for the combinatoric ttbar reconstruction.
+
+The kernels operate directly on the flat contents and offsets of the jagged
+input arrays and loop over all hypotheses for each event, keeping track
+only of the best hypothesis found so far. In contrast to the awkward-array
+implementation in `mtt.production.ttbar_reco`, the hypotheses are never
+materialized in memory.
+
+Jet combinations are represented as bit masks, with bit `i` set if the
+jet with index `i` is part of the combination. The four-vector sums over
+all possible jet subsets are precomputed once per event, so that each
+hypothesis reduces to a pair of disjoint bit masks that are looked up in
+the resulting table.
+"""
+from columnflow.util import maybe_import
+
+from mtt.production.util import jit
+
+np = maybe_import("numpy")
+
+
+@jit
+def _n_combinations(n, k):
+    """
+    Return the number of ways to choose `k` out of `n` objects.
+    """
+    if k < 0 or k > n:
+        return 0
+    result = 1
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+@jit
+def _next_combination(comb, n):
+    """
+    Advance the index combination `comb` (strictly increasing indices
+    in the range `[0, n)`) to the next one in lexicographic order. The
+    array is modified in place. Returns `False` if `comb` was already
+    the last combination.
+    """
+    k = len(comb)
+    i = k - 1
+    while i >= 0 and comb[i] == n - k + i:
+        i -= 1
+    if i < 0:
+        return False
+    comb[i] += 1
+    for j in range(i + 1, k):
+        comb[j] = comb[j - 1] + 1
+    return True
+
+
+@jit
+def _combination_masks(n_max):
+    """
+    Build the bit masks of all combinations of `k` out of `n` objects, for all
+    `n <= n_max`. For each `(n, k)`, the masks are listed in the lexicographic
+    order of the corresponding index combinations, which is the order used by
+    `ak.argcombinations`.
+
+    Returns a flat array with the masks and an array of shape `(n_max + 1, n_max + 2)`
+    with the offsets, such that the masks for `(n, k)` are found in the range
+    `offsets[n, k]:offsets[n, k + 1]`.
+    """
+    offsets = np.zeros((n_max + 1, n_max + 2), dtype=np.int64)
+    n_total = 0
+    for n in range(n_max + 1):
+        offsets[n, 0] = n_total
+        for k in range(n_max + 1):
+            n_total += _n_combinations(n, k)
+            offsets[n, k + 1] = n_total
+
+    masks = np.zeros(n_total, dtype=np.int64)
+    for n in range(n_max + 1):
+        for k in range(n + 1):
+            comb = np.arange(k)
+            for i_comb in range(offsets[n, k], offsets[n, k + 1]):
+                mask = 0
+                for i in range(k):
+                    mask |= 1 << comb[i]
+                masks[i_comb] = mask
+                _next_combination(comb, n)
+
+    return masks, offsets
+
+
+@jit
+def _subset_sums(jet_p4, n_jet, sums):
+    """
+    Fill the first `2 ** n_jet` rows of `sums` with the four-vector sums over all
+    subsets of the jets in `jet_p4`, indexed by the bit mask of the subset.
+
+    Each sum is obtained by adding the jet with the highest index in the subset
+    to the sum over the remaining jets. This accumulates the jets in order of
+    increasing index, which reproduces the results of
+    `mtt.production.util.lv_sum` exactly.
+    """
+    for c in range(4):
+        sums[0, c] = 0.0
+
+    i_high = -1
+    for mask in range(1, 1 << n_jet):
+        # index of the highest set bit
+        if mask == 1 << (i_high + 1):
+            i_high += 1
+        rest = mask ^ (1 << i_high)
+        if rest == 0:
+            for c in range(4):
+                sums[mask, c] = jet_p4[i_high, c]
+        else:
+            for c in range(4):
+                sums[mask, c] = sums[rest, c] + jet_p4[i_high, c]
+
+
+@jit
+def _mass(x, y, z, t):
+    """
+    Invariant mass of a four-vector, computed like in the coffea behaviors.
+    """
+    return np.sqrt(t * t - x * x - y * y - z * z)
+
+
+@jit
+def _chi2_term(mass, mean, width):
+    """
+    Contribution of a single top quark hypothesis to the chi2 score.
+    """
+    d = (mass - mean) / width
+    return d * d
+
+
+@jit
+def _mask_to_indices(mask, out):
+    """
+    Write the indices of the bits set in `mask` to `out` in increasing order.
+    """
+    i = 0
+    j = 0
+    while mask:
+        if mask & 1:
+            out[i] = j
+            i += 1
+        mask >>= 1
+        j += 1
+
+
+@jit
+def _may_improve(value, best_value, is_earlier):
+    """
+    Return whether a round with a total chi2 of (at least) `value` can replace
+    the best round found so far, which has a total chi2 of `best_value`. In case
+    of a tie, the round that comes first in the canonical order wins, which is
+    indicated by `is_earlier`.
+    """
+    return value < best_value or (is_earlier and value == best_value)
+
+
+@jit
+def _first_hypothesis(n_jet, n_jet_lep, n_jet_had, comb_masks, comb_offsets):
+    """
+    Return the bit masks of the leptonic and hadronic jets for the first hypothesis
+    of a round in canonical order. For the boosted regime (`n_jet_had == 0`), the
+    hadronic mask is zero.
+    """
+    lep_mask = comb_masks[comb_offsets[n_jet, n_jet_lep]]
+    had_mask = 0
+    if n_jet_had > 0:
+        for i_had in range(comb_offsets[n_jet, n_jet_had], comb_offsets[n_jet, n_jet_had + 1]):
+            if not (lep_mask & comb_masks[i_had]):
+                had_mask = comb_masks[i_had]
+                break
+    return lep_mask, had_mask
+
+
+@jit
+def _search_exhaustive(
+    n_jet,
+    n_nu,
+    rounds,
+    comb_masks,
+    comb_offsets,
+    subset_lep_chi2,
+    subset_had_chi2,
+    had_chi2_fixed,
+):
+    """
+    Find the best hypothesis for a single event by visiting all hypotheses in the
+    same order as the awkward-array implementation. Within a round, the first
+    hypothesis with the lowest score is chosen, and the best hypothesis of a round
+    only replaces the previous best if its total chi2 is strictly lower.
+
+    Returns the round index (`-1` if no hypothesis exists), the index of the
+    neutrino candidate and the bit masks of the leptonic and hadronic jets.
+    """
+    best_round, best_nu, best_lep_mask, best_had_mask = -1, -1, 0, 0
+    best_chi2 = 0.0
+    for i_round in range(len(rounds)):
+        n_jet_lep = rounds[i_round, 0]
+        n_jet_had = rounds[i_round, 1]
+        is_boosted = (n_jet_had == 0)
+
+        # no hypotheses in this round
+        if n_jet_lep + n_jet_had > n_jet:
+            continue
+
+        lep_begin = comb_offsets[n_jet, n_jet_lep]
+        lep_end = comb_offsets[n_jet, n_jet_lep + 1]
+        had_begin = comb_offsets[n_jet, n_jet_had]
+        had_end = comb_offsets[n_jet, n_jet_had + 1]
+
+        # find best hypothesis in round
+        found = False
+        round_best = 0.0
+        round_nu, round_lep_mask, round_had_mask = -1, 0, 0
+        for i_nu in range(n_nu):
+            for i_lep in range(lep_begin, lep_end):
+                lep_mask = comb_masks[i_lep]
+                lep_chi2 = subset_lep_chi2[i_nu, lep_mask]
+                if is_boosted:
+                    if not found or lep_chi2 < round_best:
+                        found = True
+                        round_best = lep_chi2
+                        round_nu, round_lep_mask = i_nu, lep_mask
+                    continue
+
+                for i_had in range(had_begin, had_end):
+                    had_mask = comb_masks[i_had]
+                    # skip jet combinations that overlap
+                    if lep_mask & had_mask:
+                        continue
+                    value = lep_chi2 + subset_had_chi2[had_mask]
+                    if not found or value < round_best:
+                        found = True
+                        round_best = value
+                        round_nu, round_lep_mask, round_had_mask = i_nu, lep_mask, had_mask
+
+        if not found:
+            continue
+
+        # total chi2 of the best hypothesis in round
+        if is_boosted:
+            round_had_chi2 = had_chi2_fixed
+        else:
+            round_had_chi2 = subset_had_chi2[round_had_mask]
+        round_chi2 = round_had_chi2 + subset_lep_chi2[round_nu, round_lep_mask]
+
+        # update results if chi2 decreases
+        if best_round >= 0 and not (round_chi2 < best_chi2):
+            continue
+
+        best_round, best_nu, best_lep_mask, best_had_mask = i_round, round_nu, round_lep_mask, round_had_mask
+        best_chi2 = round_chi2
+
+    return best_round, best_nu, best_lep_mask, best_had_mask
+
+
+@jit
+def _search_pruned(
+    n_jet,
+    n_nu,
+    rounds,
+    round_order,
+    round_bounds,
+    comb_masks,
+    comb_offsets,
+    subset_lep_chi2,
+    subset_had_chi2,
+    had_chi2_min,
+    had_sorted_masks,
+    had_sorted_pos,
+    had_chi2_fixed,
+):
+    """
+    Like `_search_exhaustive`, but skip hypotheses that cannot improve on the best
+    hypothesis found so far (branch-and-bound).
+
+    The rounds are visited in the order given by `round_order`, and skipped entirely
+    if their lower bound on the total chi2 in `round_bounds` cannot beat the current
+    best round. Within a round, each combination of neutrino candidate and leptonic
+    jets is skipped if its leptonic chi2 plus the lowest hadronic chi2 for the round
+    (`had_chi2_min`) cannot improve the result. Otherwise, the hadronic jet
+    combinations are visited in order of increasing chi2 (`had_sorted_*`), stopping
+    as soon as no further improvement is possible.
+
+    Since floating-point addition is monotonic, these bounds are exact. Ties are
+    resolved according to the canonical order of rounds and hypotheses.
+
+    NaN scores are handled like in the exhaustive search: if the first hypothesis
+    of a round has a NaN score, it is never replaced, so that the round either
+    yields the final result (if it is the first round with any hypotheses), or
+    never does. Otherwise, hypotheses with NaN scores are never chosen. The bounds
+    (`round_bounds`, `had_chi2_min`) are therefore expected to ignore NaN values,
+    and the sorted hadronic jet combinations to have NaN scores placed last. With
+    this, the result is identical to the one obtained by `_search_exhaustive`,
+    provided that `had_chi2_fixed` is not NaN.
+
+    Returns the same values as `_search_exhaustive`, followed by the number of
+    hypotheses that were skipped.
+    """
+    n_rounds = len(rounds)
+
+    # number of hypotheses in each round
+    n_round_hyps = np.zeros(n_rounds, dtype=np.int64)
+    for i_round in range(n_rounds):
+        n_jet_lep = rounds[i_round, 0]
+        n_round_hyps[i_round] = (
+            n_nu *
+            _n_combinations(n_jet, n_jet_lep) *
+            _n_combinations(n_jet - n_jet_lep, rounds[i_round, 1])
+        )
+    n_hyps = n_round_hyps.sum()
+
+    # scores of the first hypothesis of each round
+    first_value = np.full(n_rounds, np.inf)
+    first_round = -1
+    for i_round in range(n_rounds):
+        if n_round_hyps[i_round] == 0:
+            continue
+        lep_mask, had_mask = _first_hypothesis(n_jet, rounds[i_round, 0], rounds[i_round, 1], comb_masks, comb_offsets)
+        first_value[i_round] = subset_lep_chi2[0, lep_mask]
+        if rounds[i_round, 1] > 0:
+            first_value[i_round] = first_value[i_round] + subset_had_chi2[had_mask]
+
+        # first round with NaN score for the first hypothesis determines the result
+        if first_round < 0:
+            first_round = i_round
+            if np.isnan(first_value[i_round]):
+                return i_round, 0, lep_mask, had_mask, n_hyps - 1
+
+    best_round, best_nu, best_lep_mask, best_had_mask = -1, -1, 0, 0
+    best_chi2 = 0.0
+    n_pruned = 0
+    for i_order in range(n_rounds):
+        i_round = round_order[i_order]
+        n_jet_lep = rounds[i_round, 0]
+        n_jet_had = rounds[i_round, 1]
+        is_boosted = (n_jet_had == 0)
+
+        # no hypotheses in this round
+        if n_round_hyps[i_round] == 0:
+            continue
+
+        # skip round if its first hypothesis has a NaN score
+        if np.isnan(first_value[i_round]):
+            n_pruned += n_round_hyps[i_round]
+            continue
+
+        is_earlier = (best_round < 0 or i_round < best_round)
+
+        # skip round if it cannot improve on best result
+        if best_round >= 0 and not _may_improve(round_bounds[i_round], best_chi2, is_earlier):
+            n_pruned += n_round_hyps[i_round]
+            continue
+
+        lep_begin = comb_offsets[n_jet, n_jet_lep]
+        lep_end = comb_offsets[n_jet, n_jet_lep + 1]
+        had_begin = comb_offsets[n_jet, n_jet_had]
+        had_end = comb_offsets[n_jet, n_jet_had + 1]
+
+        # find best hypothesis in round
+        found = False
+        round_best = 0.0
+        round_nu, round_lep, round_had_pos = -1, -1, -1
+        round_lep_mask, round_had_mask = 0, 0
+        n_evaluated = 0
+        for i_nu in range(n_nu):
+            for i_lep in range(lep_begin, lep_end):
+                lep_mask = comb_masks[i_lep]
+                lep_chi2 = subset_lep_chi2[i_nu, lep_mask]
+
+                # hypotheses with NaN scores are never chosen
+                if np.isnan(lep_chi2):
+                    continue
+
+                if is_boosted:
+                    if best_round >= 0 and not _may_improve(had_chi2_fixed + lep_chi2, best_chi2, is_earlier):
+                        continue
+                    n_evaluated += 1
+                    if not found or lep_chi2 < round_best:
+                        found = True
+                        round_best = lep_chi2
+                        round_nu, round_lep_mask = i_nu, lep_mask
+                    continue
+
+                # skip if no hadronic jet combination can lead to an improvement
+                value_min = lep_chi2 + had_chi2_min[n_jet_had]
+                if found and value_min >= round_best:
+                    continue
+                if best_round >= 0 and not _may_improve(value_min, best_chi2, is_earlier):
+                    continue
+
+                # visit hadronic jet combinations in order of increasing chi2
+                for i_had in range(had_begin, had_end):
+                    had_mask = had_sorted_masks[i_had]
+                    value = lep_chi2 + subset_had_chi2[had_mask]
+                    if np.isnan(value):
+                        break
+                    if found and value > round_best:
+                        break
+                    if best_round >= 0 and not _may_improve(value, best_chi2, is_earlier):
+                        break
+                    # skip jet combinations that overlap
+                    if lep_mask & had_mask:
+                        continue
+                    n_evaluated += 1
+                    # on ties, prefer first hypothesis in canonical order
+                    had_pos = had_sorted_pos[i_had]
+                    if (
+                        not found or
+                        value < round_best or
+                        (value == round_best and i_nu == round_nu and i_lep == round_lep and had_pos < round_had_pos)
+                    ):
+                        found = True
+                        round_best = value
+                        round_nu, round_lep, round_had_pos = i_nu, i_lep, had_pos
+                        round_lep_mask, round_had_mask = lep_mask, had_mask
+
+        n_pruned += n_round_hyps[i_round] - n_evaluated
+
+        if not found:
+            continue
+
+        # total chi2 of the best hypothesis in round
+        if is_boosted:
+            round_had_chi2 = had_chi2_fixed
+        else:
+            round_had_chi2 = subset_had_chi2[round_had_mask]
+        round_chi2 = round_had_chi2 + subset_lep_chi2[round_nu, round_lep_mask]
+
+        # update results if chi2 decreases (or on ties, if round comes first)
+        if best_round >= 0 and not _may_improve(round_chi2, best_chi2, is_earlier):
+            continue
+
+        best_round, best_nu, best_lep_mask, best_had_mask = i_round, round_nu, round_lep_mask, round_had_mask
+        best_chi2 = round_chi2
+
+    return best_round, best_nu, best_lep_mask, best_had_mask, n_pruned
+
+
+@jit
+def ttbar_chi2_kernel(
+    jet_offsets,
+    jet_p4,
+    lep_p4,
+    nu_offsets,
+    nu_p4,
+    top_had_chi2_fixed,
+    rounds,
+    chi2_pars_lep,
+    chi2_pars_had,
+    prune=False,
+):
+    """
+    Find the best ttbar hypothesis in terms of a chi2 metric for each event.
+
+    The inputs are the flat four-vector contents (`*_p4`, arrays of shape `(n, 4)`
+    containing the `x`, `y`, `z` and `t` components) and the offsets of the AK4
+    jets (`jet_*`) and neutrino candidates (`nu_*`), and the lepton four-vectors
+    with exactly one entry per event (`lep_p4`).
+
+    The array `rounds` has shape `(n_rounds, 2)` and lists the numbers of jets to
+    assign to the leptonically and hadronically decaying top quarks, in the order
+    in which they are to be considered. A hadronic jet multiplicity of zero
+    indicates the boosted regime, in which case only the leptonic top quark is
+    reconstructed from AK4 jets and the per-event hadronic chi2 term is taken
+    from `top_had_chi2_fixed`.
+
+    The chi2 parameters are passed as arrays `chi2_pars_lep` and `chi2_pars_had`
+    containing the values `(m_lep, s_lep)` and `(m_had, s_had)`, respectively.
+
+    All quantities are evaluated in the floating-point types of the inputs, promoted
+    like in numpy when combining them, e.g. hadronic top quarks are summed from jets
+    in the type of `jet_p4`. To obtain the same chi2 terms as the awkward-array
+    implementation, where the chi2 parameters are Python floats, `chi2_pars_had` should
+    have the type of `jet_p4`, and `chi2_pars_lep` the type of the leptonic top quark
+    four-vectors, i.e. the one resulting from combining `lep_p4`, `nu_p4` and `jet_p4`.
+
+    For each event, the four-vector sums and chi2 terms of all jet subsets are
+    computed once and shared between all rounds.
+
+    The hypotheses are visited in the same order as in the awkward-array
+    implementation and the same tie-breaking rules apply: within a round, the
+    first hypothesis with the lowest score is chosen, and the result of a round
+    only replaces the previous best result if its total chi2 is strictly lower.
+
+    If `prune` is true, hypotheses that cannot improve on the best hypothesis found
+    so far are skipped (see `_search_pruned`), with the rounds visited in order of
+    their lower bound on the total chi2. Boosted-regime events with a NaN value in
+    `top_had_chi2_fixed` are always searched exhaustively. The outputs do not depend
+    on `prune`.
+
+    Returns a tuple of arrays containing, for each event, the index of the round
+    that yielded the best hypothesis (`-1` if no hypothesis exists), the indices of
+    the jets assigned to the leptonic and hadronic top quarks (padded with zeros),
+    the four-vectors of the leptonic and hadronic top quarks, and the leptonic,
+    hadronic and total chi2 scores. The last two entries are an array with the number
+    of hypotheses in each round and the total number of hypotheses skipped due to
+    pruning.
+    """
+    n_events = len(jet_offsets) - 1
+    n_rounds = len(rounds)
+
+    m_lep, s_lep = chi2_pars_lep[0], chi2_pars_lep[1]
+    m_had, s_had = chi2_pars_had[0], chi2_pars_had[1]
+
+    # floating-point types of the four-vectors and chi2 terms of the top quarks
+    lep_dtype = ((lep_p4[:1, 0] + nu_p4[:1, 0]) + jet_p4[:1, 0]).dtype
+    lep_chi2_dtype = chi2_pars_lep.dtype
+    had_chi2_dtype = (chi2_pars_had[:1] + top_had_chi2_fixed[:1]).dtype
+    chi2_dtype = (chi2_pars_lep[:1] + chi2_pars_had[:1] + top_had_chi2_fixed[:1]).dtype
+
+    # maximum multiplicities, used for sizing output and scratch buffers
+    n_jet_lep_max = 1
+    n_jet_had_max = 1
+    for i_round in range(n_rounds):
+        n_jet_lep_max = max(n_jet_lep_max, rounds[i_round, 0])
+        n_jet_had_max = max(n_jet_had_max, rounds[i_round, 1])
+    n_jet_max = 0
+    n_nu_max = 0
+    for i_event in range(n_events):
+        n_jet_max = max(n_jet_max, jet_offsets[i_event + 1] - jet_offsets[i_event])
+        n_nu_max = max(n_nu_max, nu_offsets[i_event + 1] - nu_offsets[i_event])
+
+    # bit masks of jet combinations in lexicographic order
+    comb_masks, comb_offsets = _combination_masks(n_jet_max)
+
+    # output buffers
+    best_round = np.full(n_events, -1, dtype=np.int64)
+    jet_idxs_lep = np.zeros((n_events, n_jet_lep_max), dtype=np.uint8)
+    jet_idxs_had = np.zeros((n_events, n_jet_had_max), dtype=np.uint8)
+    top_lep = np.zeros((n_events, 4), dtype=lep_dtype)
+    top_had = np.zeros((n_events, 4), dtype=jet_p4.dtype)
+    top_lep_chi2 = np.zeros(n_events, dtype=lep_chi2_dtype)
+    top_had_chi2 = np.zeros(n_events, dtype=had_chi2_dtype)
+    chi2 = np.zeros(n_events, dtype=chi2_dtype)
+    n_hyps = np.zeros(n_rounds, dtype=np.int64)
+    n_pruned = 0
+
+    # scratch buffers for per-subset quantities
+    n_subsets_max = 1 << n_jet_max
+    subset_sums = np.zeros((n_subsets_max, 4), dtype=jet_p4.dtype)
+    subset_had_chi2 = np.zeros(n_subsets_max, dtype=chi2_pars_had.dtype)
+    subset_lep_chi2 = np.zeros((max(n_nu_max, 1), n_subsets_max), dtype=lep_chi2_dtype)
+    subset_size = np.zeros(n_subsets_max, dtype=np.int64)
+    for mask in range(1, n_subsets_max):
+        subset_size[mask] = subset_size[mask >> 1] + (mask & 1)
+
+    # scratch buffers for pruning (in the types of the bounded quantities,
+    # so that the bounds are computed with the same rounding)
+    lep_chi2_min = np.zeros(n_jet_max + 1, dtype=lep_chi2_dtype)
+    had_chi2_min = np.zeros(n_jet_max + 1, dtype=chi2_pars_had.dtype)
+    had_sorted_masks = np.zeros(len(comb_masks), dtype=np.int64)
+    had_sorted_pos = np.zeros(len(comb_masks), dtype=np.int64)
+    round_bounds = np.zeros(n_rounds, dtype=chi2_dtype)
+
+    # range of jet multiplicities for leptonic and hadronic top quarks
+    n_jet_lep_min = n_jet_lep_max
+    n_jet_had_min = n_jet_had_max
+    has_boosted_rounds = False
+    for i_round in range(n_rounds):
+        n_jet_lep_min = min(n_jet_lep_min, rounds[i_round, 0])
+        if rounds[i_round, 1] > 0:
+            n_jet_had_min = min(n_jet_had_min, rounds[i_round, 1])
+        else:
+            has_boosted_rounds = True
+
+    for i_event in range(n_events):
+        jets = jet_p4[jet_offsets[i_event]:jet_offsets[i_event + 1]]
+        nus = nu_p4[nu_offsets[i_event]:nu_offsets[i_event + 1]]
+        n_jet = len(jets)
+        n_nu = len(nus)
+        if n_nu == 0 or n_jet == 0:
+            continue
+
+        for i_round in range(n_rounds):
+            n_hyps[i_round] += (
+                n_nu *
+                _n_combinations(n_jet, rounds[i_round, 0]) *
+                _n_combinations(n_jet - rounds[i_round, 0], rounds[i_round, 1])
+            )
+
+        # -- precompute four-vector sums and chi2 terms for all jet subsets
+
+        n_subsets = 1 << n_jet
+        lep_chi2_min[:] = np.inf
+        had_chi2_min[:] = np.inf
+        _subset_sums(jets, n_jet, subset_sums)
+        for mask in range(1, n_subsets):
+            size = subset_size[mask]
+            if n_jet_had_min <= size <= n_jet_had_max:
+                had_chi2 = _chi2_term(
+                    _mass(subset_sums[mask, 0], subset_sums[mask, 1], subset_sums[mask, 2], subset_sums[mask, 3]),
+                    m_had,
+                    s_had,
+                )
+                subset_had_chi2[mask] = had_chi2
+                # note: comparison ignores NaN values
+                if had_chi2 < had_chi2_min[size]:
+                    had_chi2_min[size] = had_chi2
+            if n_jet_lep_min <= size <= n_jet_lep_max:
+                for i_nu in range(n_nu):
+                    lep_chi2 = _chi2_term(
+                        _mass(
+                            (lep_p4[i_event, 0] + nus[i_nu, 0]) + subset_sums[mask, 0],
+                            (lep_p4[i_event, 1] + nus[i_nu, 1]) + subset_sums[mask, 1],
+                            (lep_p4[i_event, 2] + nus[i_nu, 2]) + subset_sums[mask, 2],
+                            (lep_p4[i_event, 3] + nus[i_nu, 3]) + subset_sums[mask, 3],
+                        ),
+                        m_lep,
+                        s_lep,
+                    )
+                    subset_lep_chi2[i_nu, mask] = lep_chi2
+                    if lep_chi2 < lep_chi2_min[size]:
+                        lep_chi2_min[size] = lep_chi2
+
+        # -- find best hypothesis
+
+        if prune and not (has_boosted_rounds and np.isnan(top_had_chi2_fixed[i_event])):
+            # hadronic jet combinations in order of increasing chi2
+            # (ties resolved by canonical order, NaN values last)
+            for n_jet_had in range(n_jet_had_min, min(n_jet_had_max, n_jet) + 1):
+                had_begin = comb_offsets[n_jet, n_jet_had]
+                had_end = comb_offsets[n_jet, n_jet_had + 1]
+                masks = comb_masks[had_begin:had_end]
+                order = np.argsort(subset_had_chi2[masks], kind="mergesort")
+                for i in range(len(order)):
+                    had_sorted_masks[had_begin + i] = masks[order[i]]
+                    had_sorted_pos[had_begin + i] = order[i]
+
+            # lower bounds on the total chi2 in each round
+            for i_round in range(n_rounds):
+                n_jet_lep = rounds[i_round, 0]
+                n_jet_had = rounds[i_round, 1]
+                if n_jet_lep + n_jet_had > n_jet:
+                    round_bounds[i_round] = np.inf
+                elif n_jet_had == 0:
+                    round_bounds[i_round] = top_had_chi2_fixed[i_event] + lep_chi2_min[n_jet_lep]
+                else:
+                    round_bounds[i_round] = had_chi2_min[n_jet_had] + lep_chi2_min[n_jet_lep]
+
+            # visit most promising rounds first
+            round_order = np.argsort(round_bounds, kind="mergesort")
+
+            i_round, i_nu, lep_mask, had_mask, n_pruned_event = _search_pruned(
+                n_jet,
+                n_nu,
+                rounds,
+                round_order,
+                round_bounds,
+                comb_masks,
+                comb_offsets,
+                subset_lep_chi2,
+                subset_had_chi2,
+                had_chi2_min,
+                had_sorted_masks,
+                had_sorted_pos,
+                top_had_chi2_fixed[i_event],
+            )
+            n_pruned += n_pruned_event
+        else:
+            i_round, i_nu, lep_mask, had_mask = _search_exhaustive(
+                n_jet,
+                n_nu,
+                rounds,
+                comb_masks,
+                comb_offsets,
+                subset_lep_chi2,
+                subset_had_chi2,
+                top_had_chi2_fixed[i_event],
+            )
+
+        if i_round < 0:
+            continue
+
+        # -- store results
+
+        best_round[i_event] = i_round
+        for c in range(4):
+            top_lep[i_event, c] = (lep_p4[i_event, c] + nus[i_nu, c]) + subset_sums[lep_mask, c]
+        _mask_to_indices(lep_mask, jet_idxs_lep[i_event])
+        top_lep_chi2[i_event] = subset_lep_chi2[i_nu, lep_mask]
+        if rounds[i_round, 1] == 0:
+            top_had_chi2[i_event] = top_had_chi2_fixed[i_event]
+        else:
+            for c in range(4):
+                top_had[i_event, c] = subset_sums[had_mask, c]
+            _mask_to_indices(had_mask, jet_idxs_had[i_event])
+            top_had_chi2[i_event] = subset_had_chi2[had_mask]
+        chi2[i_event] = top_had_chi2[i_event] + top_lep_chi2[i_event]
+
+    return (
+        best_round,
+        jet_idxs_lep,
+        jet_idxs_had,
+        top_lep,
+        top_had,
+        top_lep_chi2,
+        top_had_chi2,
+        chi2,
+        n_hyps,
+        n_pruned,
+    )
@@ -4,9 +4,11 @@
 Column production methods related to ttbar mass reconstruction.
 """
 import itertools
+import json
 import math
+import os
 
-from law.util import human_duration
+from law.util import human_bytes, human_duration, multi_match
 
 from columnflow.production import Producer, producer
 from columnflow.production.categories import category_ids
@@ -14,14 +16,19 @@ from columnflow.util import maybe_import
 from columnflow.columnar_util import set_ak_column, EMPTY_FLOAT
 
 from mtt.config.categories import add_categories_production
-from mtt.util import iter_chunks
+from mtt.memo import chunk_memo
+from mtt.util import chunk_slices, cost_chunk_slices, map_chunks
 from mtt.production.util import (
-    ak_argcartesian, ak_arg_grouped_combinations, lv_xyzt, lv_mass, lv_sum,
+    ak_argcartesian, ak_arg_grouped_combinations, ak_nbytes, grouped_combinations_table,
+    lv_xyzt, lv_sum,
+    p4_components, p4_from_ptetaphim, p4_to_ptetaphim, p4_add,
+    delta_r, delta_r_min, p4_cos_theta_star,
 )
 from mtt.production.lepton import choose_lepton
 from mtt.production.neutrino import neutrino_candidates
 from mtt.production.ttbar_gen import ttbar_gen
-from mtt.profiling_tools import Profiler
+from mtt.production.ttbar_kernels import ttbar_chi2_kernel
+from mtt.profiling_tools import GCController, Metrics, Profiler, SpanRecorder, span_report_dir
 
 ak = maybe_import("awkward")
 np = maybe_import("numpy")
@@ -29,6 +36,410 @@ coffea = maybe_import("coffea")
 maybe_import("coffea.nanoevents.methods.nanoaod")
 
 
+def chi2_term(mass, mean, width):
+    """
+    Contribution of a top quark hypothesis with a given `mass` to the chi2 score.
+
+    The square is computed as an explicit product, since `numpy.power` may dispatch
+    to vectorized implementations that are not correctly rounded. The kernels in
+    `mtt.production.ttbar_kernels` compute the scores in the same way.
+    """
+    delta = (mass - mean) / width
+    return delta * delta
+
+
+# empirical peak memory footprint of the combinatoric reconstruction
+# per event and per hypothesis materialized as awkward arrays; the eager
+# path peaks at about 130 bytes per hypothesis in the largest round (measured
+# with tracemalloc), the extra ~25% are a safety margin for allocator
+# overhead and fragmentation, which tracemalloc does not see
+TTBAR_RECO_BYTES_PER_EVENT = 2048
+TTBAR_RECO_BYTES_PER_HYPOTHESIS = 160
+
+
+def ttbar_hypothesis_counts(n_jet, n_nu, rounds):
+    """
+    Return the number of ttbar hypotheses for events with `n_jet` AK4 jets and `n_nu`
+    neutrino candidates, for each round of jet multiplicities in `rounds`.
+
+    The entries of `rounds` should be tuples (`n_jet_lep`, `n_jet_had`), or (`n_jet_lep`,)
+    in the boosted regime. Returns an array of shape `(n_events, n_rounds)`.
+    """
+    n_jet = np.asarray(n_jet, dtype=np.int64)
+    n_nu = np.asarray(n_nu, dtype=np.int64)
+
+    # table of binomial coefficients
+    n_max = max([int(n_jet.max(initial=0))] + [sum(n_jets) for n_jets in rounds])
+    binom = np.array([
+        [math.comb(n, k) for k in range(n_max + 1)]
+        for n in range(n_max + 1)
+    ], dtype=np.int64)
+
+    # number of ways to choose neutrino candidate and jets for each group
+    counts = np.zeros((len(n_jet), len(rounds)), dtype=np.int64)
+    for i_round, n_jets in enumerate(rounds):
+        counts[:, i_round] = n_nu
+        n_jet_left = n_jet
+        for n in n_jets:
+            counts[:, i_round] *= binom[np.maximum(n_jet_left, 0), n]
+            n_jet_left = n_jet_left - n
+
+    return counts
+
+
+def ttbar_reco_memory(n_jet, n_nu, rounds, merge_mode):
+    """
+    Predict the peak memory in bytes needed for the combinatoric reconstruction of
+    events with `n_jet` AK4 jets and `n_nu` neutrino candidates, considering the
+    rounds of jet multiplicities in `rounds` (see `ttbar_hypothesis_counts`).
+
+    Except for *merge_mode* ``"kernel"``, the hypotheses of one round at a time are
+    materialized, so the prediction is dominated by the round with the most hypotheses.
+    """
+    memory = np.full(len(n_jet), TTBAR_RECO_BYTES_PER_EVENT, dtype=np.int64)
+    if merge_mode != "kernel" and rounds:
+        n_hyps = ttbar_hypothesis_counts(n_jet, n_nu, rounds)
+        memory += TTBAR_RECO_BYTES_PER_HYPOTHESIS * n_hyps.max(axis=1)
+
+    return memory
+
+
+def _flat_p4(lv):
+    """
+    Return the flat contents of an array of Lorentz vectors `lv` as an
+    array of shape `(n, 4)` containing the `x`, `y`, `z` and `t` components.
+
+    The components keep their floating-point type, so that sums and masses
+    computed from them are rounded like the ones of the awkward arrays.
+    """
+    return np.stack([
+        np.asarray(ak.flatten(getattr(lv, c), axis=None))
+        for c in ("x", "y", "z", "t")
+    ], axis=1)
+
+
+def _flat_offsets(arr):
+    """
+    Return the offsets of the flat contents of a jagged array `arr`.
+    """
+    return np.concatenate([[0], np.cumsum(np.asarray(ak.num(arr, axis=1)))])
+
+
+def _p4_mass(p4):
+    """
+    Invariant mass for an array of four-vectors with the `x`, `y`, `z` and `t`
+    components along the last axis, computed like in the coffea behaviors.
+    """
+    x, y, z, t = p4[..., 0], p4[..., 1], p4[..., 2], p4[..., 3]
+    return np.sqrt(t * t - x * x - y * y - z * z)
+
+
+def _argmin_like_ak(values):
+    """
+    Return the index of the minimum along the last axis of a non-empty array
+    `values`, following the conventions of `ak.argmin`: the first entry is
+    chosen if it is NaN, and NaN values are skipped otherwise.
+    """
+    idx = np.argmin(np.where(np.isnan(values), np.inf, values), axis=-1)
+    return np.where(np.isnan(values[..., 0]), 0, idx)
+
+
+def _flat_results_to_ak(
+    best_round,
+    jet_idxs_lep,
+    jet_idxs_had,
+    top_lep,
+    top_had,
+    top_lep_chi2,
+    top_had_chi2,
+    chi2,
+    rounds,
+    topjet_lv=None,
+    top_had_chi2_topjet=None,
+):
+    """
+    Convert the per-event results of a flat-array reconstruction (see
+    `mtt.production.ttbar_kernels.ttbar_chi2_kernel` for the meaning of the
+    arguments) to the dictionary of awkward arrays returned by `ttbar_combinatorics`.
+
+    In the boosted regime, the hadronic top quark and its chi2 term are taken
+    from `topjet_lv` and `top_had_chi2_topjet`.
+    """
+    # mask events without any valid hypotheses
+    valid = (best_round >= 0)
+
+    def masked(arr):
+        return ak.mask(arr, valid)
+
+    def masked_lv(p4):
+        return masked(ak.zip(
+            {c: p4[:, i] for i, c in enumerate(("x", "y", "z", "t"))},
+            with_name="LorentzVector",
+            behavior=coffea.nanoevents.methods.nanoaod.behavior,
+        ))
+
+    def jagged_idxs(idxs, counts):
+        keep = np.arange(idxs.shape[1]) < counts[:, None]
+        return ak.unflatten(idxs[keep], counts)
+
+    n_jet_lep = np.where(valid, rounds[best_round, 0], 0).astype(np.uint8)
+    n_jet_had = np.where(valid, rounds[best_round, 1], 0).astype(np.uint8)
+
+    results = {
+        "top_lep": masked_lv(top_lep),
+        "n_jet_had": masked(n_jet_had),
+        "n_jet_lep": masked(n_jet_lep),
+        "jet_idxs_had": jagged_idxs(jet_idxs_had, n_jet_had),
+        "jet_idxs_lep": jagged_idxs(jet_idxs_lep, n_jet_lep),
+        "top_lep_chi2": masked(top_lep_chi2),
+        "chi2": masked(chi2),
+    }
+
+    # store final hadronic top
+    if topjet_lv is not None:
+        results["top_had"] = ak.firsts(topjet_lv)
+        results["top_had_chi2"] = top_had_chi2_topjet
+    else:
+        results["top_had"] = masked_lv(top_had)
+        results["top_had_chi2"] = masked(top_had_chi2)
+
+    return results
+
+
+def merge_sequential(best_results, new_results):
+    """
+    Merge the results of one round of `ttbar_combinatorics` (`new_results`) into
+    the current best results (`best_results`, or `None` for the first round),
+    choosing the entry with the smaller chi2 for each event. Returns the merged
+    results.
+    """
+    if best_results is None:
+        best_results = new_results
+    else:
+        # update results if chi2 decreases
+        new_chi2, best_chi2 = new_results["chi2"], best_results["chi2"]
+        update = (new_chi2 < best_chi2)
+        # handle missing values
+        update = ak.fill_none(
+            ak.where(ak.is_none(update), ~ak.is_none(new_chi2), update),
+            False,
+        )
+        best_results = {
+            res_var: ak.to_packed(ak.where(
+                update,
+                new_results[res_var],
+                best_results[res_var],
+            ))
+            for res_var in best_results
+        }
+
+    return best_results
+
+
+def merge_all(comb_results):
+    """
+    Merge the results of all rounds of `ttbar_combinatorics` at once, choosing
+    the entry with the smallest chi2 for each event. The `comb_results` should be
+    a dictionary mapping each round to its results.
+    """
+    comb_specs = list(comb_results)
+    result_vars = list(comb_results[comb_specs[0]])
+    comb_results_merged = {
+        result_var: ak.to_packed(ak.concatenate(
+            [
+                # note: `ak.singletons` would drop missing values,
+                # misaligning the entries of different rounds
+                comb_result[result_var][:, np.newaxis]
+                for comb_result in comb_results.values()
+            ],
+            axis=1,
+        ))
+        for result_var in result_vars
+    }
+
+    # choose combination with smallest chi2
+    # (first combination if all are missing, like `merge_sequential`)
+    best_comb_idx = ak.from_regular(ak.fill_none(ak.argmin(
+        comb_results_merged["chi2"],
+        axis=1,
+        keepdims=True,
+    ), 0, axis=1), axis=1)
+    best_results = {
+        result_var: ak.firsts(comb_results_merged[result_var][best_comb_idx])
+        for result_var in comb_results_merged
+    }
+
+    return best_results
+
+
+def _to_numpy_masked(arr):
+    """
+    Return the values of a flat, possibly option-type awkward array `arr` as a numpy
+    array (with arbitrary content for missing entries) and a boolean validity mask.
+    """
+    arr = np.ma.asarray(ak.to_numpy(arr, allow_missing=True))
+    return np.ma.getdata(arr), ~np.ma.getmaskarray(arr)
+
+
+class TTbarRecoBuffers:
+    """
+    Preallocated flat numpy buffers holding the ttbar reconstruction results
+    (see `ttbar_combinatorics`) for `n_events` events.
+
+    Results for subsets of events are written in place with `fill`, or merged
+    in place with `merge`, and the buffers are wrapped as awkward arrays only
+    once with `to_ak`. The jet index
+    lists are stored in fixed-width slots with `n_jet_lep_max` and
+    `n_jet_had_max` entries, together with the number of entries used.
+    """
+
+    lv_fields = ("top_lep", "top_had")
+    scalar_fields = {
+        "n_jet_lep": np.uint8,
+        "n_jet_had": np.uint8,
+        "top_lep_chi2": np.float64,
+        "top_had_chi2": np.float64,
+        "chi2": np.float64,
+    }
+    jet_idxs_fields = ("jet_idxs_lep", "jet_idxs_had")
+
+    def __init__(self, n_events: int, n_jet_lep_max: int, n_jet_had_max: int):
+        self.n_events = n_events
+        self.n_merged = 0
+
+        # four-vector components (x, y, z, t) and scalars, with validity masks
+        self.values = {
+            field: np.zeros((n_events, 4), dtype=np.float64)
+            for field in self.lv_fields
+        }
+        self.values.update({
+            field: np.zeros(n_events, dtype=dtype)
+            for field, dtype in self.scalar_fields.items()
+        })
+        self.valid = {
+            field: np.zeros(n_events, dtype=bool)
+            for field in self.values
+        }
+
+        # jet index slots and number of used slots per event
+        self.jet_idxs = {
+            "jet_idxs_lep": np.zeros((n_events, max(1, n_jet_lep_max)), dtype=np.uint8),
+            "jet_idxs_had": np.zeros((n_events, max(1, n_jet_had_max)), dtype=np.uint8),
+        }
+        self.jet_idxs_counts = {
+            field: np.zeros(n_events, dtype=np.int64)
+            for field in self.jet_idxs_fields
+        }
+
+    @classmethod
+    def from_ak(cls, results: dict[str, ak.Array], n_jet_lep_max: int, n_jet_had_max: int):
+        """
+        Create buffers from the `results` dictionary returned by `ttbar_combinatorics`.
+        """
+        inst = cls(len(results["chi2"]), n_jet_lep_max, n_jet_had_max)
+
+        for field in inst.values:
+            arr = results[field]
+            if field in inst.lv_fields:
+                for i, c in enumerate(("x", "y", "z", "t")):
+                    values, inst.valid[field][:] = _to_numpy_masked(arr[c])
+                    inst.values[field][:, i] = values
+            else:
+                inst.values[field][:], inst.valid[field][:] = _to_numpy_masked(arr)
+
+        for field in inst.jet_idxs_fields:
+            # note: missing entries are dropped from the final output anyway
+            arr = ak.drop_none(ak.to_packed(results[field]), axis=1)
+            counts = np.asarray(ak.fill_none(ak.num(arr, axis=1), 0), dtype=np.int64)
+            inst.jet_idxs_counts[field][:] = counts
+            inst.jet_idxs[field][
+                np.repeat(np.arange(inst.n_events), counts),
+                np.asarray(ak.flatten(ak.local_index(arr, axis=1))),
+            ] = np.asarray(ak.flatten(arr))
+
+        return inst
+
+    def _iter_buffers(self):
+        yield from self.values.items()
+        yield from self.valid.items()
+        yield from self.jet_idxs.items()
+        yield from self.jet_idxs_counts.items()
+
+    def _assign(self, event_idxs, other, other_idxs=slice(None)):
+        # copy entries `other_idxs` of all buffers of `other` to positions `event_idxs`
+        for (_, buf), (_, other_buf) in zip(self._iter_buffers(), other._iter_buffers()):
+            buf[event_idxs] = other_buf[other_idxs]
+
+    def _as_buffers(self, results):
+        if isinstance(results, TTbarRecoBuffers):
+            return results
+        return self.from_ak(
+            results,
+            n_jet_lep_max=self.jet_idxs["jet_idxs_lep"].shape[1],
+            n_jet_had_max=self.jet_idxs["jet_idxs_had"].shape[1],
+        )
+
+    def fill(self, event_idxs: np.ndarray, results) -> None:
+        """
+        Write `results` for the events with indices `event_idxs` to the buffers.
+        The `results` can be another `TTbarRecoBuffers` instance or a dictionary
+        as returned by `ttbar_combinatorics`.
+        """
+        self._assign(event_idxs, self._as_buffers(results))
+
+    def merge(self, results) -> None:
+        """
+        Merge `results` for all events (see `fill`) into the buffers in place,
+        replacing the stored entries where the new chi2 is smaller or the stored
+        chi2 is missing (like `merge_sequential`). The first merged results are
+        stored as they are.
+        """
+        if self.n_merged == 0:
+            self.fill(slice(None), results)
+        else:
+            if isinstance(results, TTbarRecoBuffers):
+                chi2, chi2_valid = results.values["chi2"], results.valid["chi2"]
+            else:
+                chi2, chi2_valid = _to_numpy_masked(results["chi2"])
+            update = chi2_valid & (~self.valid["chi2"] | (chi2 < self.values["chi2"]))
+            update_idxs = np.flatnonzero(update)
+
+            # only convert the results for updated events
+            if isinstance(results, TTbarRecoBuffers):
+                self._assign(update_idxs, results, update_idxs)
+            elif len(update_idxs):
+                self.fill(update_idxs, {
+                    field: arr[update_idxs]
+                    for field, arr in results.items()
+                })
+        self.n_merged += 1
+
+    def to_ak(self) -> dict[str, ak.Array]:
+        """
+        Return the buffer contents as a dictionary of awkward arrays, in the
+        same format as the results of `ttbar_combinatorics`.
+        """
+        results = {}
+        for field in self.lv_fields:
+            p4 = self.values[field]
+            results[field] = ak.mask(ak.zip(
+                {c: p4[:, i] for i, c in enumerate(("x", "y", "z", "t"))},
+                with_name="LorentzVector",
+                behavior=coffea.nanoevents.methods.nanoaod.behavior,
+            ), self.valid[field])
+
+        for field in self.scalar_fields:
+            results[field] = ak.mask(self.values[field], self.valid[field])
+
+        for field in self.jet_idxs_fields:
+            counts = self.jet_idxs_counts[field]
+            idxs = self.jet_idxs[field]
+            keep = np.arange(idxs.shape[1]) < counts[:, None]
+            results[field] = ak.unflatten(idxs[keep], counts)
+
+        return results
+
+
 @producer(
     uses={
         choose_lepton, neutrino_candidates, category_ids,
@@ -44,14 +455,23 @@ maybe_import("coffea.nanoevents.methods.nanoaod")
         "TTbar.*",
     },
 )
+@chunk_memo()
 def ttbar(
     self: Producer,
     events: ak.Array,
     # algorithm tweaks
     merge_mode="eager",
+    prune_hypotheses=False,
+    # memory management
+    gc_policy="rss",
+    gc_rss_threshold=256 * 1024 ** 2,
     # profiling/reporting options
     profile_memory=False,
+    profile_memory_interval=None,
     profile_time=True,
+    profile_report_dir=None,
+    profile_calls=None,
+    profile_calls_sections=None,
     verbose_level=1,
     **kwargs,
 ) -> ak.Array:
@@ -62,12 +482,79 @@ def ttbar(
     in terms of a chi2 metric. The configuration with the lowest
     chi2 out of all possibilities is selected.
 
+    The *merge_mode* determines how the best hypotheses are found:
+      - ``"eager"``: build the hypotheses for each jet multiplicity round as awkward arrays,
+        and merge the results with the previous best results after each round
+      - ``"lazy"``: like ``"eager"``, but only merge the results after all rounds
+      - ``"inplace"``: like ``"eager"``, but merge the results of each round in place into
+        preallocated numpy buffers with fixed-width jet index slots (see `TTbarRecoBuffers`),
+        avoiding the reallocation of all result arrays after each round
+      - ``"kernel"``: loop over all hypotheses in a compiled kernel operating on the flat
+        input arrays, keeping only the best hypothesis per event (the hypotheses are never
+        materialized). The hypotheses are visited in the same order and evaluated in the
+        same floating-point types as in the other modes. The four-vector sums over all jet
+        subsets are precomputed once per event and shared between all rounds, which makes
+        this mode suitable for large jet multiplicity ranges.
+      - ``"dense"``: group events into buckets with the same numbers of jets and neutrino
+        candidates, and evaluate the hypotheses for each bucket on regular numpy arrays
+        (the runtime of each bucket is reported separately)
+
+    If *prune_hypotheses* is set (only supported for *merge_mode* ``"kernel"``), the
+    kernel skips hypotheses that are guaranteed not to improve on the best hypothesis
+    found so far, using lower bounds on the chi2 terms (branch-and-bound). The jet
+    multiplicity rounds are visited in order of their lower bound. The results are
+    identical to those of the exhaustive search.
+
+    After each profiled code section, garbage collection is run according to the *gc_policy*
+    (see `GCController`): ``"always"``, ``"outer"`` (only after the sub-chunks and outer
+    sections), ``"rss"`` (only if the RSS has grown by more than *gc_rss_threshold* bytes
+    since the last collection) or ``"never"``. The number of collections and the time spent
+    in them are reported at the end.
+
+    The memory use of the profiled code sections is measured if *profile_memory* is set,
+    either via `tracemalloc` (``True`` or ``"tracemalloc"``, see `MemoryMixin`), or via the
+    RSS of the process (``"rss"``, see `RSSMemoryMixin`), which has a negligible overhead and
+    can be left enabled in production. In the latter case, the RSS is sampled in a background
+    thread every *profile_memory_interval* seconds (if given) to find the peak of each section.
+
+    If *profile_report_dir* is given (defaults to the environment variable ``MTT_PROFILE_DIR``),
+    the profiled code sections are recorded as a span tree and written to this directory for
+    each chunk of events, as a JSON report and a Chrome trace file (see `SpanRecorder`). The
+    reports of many chunks can be combined with `merge_span_reports`. When processing the
+    sub-chunks in worker processes, only the sections run in the main process are recorded.
+
+    The function calls within the profiled code sections can be profiled by setting
+    *profile_calls* (defaults to the environment variable ``MTT_PROFILE_CALLS``) to
+    ``"cprofile"`` or ``"sample"`` (see `CallProfileMixin`), optionally only for the sections
+    matching one of the name patterns in *profile_calls_sections* (defaults to the
+    comma-separated patterns in ``MTT_PROFILE_CALLS_SECTIONS``, e.g. ``"sum over*"``). The
+    ``.pstats`` or ``.collapsed`` files are written to the directory given by
+    ``MTT_PROFILE_CALLS_DIR``, or next to the local task outputs otherwise.
+
+    While processing, counters and gauges (see `Metrics`) are collected for the number of
+    events per regime and jet multiplicity, the number of hypotheses evaluated per jet
+    multiplicity round, and the size of the intermediate arrays (``"eager"``, ``"lazy"`` and
+    ``"inplace"`` modes) or dense hypothesis arrays (``"dense"`` mode). They are summarized at
+    the end, and added to the root span of the profiling report. If a *profile_report_dir* is
+    given, the totals over all chunks processed for the task branch are also written to a
+    file ``<producer>_<shift>_<branch>.metrics.json`` next to the reports.
+
     Parameters:
       - *n_jet_max*: limit the number of jets per event to at most this number
       - *n_jet_lep_range*: minimum and maximum number of jets that can be assigned to the leptonic top decay
       - *n_jet_had_range*: minimum and maximum number of jets that can be assigned to the hadronic top decay
       - *n_jet_ttbar_range*: minimum and maximum number of jets that can be assigned to the ttbar decay overall
         (if *None* or omitted, will be inferred from *n_jet_lep_range* and *n_jet_had_range*)
+      - *max_chunk_bytes*: memory budget for processing events at once (sub-chunks); the
+        sub-chunks are cut according to the peak memory predicted from the number of jets and
+        neutrino candidates in each event (see `ttbar_reco_memory`)
+      - *max_chunk_size*: maximum number of events to process at once (optional if
+        *max_chunk_bytes* is given)
+      - *executor*: optional dictionary with settings for processing the sub-chunks in parallel
+        worker processes (see `mtt.util.map_chunks`): the number of processes (*n_workers*),
+        the multiprocessing start method (*start_method*, only ``"fork"`` is supported by this
+        producer) and the maximum number of sub-chunks in flight (*max_in_flight*) bounding the
+        memory use; if *None* or omitted, the sub-chunks are processed serially
 
     The parameter values can be provided as keyword arguments or via a configuration entry:
 
@@ -78,23 +565,35 @@ def ttbar(
             "n_jet_lep_range": (1, 2),
             "n_jet_had_range": (2, 6),
             "n_jet_ttbar_range": (3, 6),
+            "max_chunk_bytes": 1024 ** 3,
         }
 
     """
     # -- obtain settings from kwargs or config
     settings = self.config_inst.x.ttbar_reco_settings
-    for setting in ("n_jet_max", "n_jet_lep_range", "n_jet_had_range", "n_jet_ttbar_range", "max_chunk_size"):
+    optional_settings = ("n_jet_ttbar_range", "max_chunk_size", "max_chunk_bytes", "executor")
+    for setting in (
+        "n_jet_max", "n_jet_lep_range", "n_jet_had_range", *optional_settings,
+    ):
         setting_value = kwargs.get(setting, settings.get(setting, None))
-        if setting_value is None and setting != "n_jet_ttbar_range":
+        if setting_value is None and setting not in optional_settings:
             raise ValueError(f"setting '{setting}' must be provided via config or kwargs.")
         settings[setting] = setting_value
 
+    if settings["max_chunk_size"] is None and settings["max_chunk_bytes"] is None:
+        raise ValueError(
+            "at least one of the settings 'max_chunk_size' and 'max_chunk_bytes' "
+            "must be provided via config or kwargs.",
+        )
+
     # store settings in local variables
     n_jet_max = settings["n_jet_max"]
     n_jet_ttbar_range = settings["n_jet_ttbar_range"]
     n_jet_lep_range = settings["n_jet_lep_range"]
     n_jet_had_range = settings["n_jet_had_range"]
     max_chunk_size = settings["max_chunk_size"]
+    max_chunk_bytes = settings["max_chunk_bytes"]
+    executor = dict(settings["executor"] or {})
 
     # resolve max chunk size if dynamic
     if callable(max_chunk_size):
@@ -113,10 +612,66 @@ def ttbar(
         assert range_par[0] >= 1
         assert range_par[1] <= n_jet_max
 
+    # validate executor settings
+    unknown_executor_settings = set(executor) - {"n_workers", "start_method", "max_in_flight"}
+    if unknown_executor_settings:
+        raise ValueError(f"unknown executor settings: {', '.join(sorted(unknown_executor_settings))}")
+    n_workers = executor["n_workers"] = executor.get("n_workers") or 0
+    # sub-chunk function is a closure and needs to be inherited by workers
+    assert executor.get("start_method", "fork") == "fork", "only start method 'fork' is supported"
+
     # validate merging mode
-    assert merge_mode in ("eager", "lazy"), f"invalid merge_mode '{merge_mode}'"
+    assert merge_mode in ("eager", "lazy", "inplace", "kernel", "dense"), f"invalid merge_mode '{merge_mode}'"
+    if merge_mode == "kernel":
+        # per-event tables for all jet subsets grow as 2^n_jet_max
+        assert n_jet_max <= 20, f"n_jet_max={n_jet_max} too large for merge_mode 'kernel'"
+    assert not prune_hypotheses or merge_mode == "kernel", (
+        "hypothesis pruning is only supported for merge_mode 'kernel'"
+    )
     self.task.publish_message(f"merge mode is '{merge_mode}'")
 
+    # validate memory profiling mode
+    if profile_memory is True:
+        profile_memory = "tracemalloc"
+    assert profile_memory in (False, None, "tracemalloc", "rss"), (
+        f"invalid profile_memory '{profile_memory}'"
+    )
+
+    # garbage collection after profiled sections (sub-chunks are at nesting depth 1)
+    gc_controller = GCController(gc_policy, rss_threshold=gc_rss_threshold, max_depth=1)
+
+    # profiling of function calls in selected sections
+    if profile_calls is None:
+        profile_calls = os.getenv("MTT_PROFILE_CALLS") or False
+    if profile_calls_sections is None and os.getenv("MTT_PROFILE_CALLS_SECTIONS"):
+        profile_calls_sections = os.getenv("MTT_PROFILE_CALLS_SECTIONS").split(",")
+    profile_calls_dir = None
+    if profile_calls:
+        profile_calls_dir = os.getenv("MTT_PROFILE_CALLS_DIR")
+        if not profile_calls_dir and hasattr(self.task, "local_path"):
+            profile_calls_dir = self.task.local_path(f"call_profiles_{self.task.branch}")
+
+    # recorder for structured profiling reports
+    if profile_report_dir is None:
+        profile_report_dir = span_report_dir()
+    recorder = None
+    if profile_report_dir:
+        shift_inst = getattr(self.task, "local_shift_inst", None) or getattr(self.task, "global_shift_inst", None)
+        recorder = SpanRecorder(meta={
+            "producer": self.cls_name,
+            "config": self.config_inst.name,
+            "dataset": self.dataset_inst.name,
+            "shift": getattr(shift_inst, "name", None),
+            "branch": getattr(self.task, "branch", None),
+            "merge_mode": merge_mode,
+            "n_events": len(events),
+            "pid": os.getpid(),
+        })
+        root_span = recorder.open(self.cls_name, n_events=len(events))
+
+    # counters and gauges for monitoring the reconstruction
+    metrics = Metrics()
+
     # load coffea behaviors for simplified arithmetic with vectors
     events = ak.Array(events, behavior=coffea.nanoevents.methods.nanoaod.behavior)
     events["Jet"] = ak.with_name(events.Jet, "PtEtaPhiMLorentzVector")
@@ -140,95 +695,25 @@ def ttbar(
     jet = events.Jet[ak.local_index(events.Jet) < n_jet_max]
 
     # well separated from AK8 jets (deltaR >= 1.2)
-    delta_r_jet_topjet = ak.min(jet.metric_table(topjet), axis=2)
+    delta_r_jet_topjet = delta_r_min(jet, topjet)
     jet_isolated = ak.fill_none(delta_r_jet_topjet > 1.2, True)
     jet = jet[jet_isolated]
 
-    # split jet array into boosted/resolved cases
-    jet_resolved = ak.where(
-        is_boosted,
-        [[]],
-        jet,
-    )
-    jet_boosted = ak.where(
-        ~is_boosted,
-        [[]],
-        jet,
-    )
-
-    # pack arrays to ensure contiguous memory
-    # and trim unreachable entries
-    jet_resolved = ak.to_packed(jet_resolved)
-    jet_boosted = ak.to_packed(jet_boosted)
+    # split events into boosted/resolved cases
+    is_boosted_np = np.asarray(is_boosted)
+    event_idxs = {
+        "resolved": np.flatnonzero(~is_boosted_np),
+        "boosted": np.flatnonzero(is_boosted_np),
+    }
 
     # make lorentz vectors
     topjet_lv = lv_xyzt(topjet)
-    jet_lv = {
-        "resolved": lv_xyzt(jet_resolved),
-        "boosted": lv_xyzt(jet_boosted),
-    }
+    jet_lv = lv_xyzt(jet)
     lepton_lv = lv_xyzt(ak.unflatten(lepton, counts=1))
     nu_cands_lv = lv_xyzt(nu_cands)
 
     # -- handle combinatorics
 
-    # helper functions for choosing best-chi2 combination
-    # after *each round* of combinatorics
-    def merge_sequential(best_results, new_results):
-        if best_results is None:
-            best_results = new_results
-        else:
-            # update results if chi2 decreases
-            new_chi2, best_chi2 = new_results["chi2"], best_results["chi2"]
-            update = (new_chi2 < best_chi2)
-            # handle missing values
-            update = ak.fill_none(
-                ak.where(ak.is_none(update), ~ak.is_none(new_chi2), update),
-                False,
-            )
-            best_results = {
-                res_var: ak.to_packed(ak.where(
-                    update,
-                    new_results[res_var],
-                    best_results[res_var],
-                ))
-                for res_var in best_results
-            }
-
-        return best_results
-
-    # helper functions for choosing best-chi2 combination
-    # after *all rounds* of combinatorics
-    def merge_all(comb_results):
-        comb_specs = list(comb_results)
-        result_vars = list(comb_results[comb_specs[0]])
-        comb_results_merged = {
-            result_var: ak.to_packed(ak.concatenate(
-                [
-                    ak.singletons(
-                        comb_result[result_var],
-                        axis=0,
-                    )
-                    for comb_result in comb_results.values()
-                ],
-                axis=1,
-            ))
-            for result_var in result_vars
-        }
-
-        # choose combination with smallest chi2
-        best_comb_idx = ak.argmin(
-            comb_results_merged["chi2"],
-            axis=1,
-            keepdims=True,
-        )
-        best_results = {
-            result_var: ak.firsts(comb_results_merged[result_var][best_comb_idx])
-            for result_var in comb_results_merged
-        }
-
-        return best_results
-
     # timer contexts for monitoring runtime
     def profile_task(name, min_verbose_level=0, indent_level=0, **kwargs):
         """
@@ -246,19 +731,92 @@ def ttbar(
             # indent messages for structured output
             indent_str="  " * indent_level,
             n_cols_text=max(50, 80 - 2 * indent_level),
-            # trigger manual garbage collection after task
+            # trigger manual garbage collection after task (depending on policy)
             gc_on_exit=True,
+            gc_controller=gc_controller,
             # enable/disable profiling metrics
-            prof_mem=profile_memory,
+            prof_mem=(profile_memory == "tracemalloc"),
+            prof_rss=(profile_memory == "rss"),
+            rss_sample_interval=profile_memory_interval,
             prof_time=profile_time,
+            # record span for structured reports
+            recorder=recorder,
+            # profile function calls
+            prof_calls=(
+                profile_calls
+                if profile_calls_sections is None or multi_match(name, profile_calls_sections)
+                else False
+            ),
+            prof_calls_dir=profile_calls_dir,
             # allow users to supply other kwargs
             **kwargs,
         )
 
+    # helper function for building the leptonic top hypotheses for a given number
+    # of jets; the results are stored in `lep_cache` and shared between all rounds
+    # with the same `n_jet_lep`
+    def leptonic_hypotheses(jet_lv, lepton_lv, nu_cands_lv, n_jet_lep, regime, lep_cache):
+        """
+        Return the leptonic top hypotheses for all choices of lepton, neutrino candidate,
+        and combination of `n_jet_lep` jets, together with their masses and chi2 terms.
+
+        The hypotheses are flattened per event in the order (lepton, neutrino, jet
+        combination), with the jet combinations ordered as in `ak.argcombinations`.
+        The chi2 terms are computed from the cached masses on first use.
+        """
+        if n_jet_lep not in lep_cache:
+            with profile_task(
+                f"construct leptonic top hypotheses ({n_jet_lep},)",
+                indent_level=2,
+                min_verbose_level=2,
+            ):
+                (jet_idx_comb_lep,) = ak_arg_grouped_combinations(
+                    jet_lv,
+                    group_sizes=(n_jet_lep,),
+                )
+                lnu_jetcomb_idx_prod = ak_argcartesian(
+                    lepton_lv,
+                    nu_cands_lv,
+                    jet_idx_comb_lep[0],
+                    as_type=np.uint32,
+                )
+                jet_sum_lep = lv_sum((
+                    jet_lv[jet_idx]
+                    for jet_idx in jet_idx_comb_lep
+                ))
+                hyp_top_lep = (
+                    lepton_lv[lnu_jetcomb_idx_prod[0]] +
+                    nu_cands_lv[lnu_jetcomb_idx_prod[1]] +
+                    jet_sum_lep[lnu_jetcomb_idx_prod[2]]
+                )
+                lep_cache[n_jet_lep] = {
+                    "top_lep": hyp_top_lep,
+                    "mass": hyp_top_lep.mass,
+                    "n_nu": ak.num(nu_cands_lv, axis=1),
+                    "n_comb": ak.num(jet_idx_comb_lep[0], axis=1),
+                }
+
+        cached = lep_cache[n_jet_lep]
+        if "chi2" not in cached:
+            chi2_pars = self.config_inst.x.chi2_parameters[regime]
+            cached["chi2"] = chi2_term(cached["mass"], chi2_pars.m_lep, chi2_pars.s_lep)
+
+        return cached
+
     # helper function for reconstructing ttbar decay
     # builds all possible ways of arranging combinations into
     # groups with fixed sizes (`n_jets`)
-    def ttbar_combinatorics(jet_lv, topjet_lv, topjet_msoftdrop, lepton_lv, nu_cands_lv, n_jets, regime="resolved"):
+    def ttbar_combinatorics(
+        jet_lv,
+        topjet_lv,
+        topjet_msoftdrop,
+        lepton_lv,
+        nu_cands_lv,
+        n_jets,
+        regime="resolved",
+        lep_cache=None,
+        metrics=None,
+    ):
         """
         Reconstruct the leptonically and hadronically decaying top quarks
         from combinations of final-state objects.
@@ -282,7 +840,17 @@ def ttbar(
         top quark is reconstructed from AK4 jets. In this case, `n_jets` should be a
         tuple with a single element (`n_jet_lep`), indicating how many jets should be mapped
         to the leptonically decaying top quark.
+
+        The leptonic top hypotheses are taken from `lep_cache` (a dictionary keyed
+        by `n_jet_lep`, see `leptonic_hypotheses`) if given, so that calls for
+        different hadronic jet multiplicities on the same events can share them.
+
+        If `metrics` (see `Metrics`) is given, the number of evaluated hypotheses
+        and the size of the intermediate arrays are recorded.
         """
+        if lep_cache is None:
+            lep_cache = {}
+
         # validate inputs
         if regime == "resolved":
             assert len(n_jets) == 2, (
@@ -310,10 +878,10 @@ def ttbar(
             indent_level=2,
             min_verbose_level=2,
         ):
-            jet_idx_combs = ak_arg_grouped_combinations(
+            jet_idx_combs, jet_group_comb_idxs = ak_arg_grouped_combinations(
                 jet_lv,
                 group_sizes=n_jets,
-                axis=1,
+                return_group_indices=True,
             )
             if is_boosted_regime:
                 jet_idx_comb_lep = jet_idx_combs[0]
@@ -327,10 +895,12 @@ def ttbar(
             indent_level=2,
             min_verbose_level=2,
         ):
+            # note: number of jet combinations can exceed the range of `uint8`
             lnu_jetcomb_idx_prod = ak_argcartesian(
                 lepton_lv,
                 nu_cands_lv,
                 jet_idx_comb_lep[0],
+                as_type=np.uint32,
             )
 
         # retrieve chi2 parameters from config
@@ -338,34 +908,22 @@ def ttbar(
 
         # -- set up hypotheses for leptonically decaying tops
 
-        with profile_task(
-            f"sum over leptonic jets {n_jets}",
-            indent_level=2,
-            min_verbose_level=2,
-        ):
-            jet_sum_lep = lv_sum((
-                jet_lv[jet_idx]
-                for jet_idx in jet_idx_comb_lep
-            ))
+        # look up (or build) leptonic hypotheses shared between rounds
+        lep_hyps = leptonic_hypotheses(jet_lv, lepton_lv, nu_cands_lv, n_jet_lep, regime, lep_cache)
 
         with profile_task(
-            f"construct leptonic top hypotheses {n_jets}",
+            f"gather leptonic top hypotheses {n_jets}",
             indent_level=2,
             min_verbose_level=2,
         ):
-            hyp_top_lep = (
-                lepton_lv[lnu_jetcomb_idx_prod[0]] +
-                nu_cands_lv[lnu_jetcomb_idx_prod[1]] +
-                jet_sum_lep[lnu_jetcomb_idx_prod[2]]
+            # position of each hypothesis in the cached leptonic hypotheses
+            lep_hyp_idx = (
+                (lnu_jetcomb_idx_prod[0] * lep_hyps["n_nu"] + lnu_jetcomb_idx_prod[1]) *
+                lep_hyps["n_comb"] +
+                jet_group_comb_idxs[0][lnu_jetcomb_idx_prod[2]]
             )
-
-        # calculate hypothesis chi2 scores
-        with profile_task(
-            f"calculate chi2 for hypotheses {n_jets}",
-            indent_level=2,
-            min_verbose_level=2,
-        ):
-            hyp_top_lep_chi2 = ((hyp_top_lep.mass - chi2_pars.m_lep) / chi2_pars.s_lep) ** 2
+            hyp_top_lep = lep_hyps["top_lep"][lep_hyp_idx]
+            hyp_top_lep_chi2 = lep_hyps["chi2"][lep_hyp_idx]
             # store number of jets matched to leptonic decay
             hyp_n_jet_lep = ak.ones_like(hyp_top_lep_chi2, dtype=np.uint8) * n_jet_lep
 
@@ -394,7 +952,7 @@ def ttbar(
                 indent_level=2,
                 min_verbose_level=2,
             ):
-                hyp_top_had_chi2 = ((hyp_top_had.mass - chi2_pars.m_had) / chi2_pars.s_had) ** 2
+                hyp_top_had_chi2 = chi2_term(hyp_top_had.mass, chi2_pars.m_had, chi2_pars.s_had)
                 # store number of jets matched to hadronic decay
                 hyp_n_jet_had = ak.ones_like(hyp_top_had_chi2, dtype=np.uint8) * n_jet_had
 
@@ -426,7 +984,7 @@ def ttbar(
             # store final hadronic top
             if is_boosted_regime:
                 top_had = ak.firsts(topjet_lv)
-                top_had_chi2 = ((ak.firsts(topjet_msoftdrop) - chi2_pars.m_had) / chi2_pars.s_had) ** 2
+                top_had_chi2 = chi2_term(ak.firsts(topjet_msoftdrop), chi2_pars.m_had, chi2_pars.s_had)
                 n_jet_had = ak.zeros_like(n_jet_lep, dtype=np.uint8)
                 # array of empty lists
                 jet_idxs_had = ak.values_astype(
@@ -451,6 +1009,25 @@ def ttbar(
             # store final chi2 score
             chi2 = top_had_chi2 + top_lep_chi2
 
+        # record number of hypotheses and size of intermediate arrays
+        if metrics is not None:
+            n_hyps = int(ak.count(hyp_top_chi2, axis=None))
+            metrics.count(f"{regime} hypotheses", n_hyps)
+            metrics.count(f"{regime} hypotheses {n_jets}", n_hyps)
+            nbytes = ak_nbytes(
+                jet_idx_combs,
+                jet_group_comb_idxs,
+                lnu_jetcomb_idx_prod,
+                lep_hyp_idx,
+                hyp_top_lep,
+                hyp_top_lep_chi2,
+                hyp_n_jet_lep,
+                hyp_top_chi2,
+                () if is_boosted_regime else (hyp_top_had, hyp_top_had_chi2, hyp_n_jet_had),
+            )
+            metrics.count(f"{regime} intermediate bytes", nbytes)
+            metrics.gauge(f"{regime} peak intermediate bytes", nbytes)
+
         return {
             "top_had": top_had,
             "top_lep": top_lep,
@@ -463,16 +1040,297 @@ def ttbar(
             "chi2": chi2,
         }
 
-    # threads over all allowed multiplicities of jets
-    # assigned to the leptonic and hadronic top quark decays
-    def main_loop(
+    # helper function for reconstructing ttbar decay with a compiled kernel,
+    # evaluating all jet multiplicity rounds in a single pass
+    def ttbar_combinatorics_kernel(
         jet_lv,
         topjet_lv,
         topjet_msoftdrop,
         lepton_lv,
         nu_cands_lv,
-        regime,
+        rounds,
+        regime="resolved",
+        metrics=None,
     ):
+        """
+        Like `ttbar_combinatorics`, but loop over the hypotheses for all jet multiplicity
+        rounds in `rounds` (a list of `n_jets` tuples) in a compiled kernel operating on the
+        flat input arrays. Only the best hypothesis per event is kept in memory.
+
+        The hypotheses are visited in the same order as when calling `ttbar_combinatorics`
+        for each round in `rounds` and merging them, and the four-vectors and chi2 terms
+        are evaluated in the floating-point types of the inputs, like for the awkward arrays.
+        """
+        is_boosted_regime = (regime == "boosted")
+
+        # retrieve chi2 parameters from config
+        chi2_pars = self.config_inst.x.chi2_parameters[regime]
+
+        # boosted regime: chi2 term for hadronic top from AK8 jet
+        top_had_chi2_topjet = chi2_term(ak.firsts(topjet_msoftdrop), chi2_pars.m_had, chi2_pars.s_had)
+
+        # pad multiplicities for the boosted regime (no jets mapped to hadronic decay)
+        rounds = np.array([
+            (n_jets[0], 0 if is_boosted_regime else n_jets[1])
+            for n_jets in rounds
+        ], dtype=np.int64)
+
+        # flat inputs; the chi2 parameters are converted to the types in which the
+        # chi2 terms are evaluated, like the Python floats in `chi2_term`
+        jet_p4 = _flat_p4(jet_lv)
+        lep_p4 = _flat_p4(lepton_lv)
+        nu_p4 = _flat_p4(nu_cands_lv)
+        lep_dtype = np.result_type(lep_p4, nu_p4, jet_p4)
+
+        with profile_task(
+            f"run ttbar chi2 kernel for {len(rounds)} combination multiplicities",
+            indent_level=1,
+            min_verbose_level=1,
+        ):
+            (
+                best_round,
+                jet_idxs_lep,
+                jet_idxs_had,
+                top_lep,
+                top_had,
+                top_lep_chi2,
+                top_had_chi2,
+                chi2,
+                n_hyps,
+                n_pruned,
+            ) = ttbar_chi2_kernel(
+                _flat_offsets(jet_lv),
+                jet_p4,
+                lep_p4,
+                _flat_offsets(nu_cands_lv),
+                nu_p4,
+                np.asarray(ak.fill_none(top_had_chi2_topjet, np.nan)),
+                rounds,
+                np.array([chi2_pars.m_lep, chi2_pars.s_lep], dtype=lep_dtype),
+                np.array([chi2_pars.m_had, chi2_pars.s_had], dtype=jet_p4.dtype),
+                prune_hypotheses,
+            )
+
+        # record number of hypotheses (per round) and of pruned hypotheses
+        if metrics is not None:
+            for (n_jet_lep, n_jet_had), n_round_hyps in zip(rounds, n_hyps.tolist()):
+                n_jets = (int(n_jet_lep),) if is_boosted_regime else (int(n_jet_lep), int(n_jet_had))
+                metrics.count(f"{regime} hypotheses", n_round_hyps)
+                metrics.count(f"{regime} hypotheses {n_jets}", n_round_hyps)
+            if prune_hypotheses:
+                metrics.count(f"{regime} hypotheses pruned", int(n_pruned))
+
+        # report on number of pruned hypotheses
+        n_hyps = int(n_hyps.sum())
+        if prune_hypotheses and verbose_level >= 1:
+            self.task.publish_message(
+                f"  pruned {n_pruned}/{n_hyps} hypotheses "
+                f"({100 * n_pruned / max(n_hyps, 1):.1f}%)",
+            )
+
+        # convert kernel outputs to awkward arrays
+        with profile_task(
+            "convert kernel outputs",
+            indent_level=1,
+            min_verbose_level=2,
+        ):
+            results = _flat_results_to_ak(
+                best_round,
+                jet_idxs_lep,
+                jet_idxs_had,
+                top_lep,
+                top_had,
+                top_lep_chi2,
+                top_had_chi2,
+                chi2,
+                rounds,
+                topjet_lv=topjet_lv if is_boosted_regime else None,
+                top_had_chi2_topjet=top_had_chi2_topjet,
+            )
+
+        return results
+
+    # helper function for reconstructing ttbar decay with dense arrays,
+    # processing events in buckets of equal jet and neutrino multiplicity
+    def ttbar_combinatorics_dense(
+        jet_lv,
+        topjet_lv,
+        topjet_msoftdrop,
+        lepton_lv,
+        nu_cands_lv,
+        rounds,
+        regime="resolved",
+        metrics=None,
+    ):
+        """
+        Like `ttbar_combinatorics`, but group the events into buckets with the same
+        number of jets and neutrino candidates. Within each bucket, the hypotheses
+        for each round in `rounds` (a list of `n_jets` tuples) are evaluated on
+        regular numpy arrays, using the cached index table for the multiplicity
+        (see `grouped_combinations_table`). The results are scattered back to the
+        original event order.
+
+        As in `ttbar_combinatorics_kernel`, the rounds and hypotheses are evaluated in the
+        same order and floating-point types as when calling `ttbar_combinatorics` for each
+        round in `rounds` and merging them.
+        """
+        is_boosted_regime = (regime == "boosted")
+
+        # retrieve chi2 parameters from config
+        chi2_pars = self.config_inst.x.chi2_parameters[regime]
+
+        # boosted regime: chi2 term for hadronic top from AK8 jet
+        top_had_chi2_topjet = chi2_term(ak.firsts(topjet_msoftdrop), chi2_pars.m_had, chi2_pars.s_had)
+        top_had_chi2_fixed = np.asarray(ak.fill_none(top_had_chi2_topjet, np.nan))
+
+        # pad multiplicities for the boosted regime (no jets mapped to hadronic decay)
+        rounds = np.array([
+            (n_jets[0], 0 if is_boosted_regime else n_jets[1])
+            for n_jets in rounds
+        ], dtype=np.int64)
+
+        # flat inputs
+        n_jet = np.asarray(ak.num(jet_lv, axis=1))
+        n_nu = np.asarray(ak.num(nu_cands_lv, axis=1))
+        jet_offsets, jet_p4 = _flat_offsets(jet_lv), _flat_p4(jet_lv)
+        nu_offsets, nu_p4 = _flat_offsets(nu_cands_lv), _flat_p4(nu_cands_lv)
+        lep_p4 = _flat_p4(lepton_lv)
+
+        # output buffers, in the floating-point types of the awkward-array implementation
+        n_events = len(n_jet)
+        lep_dtype = np.result_type(lep_p4, nu_p4, jet_p4)
+        had_chi2_dtype = np.result_type(jet_p4, top_had_chi2_fixed)
+        best_round = np.full(n_events, -1, dtype=np.int64)
+        jet_idxs_lep = np.zeros((n_events, max(1, rounds[:, 0].max())), dtype=np.uint8)
+        jet_idxs_had = np.zeros((n_events, max(1, rounds[:, 1].max())), dtype=np.uint8)
+        top_lep = np.zeros((n_events, 4), dtype=lep_dtype)
+        top_had = np.zeros((n_events, 4), dtype=jet_p4.dtype)
+        top_lep_chi2 = np.zeros(n_events, dtype=lep_dtype)
+        top_had_chi2 = np.zeros(n_events, dtype=had_chi2_dtype)
+        chi2 = np.zeros(n_events, dtype=np.result_type(lep_dtype, had_chi2_dtype))
+
+        # loop over multiplicity buckets
+        buckets = sorted(set(zip(n_jet.tolist(), n_nu.tolist())))
+        for n_jet_bucket, n_nu_bucket in buckets:
+            # no hypotheses without jets or neutrino candidates
+            if n_jet_bucket == 0 or n_nu_bucket == 0:
+                continue
+
+            event_idx = np.flatnonzero((n_jet == n_jet_bucket) & (n_nu == n_nu_bucket))
+            n_bucket = len(event_idx)
+            with profile_task(
+                f"bucket with {n_jet_bucket} jets, {n_nu_bucket} neutrino candidates ({n_bucket} events)",
+                indent_level=1,
+                min_verbose_level=1,
+            ):
+                # regular arrays of shape (n_bucket, n_objects, 4)
+                jets = jet_p4[jet_offsets[event_idx][:, None] + np.arange(n_jet_bucket)]
+                nus = nu_p4[nu_offsets[event_idx][:, None] + np.arange(n_nu_bucket)]
+                lep_nu = lep_p4[event_idx][:, None, :] + nus
+
+                # sum over jets in order of increasing position (like `lv_sum`)
+                def jet_sum(table, cols):
+                    result = jets[:, table[:, cols[0]]]
+                    for col in cols[1:]:
+                        result = result + jets[:, table[:, col]]
+                    return result
+
+                # leptonic hypotheses and their chi2 terms for each `n_jet_lep`,
+                # shape (n_bucket, n_nu, n_lep_combs[, 4]), shared between rounds
+                lep_cache = {}
+
+                for i_round, (n_jet_lep, n_jet_had) in enumerate(rounds):
+                    if n_jet_lep + n_jet_had > n_jet_bucket:
+                        continue
+
+                    # jet index arrangements of shape (n_combs, n_jet_lep + n_jet_had)
+                    # and position of the leptonic jet combination for each arrangement
+                    group_sizes = (n_jet_lep,) if is_boosted_regime else (n_jet_lep, n_jet_had)
+                    table, group_comb_idxs = grouped_combinations_table(
+                        n_jet_bucket,
+                        group_sizes,
+                        return_group_indices=True,
+                    )
+                    lep_comb_idx = group_comb_idxs[:, 0]
+                    n_combs = len(table)
+
+                    if n_jet_lep not in lep_cache:
+                        lep_table = grouped_combinations_table(n_jet_bucket, (n_jet_lep,))
+                        lep_hyps = lep_nu[:, :, None, :] + jet_sum(lep_table, range(n_jet_lep))[:, None, :, :]
+                        lep_cache[n_jet_lep] = (
+                            lep_hyps,
+                            chi2_term(_p4_mass(lep_hyps), chi2_pars.m_lep, chi2_pars.s_lep),
+                        )
+                    lep_hyps, lep_hyps_chi2 = lep_cache[n_jet_lep]
+
+                    # leptonic chi2 terms, shape (n_bucket, n_nu, n_combs)
+                    hyp_top_lep_chi2 = lep_hyps_chi2[:, :, lep_comb_idx]
+
+                    if is_boosted_regime:
+                        hyp_top_chi2 = hyp_top_lep_chi2
+                    else:
+                        # hadronic hypotheses, shape (n_bucket, n_combs, 4)
+                        hyp_top_had = jet_sum(table, range(n_jet_lep, n_jet_lep + n_jet_had))
+                        hyp_top_had_chi2 = chi2_term(_p4_mass(hyp_top_had), chi2_pars.m_had, chi2_pars.s_had)
+                        hyp_top_chi2 = hyp_top_lep_chi2 + hyp_top_had_chi2[:, None, :]
+
+                    # record number of hypotheses and size of hypothesis arrays
+                    if metrics is not None:
+                        n_jets = (int(n_jet_lep),) if is_boosted_regime else (int(n_jet_lep), int(n_jet_had))
+                        metrics.count(f"{regime} hypotheses", hyp_top_chi2.size)
+                        metrics.count(f"{regime} hypotheses {n_jets}", hyp_top_chi2.size)
+                        nbytes = hyp_top_chi2.nbytes + (
+                            0 if is_boosted_regime else hyp_top_had.nbytes + hyp_top_had_chi2.nbytes
+                        )
+                        metrics.count(f"{regime} intermediate bytes", nbytes)
+                        metrics.gauge(f"{regime} peak intermediate bytes", nbytes)
+
+                    # best hypothesis in round
+                    idx = _argmin_like_ak(hyp_top_chi2.reshape(n_bucket, -1))
+                    idx_nu, idx_comb = np.divmod(idx, n_combs)
+                    idx_bucket = np.arange(n_bucket)
+                    round_top_lep_chi2 = hyp_top_lep_chi2[idx_bucket, idx_nu, idx_comb]
+                    if is_boosted_regime:
+                        round_top_had_chi2 = top_had_chi2_fixed[event_idx]
+                    else:
+                        round_top_had_chi2 = hyp_top_had_chi2[idx_bucket, idx_comb]
+                    round_chi2 = round_top_had_chi2 + round_top_lep_chi2
+
+                    # update results if chi2 decreases
+                    update = (best_round[event_idx] < 0) | (round_chi2 < chi2[event_idx])
+                    upd_idx = event_idx[update]
+                    upd_comb = idx_comb[update]
+                    best_round[upd_idx] = i_round
+                    top_lep[upd_idx] = lep_hyps[idx_bucket, idx_nu, lep_comb_idx[idx_comb]][update]
+                    jet_idxs_lep[upd_idx, :n_jet_lep] = table[upd_comb, :n_jet_lep]
+                    if not is_boosted_regime:
+                        top_had[upd_idx] = hyp_top_had[idx_bucket, idx_comb][update]
+                        jet_idxs_had[upd_idx, :n_jet_had] = table[upd_comb, n_jet_lep:]
+                    top_lep_chi2[upd_idx] = round_top_lep_chi2[update]
+                    top_had_chi2[upd_idx] = round_top_had_chi2[update]
+                    chi2[upd_idx] = round_chi2[update]
+
+        return _flat_results_to_ak(
+            best_round,
+            jet_idxs_lep,
+            jet_idxs_had,
+            top_lep,
+            top_had,
+            top_lep_chi2,
+            top_had_chi2,
+            chi2,
+            rounds,
+            topjet_lv=topjet_lv if is_boosted_regime else None,
+            top_had_chi2_topjet=top_had_chi2_topjet,
+        )
+
+    # threads over all allowed multiplicities of jets
+    # assigned to the leptonic and hadronic top quark decays
+    def get_rounds(regime):
+        """
+        Return a list of all allowed multiplicities of jets assigned to the leptonic
+        and hadronic top quark decays (only leptonic in the boosted `regime`).
+        """
         # obtain all possible jet multiplicities for leptonic top decay
         iter_n_jets = [range(n_jet_lep_range[0], n_jet_lep_range[1] + 1)]
 
@@ -480,18 +1338,79 @@ def ttbar(
         if regime == "resolved":
             iter_n_jets.append(range(n_jet_had_range[0], n_jet_had_range[1] + 1))
 
+        # skip if too few/many jets mapped to overall ttbar decay
+        return [
+            n_jets
+            for n_jets in itertools.product(*iter_n_jets)
+            if (
+                regime != "resolved" or
+                n_jet_ttbar_range[0] <= sum(n_jets) <= n_jet_ttbar_range[1]
+            )
+        ]
+
+    def main_loop(
+        jet_lv,
+        topjet_lv,
+        topjet_msoftdrop,
+        lepton_lv,
+        nu_cands_lv,
+        regime,
+    ):
+        """
+        Reconstruct the ttbar decay for all jet multiplicity rounds in `regime` and
+        return the merged results, together with the `Metrics` collected while doing
+        so (returned explicitly, as this function may run in a worker process).
+        """
+        rounds = get_rounds(regime)
+
+        # record number of events per jet multiplicity
+        loop_metrics = Metrics()
+        loop_metrics.count(f"{regime} events", len(jet_lv))
+        for n_jet, n_events_jet in enumerate(np.bincount(np.asarray(ak.num(jet_lv, axis=1)))):
+            if n_events_jet:
+                loop_metrics.count(f"{regime} events with {n_jet} jets", int(n_events_jet))
+
+        # kernel mode: evaluate all rounds in one pass
+        if merge_mode == "kernel":
+            return ttbar_combinatorics_kernel(
+                jet_lv,
+                topjet_lv,
+                topjet_msoftdrop,
+                lepton_lv,
+                nu_cands_lv,
+                rounds=rounds,
+                regime=regime,
+                metrics=loop_metrics,
+            ), loop_metrics
+
+        # dense mode: evaluate all rounds bucket by bucket
+        if merge_mode == "dense":
+            return ttbar_combinatorics_dense(
+                jet_lv,
+                topjet_lv,
+                topjet_msoftdrop,
+                lepton_lv,
+                nu_cands_lv,
+                rounds=rounds,
+                regime=regime,
+                metrics=loop_metrics,
+            ), loop_metrics
+
         # loop over all jet multiplicities and collect results
-        comb_results = None if merge_mode == "eager" else {}
+        if merge_mode == "eager":
+            comb_results = None
+        elif merge_mode == "inplace":
+            comb_results = TTbarRecoBuffers(
+                len(jet_lv),
+                n_jet_lep_max=n_jet_lep_range[1],
+                n_jet_had_max=n_jet_had_range[1],
+            )
+        else:
+            comb_results = {}
         total_merge_time = 0.
-        for n_jets in itertools.product(*iter_n_jets):
-
-            # skip if too few/many jets mapped to overall ttbar decay
-            n_jet_ttbar = sum(n_jets)
-            if (
-                regime == "resolved" and
-                not (n_jet_ttbar_range[0] <= n_jet_ttbar <= n_jet_ttbar_range[1])
-            ):
-                continue
+        # leptonic hypotheses, shared between rounds with the same `n_jet_lep`
+        lep_cache = {}
+        for n_jets in rounds:
 
             # do the reconstruction
             with profile_task(
@@ -507,16 +1426,21 @@ def ttbar(
                     nu_cands_lv,
                     n_jets=n_jets,
                     regime=regime,
+                    lep_cache=lep_cache,
+                    metrics=loop_metrics,
                 )
 
-            if merge_mode == "eager":
+            if merge_mode in ("eager", "inplace"):
                 # merge results immediately
                 with profile_task(
                     "merge to current best results",
                     indent_level=1,
                     min_verbose_level=2,
                 ) as t:
-                    comb_results = merge_sequential(comb_results, results)
+                    if merge_mode == "eager":
+                        comb_results = merge_sequential(comb_results, results)
+                    else:
+                        comb_results.merge(results)
 
                 if profile_time:
                     total_merge_time += t.duration
@@ -534,82 +1458,106 @@ def ttbar(
                 comb_results = merge_all(comb_results)
 
         # if merging was done eagerly, report on cumulated time spent
-        if profile_time and merge_mode == "eager" and verbose_level >= 2:
+        if profile_time and merge_mode in ("eager", "inplace") and verbose_level >= 2:
             self.task.publish_message(
                 "total time spent merging: "
                 f"{human_duration(seconds=total_merge_time)}",
             )
 
-        return comb_results
+        return comb_results, loop_metrics
 
-    def apply_chunked(func, arrays, max_chunk_size, **kwargs):
+    def apply_chunked(func, arrays, memory, buffers, event_idxs, **kwargs):
         """
         Apply function `func` to identically-sized `arrays` in a chunked way
-        and merge the results. The `func` should return an `ak.Array` or a
-        dictionary containing `ak.Array` objects.
+        and write the results to the preallocated `buffers` (see `TTbarRecoBuffers`)
+        at the positions `event_idxs`. The `func` should return a dictionary of
+        `ak.Array` objects as returned by `ttbar_combinatorics`, and the `Metrics`
+        collected for the sub-chunk, which are added to the metrics of the chunk.
+
+        The sub-chunks are chosen such that the sum of the predicted peak
+        `memory` for each event does not exceed `max_chunk_bytes`, and the
+        number of events does not exceed `max_chunk_size`.
         """
-        result = None
         size = len(arrays[0])
-        n_chunks = max(1, int(math.ceil(size / max_chunk_size)))
+        if max_chunk_bytes is None:
+            slices = chunk_slices(size, max_chunk_size)
+        else:
+            slices = cost_chunk_slices(memory, max_chunk_bytes, max_chunk_size)
+        n_chunks = len(slices)
+        max_chunk_memory = max((int(memory[slc].sum()) for slc in slices), default=0)
         self.task.publish_message(
-            f"processing {size} events in {n_chunks} sub-chunks",
+            f"processing {size} events in {n_chunks} sub-chunks "
+            f"(predicted peak memory: {human_bytes(max_chunk_memory, fmt=True)})" + (
+                f" with {n_workers} worker processes"
+                if n_workers > 0 else ""
+            ),
         )
-        for i_chk, arrays_chk in enumerate(
-            iter_chunks(*arrays, max_chunk_size=max_chunk_size),
-        ):
+        # results are computed on demand (serial execution)
+        # or in the background (parallel execution)
+        chunk_results = map_chunks(
+            func,
+            *arrays,
+            slices=slices,
+            **executor,
+            **kwargs,
+        )
+        for i_chk, slc in enumerate(slices):
             with profile_task(
                 f"processing sub-chunk {i_chk + 1}/{n_chunks}",
+                section="processing sub-chunk",
+                n_events=len(event_idxs[slc]),
             ):
+                results, chunk_metrics = next(chunk_results)
+                buffers.fill(event_idxs[slc], results)
+                metrics.update(chunk_metrics)
+
+    # output buffers for all events, filled in place by both regimes
+    buffers = TTbarRecoBuffers(
+        len(events),
+        n_jet_lep_max=n_jet_lep_range[1],
+        n_jet_had_max=n_jet_had_range[1],
+    )
 
-                new_result = func(*arrays_chk, **kwargs)
-
-                if result is None:
-                    result = new_result
-                elif isinstance(result, ak.Array):
-                    result = ak.to_packed(ak.concatenate([result, new_result], axis=0))
-                elif isinstance(result, dict):
-                    assert set(result) == set(new_result)
-                    result = {
-                        key: ak.to_packed(ak.concatenate([result[key], new_result[key]], axis=0))
-                        for key in result
-                    }
-
-        return result
-
-    # apply main loop in both regimes
-    comb_results = {}
-
+    # apply main loop in both regimes, only considering the events in each regime
     for regime in ("resolved", "boosted"):
-        comb_results[regime] = apply_chunked(
-            main_loop,
-            (
-                jet_lv[regime],
-                topjet_lv,
-                topjet.msoftdrop,
-                lepton_lv,
-                nu_cands_lv,
-            ),
-            regime=regime,
-            max_chunk_size=max_chunk_size,
+        regime_idxs = event_idxs[regime]
+        if len(regime_idxs) == 0:
+            continue
+
+        # compact inputs to events in regime (packed to ensure contiguous memory)
+        regime_arrays = tuple(
+            ak.to_packed(arr[regime_idxs])
+            for arr in (jet_lv, topjet_lv, topjet.msoftdrop, lepton_lv, nu_cands_lv)
         )
 
-    # merge regimes
-    with profile_task("merge resolved and boosted reconstructions"):
-        result_keys = set(comb_results["resolved"])
-        assert result_keys == set(comb_results["boosted"]), \
-            "resolved and boosted result keys mismatched"
-        comb_results = {
-            key: ak.to_packed(ak.where(
-                is_boosted,
-                comb_results["boosted"][key],
-                comb_results["resolved"][key],
-            ))
-            for key in result_keys
-        }
+        # predict memory use per event
+        memory = ttbar_reco_memory(
+            np.asarray(ak.num(regime_arrays[0], axis=1)),
+            np.asarray(ak.fill_none(ak.num(regime_arrays[4], axis=1), 0)),
+            get_rounds(regime),
+            merge_mode,
+        )
+        with profile_task(
+            f"{regime} reconstruction",
+            min_verbose_level=2,
+            n_events=len(regime_idxs),
+        ):
+            apply_chunked(
+                main_loop,
+                regime_arrays,
+                memory=memory,
+                buffers=buffers,
+                event_idxs=regime_idxs,
+                regime=regime,
+            )
 
-    # store final top
-    top_had = lv_mass(comb_results["top_had"])
-    top_lep = lv_mass(comb_results["top_lep"])
+    # wrap results as awkward arrays
+    with profile_task("convert reconstruction results"):
+        comb_results = buffers.to_ak()
+
+    # store final top (pt, eta, phi, mass)
+    top_had = p4_to_ptetaphim(p4_components(comb_results["top_had"]))
+    top_lep = p4_to_ptetaphim(p4_components(comb_results["top_lep"]))
 
     # store mapped jet indices and counts
     jet_idxs_had = comb_results["jet_idxs_had"]
@@ -622,27 +1570,29 @@ def ttbar(
     top_lep_chi2 = comb_results["top_lep_chi2"]
     chi2 = comb_results["chi2"]
 
+    # four-vectors (x, y, z, t) of tops, derived from (pt, eta, phi, mass)
+    top_had_p4 = p4_from_ptetaphim(*top_had)
+    top_lep_p4 = p4_from_ptetaphim(*top_lep)
+
     # sum over top quarks to form ttbar system
-    ttbar = lv_mass(top_had + top_lep)
+    ttbar = p4_to_ptetaphim(p4_add(top_had_p4, top_lep_p4))
+    ttbar_p4 = p4_from_ptetaphim(*ttbar)
 
     # -- calculate cos(theta*)
 
-    # boost lepton + leptonic top quark to ttbar rest frame
-    top_lep_ttrest = top_lep.boost(-ttbar.boostvec)
-
-    # get cosine from three-vector dot product and magnitudes
-    cos_theta_star = ttbar.pvec.dot(top_lep_ttrest.pvec) / (ttbar.pvec.p * top_lep_ttrest.pvec.p)
+    # angle between leptonic top quark in ttbar rest frame and ttbar direction
+    cos_theta_star = p4_cos_theta_star(top_lep_p4, ttbar_p4)
     abs_cos_theta_star = abs(cos_theta_star)
 
     # -- calculate energy of hadronic and leptonic top
-    top_had_energy = np.sqrt((top_had.mass) ** 2 + (top_had.pt) ** 2)
-    top_lep_energy = np.sqrt((top_lep.mass) ** 2 + (top_lep.pt) ** 2)
+    top_had_energy = np.sqrt(top_had[3] ** 2 + top_had[0] ** 2)
+    top_lep_energy = np.sqrt(top_lep[3] ** 2 + top_lep[0] ** 2)
 
     # write out columns
-    for var in ("pt", "eta", "phi", "mass"):
-        events = set_ak_column(events, f"TTbar.top_had_{var}", ak.fill_none(getattr(top_had, var), EMPTY_FLOAT))
-        events = set_ak_column(events, f"TTbar.top_lep_{var}", ak.fill_none(getattr(top_lep, var), EMPTY_FLOAT))
-        events = set_ak_column(events, f"TTbar.{var}", ak.fill_none(getattr(ttbar, var), EMPTY_FLOAT))
+    for i, var in enumerate(("pt", "eta", "phi", "mass")):
+        events = set_ak_column(events, f"TTbar.top_had_{var}", ak.fill_none(top_had[i], EMPTY_FLOAT))
+        events = set_ak_column(events, f"TTbar.top_lep_{var}", ak.fill_none(top_lep[i], EMPTY_FLOAT))
+        events = set_ak_column(events, f"TTbar.{var}", ak.fill_none(ttbar[i], EMPTY_FLOAT))
     events = set_ak_column(events, "TTbar.top_had_energy", ak.fill_none(top_had_energy, EMPTY_FLOAT))
     events = set_ak_column(events, "TTbar.top_lep_energy", ak.fill_none(top_lep_energy, EMPTY_FLOAT))
     events = set_ak_column(events, "TTbar.n_jet_had", ak.fill_none(n_jet_had, -1))
@@ -665,10 +1615,10 @@ def ttbar(
         gen_top_2 = ak.firsts(gen_part[gen_ttbar.top_2])
 
         # match gen-level tops to hadronic and leptonic reco tops
-        dr_top_had_gen_top_1 = top_had.delta_r(gen_top_1)
-        dr_top_lep_gen_top_2 = top_lep.delta_r(gen_top_2)
-        dr_top_had_gen_top_2 = top_had.delta_r(gen_top_2)
-        dr_top_lep_gen_top_1 = top_lep.delta_r(gen_top_1)
+        dr_top_had_gen_top_1 = delta_r(top_had[1], top_had[2], gen_top_1.eta, gen_top_1.phi)
+        dr_top_lep_gen_top_2 = delta_r(top_lep[1], top_lep[2], gen_top_2.eta, gen_top_2.phi)
+        dr_top_had_gen_top_2 = delta_r(top_had[1], top_had[2], gen_top_2.eta, gen_top_2.phi)
+        dr_top_lep_gen_top_1 = delta_r(top_lep[1], top_lep[2], gen_top_1.eta, gen_top_1.phi)
 
         dr_sum_match_12 = dr_top_had_gen_top_1 + dr_top_lep_gen_top_2
         dr_sum_match_21 = dr_top_had_gen_top_2 + dr_top_lep_gen_top_1
@@ -694,31 +1644,30 @@ def ttbar(
             gen_ttbar.w_2,
             gen_ttbar.w_1,
         )]
-        gen_ttbar_lv = lv_mass(gen_top_had) + lv_mass(gen_top_lep)
+        gen_top_lep_p4 = p4_components(gen_top_lep)
+        gen_ttbar_p4 = p4_add(p4_components(gen_top_had), gen_top_lep_p4)
+        gen_ttbar_ptetaphim = p4_to_ptetaphim(gen_ttbar_p4)
 
         # -- calculate gen-level cos(theta*)
 
-        # boost lepton + leptonic top quark to ttbar rest frame
-        gen_top_lep_ttrest = lv_mass(gen_top_lep).boost(-gen_ttbar_lv.boostvec)
-        gen_cos_theta_star = (
-            gen_ttbar_lv.pvec.dot(gen_top_lep_ttrest.pvec) / (gen_ttbar_lv.pvec.p * gen_top_lep_ttrest.pvec.p)
-        )
+        # angle between leptonic top quark in ttbar rest frame and ttbar direction
+        gen_cos_theta_star = p4_cos_theta_star(gen_top_lep_p4, gen_ttbar_p4)
         gen_abs_cos_theta_star = abs(gen_cos_theta_star)
 
-        dr_gen_top_had = lv_mass(gen_top_had).delta_r(top_had)
-        dr_gen_top_lep = lv_mass(gen_top_lep).delta_r(top_lep)
-        dr_gen_ttbar = gen_ttbar_lv.delta_r(ttbar)
+        dr_gen_top_had = delta_r(gen_top_had.eta, gen_top_had.phi, top_had[1], top_had[2])
+        dr_gen_top_lep = delta_r(gen_top_lep.eta, gen_top_lep.phi, top_lep[1], top_lep[2])
+        dr_gen_ttbar = delta_r(gen_ttbar_ptetaphim[1], gen_ttbar_ptetaphim[2], ttbar[1], ttbar[2])
 
         def set_ak_column_ef(events, name, value):
             """Set float column, replacing missing values by EMPTY_FLOAT."""
             return set_ak_column(events, name, ak.fill_none(value, EMPTY_FLOAT))
 
-        for var in ("pt", "eta", "phi", "mass"):
+        for i, var in enumerate(("pt", "eta", "phi", "mass")):
             events = set_ak_column_ef(events, f"TTbar.gen_top_had_{var}", getattr(gen_top_had, var))
             events = set_ak_column_ef(events, f"TTbar.gen_top_lep_{var}", getattr(gen_top_lep, var))
             events = set_ak_column_ef(events, f"TTbar.gen_w_had_{var}", getattr(gen_w_had, var))
             events = set_ak_column_ef(events, f"TTbar.gen_w_lep_{var}", getattr(gen_w_lep, var))
-            events = set_ak_column_ef(events, f"TTbar.gen_{var}", getattr(gen_ttbar_lv, var))
+            events = set_ak_column_ef(events, f"TTbar.gen_{var}", gen_ttbar_ptetaphim[i])
         events = set_ak_column_ef(events, "TTbar.gen_top_had_delta_r", dr_gen_top_had)
         events = set_ak_column_ef(events, "TTbar.gen_top_lep_delta_r", dr_gen_top_lep)
         events = set_ak_column_ef(events, "TTbar.gen_delta_r", dr_gen_ttbar)
@@ -728,6 +1677,37 @@ def ttbar(
     # recalculate category ids with ttbar information
     events = self[category_ids](events, **kwargs)
 
+    # report on garbage collection and reconstruction metrics
+    if verbose_level >= 1:
+        self.task.publish_message(gc_controller.report())
+        self.task.publish_message(metrics.report(title="reconstruction metrics"))
+
+    # write structured profiling report
+    if recorder is not None:
+        root_span["counters"].update(gc_controller.stats)
+        root_span["counters"].update(metrics.counters)
+        root_span["gauges"].update(metrics.gauges)
+        recorder.close(root_span)
+        self._profile_report_count = getattr(self, "_profile_report_count", 0) + 1
+        report_dir = os.path.join(profile_report_dir, self.config_inst.name, self.dataset_inst.name)
+        report_basename = f"{self.cls_name}_{recorder.meta['shift']}_{recorder.meta['branch']}"
+        recorder.write(
+            report_dir,
+            f"{report_basename}_{recorder.meta['pid']}_{self._profile_report_count}",
+        )
+
+        # update totals of the metrics over all chunks of the task branch
+        if getattr(self, "_metrics_totals", None) is None:
+            self._metrics_totals = Metrics()
+        self._metrics_totals.update(metrics)
+        meta = {
+            key: recorder.meta[key]
+            for key in ("producer", "config", "dataset", "shift", "branch", "merge_mode")
+        }
+        meta["n_chunks"] = self._profile_report_count
+        with open(os.path.join(report_dir, f"{report_basename}.metrics.json"), "w") as f:
+            json.dump({"meta": meta, **self._metrics_totals.to_dict()}, f, indent=2)
+
     return events
 
 
@@ -7,11 +7,24 @@ import itertools
 
 from functools import partial
 
-from columnflow.util import maybe_import
+from columnflow.util import maybe_import, MockModule
 
 ak = maybe_import("awkward")
 np = maybe_import("numpy")
 coffea = maybe_import("coffea")
+numba = maybe_import("numba")
+
+
+def jit(func):
+    """
+    Compile a function operating on flat numpy arrays with `numba.njit`.
+    If numba is not available (e.g. outside of the columnar sandbox),
+    the function is returned unchanged.
+    """
+    if isinstance(numba, MockModule):
+        return func
+
+    return numba.njit(cache=True, nogil=True)(func)
 
 
 #
@@ -47,23 +60,126 @@ def ak_argcartesian(*arrs, as_type=np.uint8):
     )
 
 
+def ak_nbytes(*arrs):
+    """
+    Return the total size in bytes of the buffers backing the awkward arrays
+    `arrs`, which may also be given as (nested) tuples or lists of arrays.
+    Buffers shared between several arrays are only counted once.
+    """
+    seen = set()
+
+    def visit(obj):
+        if isinstance(obj, (tuple, list)):
+            return sum(visit(item) for item in obj)
+        if isinstance(obj, ak.Array):
+            obj = obj.layout
+        if not isinstance(obj, ak.contents.Content):
+            return 0
+
+        # buffers of indices and data
+        buffers = [
+            index.data
+            for index in (
+                getattr(obj, attr, None)
+                for attr in ("offsets", "starts", "stops", "index", "mask", "tags")
+            )
+            if isinstance(index, ak.index.Index)
+        ]
+        if isinstance(obj, ak.contents.NumpyArray):
+            buffers.append(obj.data)
+
+        nbytes = 0
+        for buf in buffers:
+            key = (buf.ctypes.data, buf.nbytes)
+            if key not in seen:
+                seen.add(key)
+                nbytes += buf.nbytes
+
+        # child contents
+        if isinstance(obj, (ak.contents.RecordArray, ak.contents.UnionArray)):
+            nbytes += sum(visit(content) for content in obj.contents)
+        elif hasattr(obj, "content"):
+            nbytes += visit(obj.content)
+
+        return nbytes
+
+    return visit(arrs)
+
+
+# module-level cache for index tables of grouped combinations,
+# keyed by number of objects and group sizes
+_grouped_combinations_tables = {}
+
+
+def grouped_combinations_table(
+    n_objects: int,
+    group_sizes: tuple[int],
+    return_group_indices: bool = False,
+) -> np.ndarray | tuple[np.ndarray, np.ndarray]:
+    """
+    Return a table with all possible ways to arrange `n_objects` objects into
+    non-overlapping groups with sizes `group_sizes`.
+
+    The result is an array of shape `(n_arrangements, sum(group_sizes))`, with each
+    row containing the object indices of the first group, followed by those of the
+    second group, and so on. The rows are ordered in the same way as the output of
+    `ak.argcartesian` applied to the `ak.argcombinations` for each group.
+
+    If `return_group_indices` is true, a second array of shape
+    `(n_arrangements, len(group_sizes))` is returned, containing for each row
+    the position of each group's combination in the output of
+    `itertools.combinations` (i.e. `ak.argcombinations`) for that group size.
+
+    The tables are computed once and cached for the lifetime of the process.
+    """
+    key = (n_objects, tuple(group_sizes))
+    if key not in _grouped_combinations_tables:
+        rows = []
+        group_idx_rows = []
+        n_cols = sum(group_sizes)
+        for group_combs in itertools.product(*(
+            enumerate(itertools.combinations(range(n_objects), n))
+            for n in group_sizes
+        )):
+            row = sum((comb for _, comb in group_combs), ())
+
+            # drop cases where the same index is contained in two groups
+            if len(set(row)) != n_cols:
+                continue
+
+            rows.append(row)
+            group_idx_rows.append(tuple(idx for idx, _ in group_combs))
+
+        table = np.array(rows, dtype=np.int64).reshape(-1, n_cols)
+        group_idxs = np.array(group_idx_rows, dtype=np.int64).reshape(-1, len(group_sizes))
+
+        # make read-only, since the tables are shared
+        table.flags.writeable = False
+        group_idxs.flags.writeable = False
+        _grouped_combinations_tables[key] = (table, group_idxs)
+
+    table, group_idxs = _grouped_combinations_tables[key]
+    if return_group_indices:
+        return table, group_idxs
+
+    return table
+
+
 def ak_arg_grouped_combinations(
     array: ak.Array,
     group_sizes: list[int],
-    axis: int = 1,
-    cache: dict[int, tuple[ak.Array]] = None,
     as_type=np.uint8,
+    return_group_indices: bool = False,
 ) -> tuple[tuple[ak.Array]]:
     """
     Like `ak.argcombinations`, but considers all possible ways to arrange
     the entries of an input `array` into non-overlapping groups with specified
-    sizes `group_sizes`.
-
-    Optionally, an `axis` along which to build the combinations can be specified
-    (default is `1`).
+    sizes `group_sizes`. The combinations are built along the first nested
+    axis (`axis=1`).
 
-    An optional `cache` dictionary with pre-computed index combinations ca
-    nbe given.
+    The index arrays are obtained by looking up the cached index table for
+    each event's multiplicity (see `grouped_combinations_table`), so the
+    combinatorics are only computed once per multiplicity and process.
 
     Returns a nested tuple of unzipped index arrrays (`combinations`) organized
     by group index and object position within the group. For example,
@@ -78,7 +194,7 @@ def ak_arg_grouped_combinations(
     We can obtain all possible combinations of objects arranged into two groups
     with sizes 1 and 2:
 
-    >>> combs = ak_arg_grouped_combinations(arr, [1, 2], axis=1)
+    >>> combs = ak_arg_grouped_combinations(arr, [1, 2])
     ((<Array [[0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3]] type='1 * var * int64'>,),
      (<Array [[1, 1, 2, 0, 0, 2, 0, 0, 1, 0, 0, 1]] type='1 * var * int64'>,
       <Array [[2, 3, 3, 2, 3, 3, 1, 3, 3, 1, 2, 2]] type='1 * var * int64'>))
@@ -88,67 +204,65 @@ def ak_arg_grouped_combinations(
 
     >>> arr[combs[1][0]] + arr[combs[1][1]]
     <Array [[56, 50, 44, 35, 29, ..., 29, 50, 41, 35, 56]] type='1 * var * int64'>
-    """
 
-    if cache is None:
-        cache = {}
-
-    n_groups = len(group_sizes)
-    if n_groups < 1:
+    If `return_group_indices` is true, a second tuple is returned with one index
+    array per group, pointing to the position of the group's combination in the
+    output of `ak.argcombinations` for that group size. This allows quantities
+    computed once per group combination to be shared between arrangements.
+    These indices are always of type `np.uint32`, since the number of
+    combinations can easily exceed the range of smaller types.
+    """
+    if len(group_sizes) < 1:
         raise ValueError("at least one group size is required")
 
-    # build combinations for each individual group size
-    for n in group_sizes:
-        if n not in cache:
-            cache[n] = tuple(
-                ak.values_astype(item, as_type)
-                for item in ak.unzip(
-                    ak.argcombinations(array, n, axis=axis),
-                )
-            )
-
-    combs = [cache[n] for n in group_sizes]
-
-    # build cartesian product of all different-size combinations
-    comb_prod = tuple(
-        ak.values_astype(item, as_type)
-        for item in ak.unzip(
-            ak.argcartesian([c[0] for c in combs]),
-        )
-    )
-
-    # -- exclude combinations with a common index across any two groups
-
-    keep = ak.ones_like(comb_prod[0], dtype=bool)
-    # loop over all configurations of object indices within groups
-    for obj_idxs in itertools.product(*(range(n) for n in group_sizes)):
-        # loop over all combinations of two groups
-        for g_idx_1, g_idx_2 in itertools.product(range(n_groups), range(n_groups)):
-            # skip lower triangle
-            if g_idx_1 >= g_idx_2:
-                continue
-            # drop cases where the same index is contained in two groups
-            keep = keep & (
-                combs[g_idx_1][obj_idxs[g_idx_1]][comb_prod[g_idx_1]] !=
-                combs[g_idx_2][obj_idxs[g_idx_2]][comb_prod[g_idx_2]]
-            )
-
-    # apply filter to combination product
-    comb_prod_filtered = tuple(p[keep] for p in comb_prod)
+    # number of objects per event
+    n_objects = ak.num(array, axis=1)
+    is_missing = np.asarray(ak.is_none(n_objects))
+    n_objects = np.asarray(ak.fill_none(n_objects, 0), dtype=np.int64)
+
+    # concatenate tables for all multiplicities into one
+    # and note the start position of each table
+    n_objects_max = int(n_objects.max()) if len(n_objects) else 0
+    tables, group_idx_tables = zip(*(
+        grouped_combinations_table(n, group_sizes, return_group_indices=True)
+        for n in range(n_objects_max + 1)
+    ))
+    table_sizes = np.array([len(t) for t in tables], dtype=np.int64)
+    table_starts = np.concatenate([[0], np.cumsum(table_sizes)[:-1]])
+    all_tables = np.concatenate(tables, axis=0)
+
+    # gather rows of the relevant table for each event
+    counts = table_sizes[n_objects]
+    local_index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    row_idxs = np.repeat(table_starts[n_objects], counts) + local_index
+    rows = all_tables[row_idxs]
+
+    def make_index_array(col, rows=rows, as_type=as_type):
+        idx = ak.unflatten(rows[:, col].astype(as_type), counts)
+        if np.any(is_missing):
+            idx = ak.mask(idx, ~is_missing)
+        return idx
 
     # build index arrays from combinations product and return
-    grouped_combs = tuple(
-        tuple(
-            ak.values_astype(
-                c[comb_prod_filtered[g_idx]],
-                as_type,
-            )
-            for c in combs[g_idx]
-        )
-        for g_idx in range(n_groups)
+    grouped_combs = []
+    col = 0
+    for n in group_sizes:
+        grouped_combs.append(tuple(
+            make_index_array(col + i)
+            for i in range(n)
+        ))
+        col += n
+
+    if not return_group_indices:
+        return tuple(grouped_combs)
+
+    group_idx_rows = np.concatenate(group_idx_tables, axis=0)[row_idxs]
+    group_idxs = tuple(
+        make_index_array(i, rows=group_idx_rows, as_type=np.uint32)
+        for i in range(len(group_sizes))
     )
 
-    return grouped_combs
+    return tuple(grouped_combs), group_idxs
 
 
 #
@@ -183,6 +297,206 @@ def lv_sum(lv_arrays):
     return tmp_lv_sum
 
 
+#
+# behavior-free functions for operating on Lorentz vectors
+#
+# The four-vectors are represented as tuples `(x, y, z, t)` of plain numpy or
+# awkward arrays, avoiding the creation of record arrays and the dispatch via
+# the coffea behaviors. The formulas are the same as the ones used by the
+# coffea `LorentzVector` behavior (Cartesian components), so the results are
+# identical.
+#
+
+def _where(condition, x, y):
+    # like `ak.where`, but keep plain numpy arrays if no awkward arrays are involved
+    if any(isinstance(arr, ak.Array) for arr in (condition, x, y)):
+        return ak.where(condition, x, y)
+    return np.where(condition, x, y)
+
+
+def p4_from_ptetaphim(pt, eta, phi, mass):
+    """
+    Return the Cartesian components `(x, y, z, t)` of four-vectors given by
+    `pt`, `eta`, `phi` and `mass`.
+    """
+    return (
+        pt * np.cos(phi),
+        pt * np.sin(phi),
+        pt * np.sinh(eta),
+        np.hypot(pt * np.cosh(eta), mass),
+    )
+
+
+def p4_components(arr):
+    """
+    Return the Cartesian components `(x, y, z, t)` of an array of Lorentz vectors,
+    which can either have fields `x`, `y`, `z` and `t`, or `pt`, `eta`, `phi` and `mass`.
+    """
+    fields = set(arr.fields)
+    if {"x", "y", "z", "t"} <= fields:
+        return (arr["x"], arr["y"], arr["z"], arr["t"])
+    if {"pt", "eta", "phi", "mass"} <= fields:
+        return p4_from_ptetaphim(arr["pt"], arr["eta"], arr["phi"], arr["mass"])
+
+    raise ValueError(f"cannot obtain four-vector components from fields {arr.fields}")
+
+
+def p4_add(p4_1, p4_2):
+    """
+    Return the sum of two four-vectors.
+    """
+    return tuple(c_1 + c_2 for c_1, c_2 in zip(p4_1, p4_2))
+
+
+def p4_subtract(p4_1, p4_2):
+    """
+    Return the difference of two four-vectors.
+    """
+    return tuple(c_1 - c_2 for c_1, c_2 in zip(p4_1, p4_2))
+
+
+def p4_sum(p4s):
+    """
+    Return the sum over an iterable of four-vectors, adding them in order
+    (like `lv_sum`).
+    """
+    tmp_p4_sum = None
+    for p4 in p4s:
+        if tmp_p4_sum is None:
+            tmp_p4_sum = p4
+        else:
+            tmp_p4_sum = p4_add(tmp_p4_sum, p4)
+
+    return tmp_p4_sum
+
+
+def p4_where(condition, p4_1, p4_2):
+    """
+    Choose components from `p4_1` where `condition` is true and from `p4_2` otherwise.
+    """
+    return tuple(_where(condition, c_1, c_2) for c_1, c_2 in zip(p4_1, p4_2))
+
+
+def p4_pt(p4):
+    """Return the transverse momentum of four-vectors."""
+    x, y, _, _ = p4
+    return np.sqrt(x * x + y * y)
+
+
+def p4_p(p4):
+    """Return the magnitude of the three-momentum of four-vectors."""
+    x, y, z, _ = p4
+    return np.sqrt(x * x + y * y + z * z)
+
+
+def p4_eta(p4):
+    """Return the pseudorapidity of four-vectors."""
+    return np.arcsinh(p4[2] / p4_pt(p4))
+
+
+def p4_phi(p4):
+    """Return the azimuthal angle of four-vectors."""
+    return np.arctan2(p4[1], p4[0])
+
+
+def p4_mass(p4):
+    """Return the invariant mass of four-vectors."""
+    x, y, z, t = p4
+    return np.sqrt(t * t - x * x - y * y - z * z)
+
+
+def p4_to_ptetaphim(p4):
+    """
+    Return `(pt, eta, phi, mass)` for four-vectors given by their Cartesian components.
+    """
+    pt = p4_pt(p4)
+    return (
+        pt,
+        np.arcsinh(p4[2] / pt),
+        p4_phi(p4),
+        p4_mass(p4),
+    )
+
+
+def p4_sum_mass(p4s):
+    """
+    Return the sum over an iterable of four-vectors (see `p4_sum`) and its invariant mass.
+    """
+    p4 = p4_sum(p4s)
+    return p4, p4_mass(p4)
+
+
+def delta_phi(phi_1, phi_2):
+    """
+    Return the difference between azimuthal angles `phi_1` and `phi_2`,
+    mapped to the interval [-pi, pi).
+    """
+    return (phi_1 - phi_2 + np.pi) % (2 * np.pi) - np.pi
+
+
+def delta_r(eta_1, phi_1, eta_2, phi_2):
+    """
+    Return the distance between two directions in the (eta, phi) plane.
+    """
+    return np.hypot(eta_1 - eta_2, delta_phi(phi_1, phi_2))
+
+
+def p4_boostvec(p4):
+    """
+    Return the velocity `(bx, by, bz)` of four-vectors, i.e. the spatial components
+    divided by the energy. If the energy does not exceed the three-momentum, the unit
+    vector is returned instead.
+    """
+    x, y, z, t = p4
+    rho = p4_p(p4)
+    with np.errstate(divide="ignore"):
+        factor = _where(rho == 0, 0, _where(abs(t) <= rho, 1 / rho, 1 / t))
+
+    return (x * factor, y * factor, z * factor)
+
+
+def p4_boost(p4, boostvec):
+    """
+    Apply a Lorentz boost with velocity `boostvec` to four-vectors `p4`. To boost
+    into the rest frame of a four-vector `p4_ref`, use the negative of its velocity,
+    i.e. `p4_boost(p4, [-b for b in p4_boostvec(p4_ref)])`.
+    """
+    x, y, z, t = p4
+    bx, by, bz = boostvec
+
+    b2 = bx * bx + by * by + bz * bz
+    gamma = (1 - b2) ** (-0.5)
+    mask = (b2 == 0)
+    b2 = _where(mask, 1, b2)
+    gamma2 = _where(mask, 0, (gamma - 1) / b2)
+
+    bp = x * bx + y * by + z * bz
+    v_bp = gamma2 * bp
+    v_t = t * gamma
+
+    return (
+        x + (bx * v_bp + bx * v_t),
+        y + (by * v_bp + by * v_t),
+        z + (bz * v_bp + bz * v_t),
+        gamma * (t + bp),
+    )
+
+
+def p4_cos_theta_star(p4, p4_ref):
+    """
+    Return the cosine of the angle between the direction of four-vectors `p4`
+    in the rest frame of `p4_ref` and the direction of `p4_ref`.
+    """
+    p4_rest = p4_boost(p4, [-b for b in p4_boostvec(p4_ref)])
+
+    x_ref, y_ref, z_ref, _ = p4_ref
+    x, y, z, _ = p4_rest
+    return (
+        (x_ref * x + y_ref * y + z_ref * z) /
+        (p4_p(p4_ref) * p4_p(p4_rest))
+    )
+
+
 #
 # functions for matching between collections of Lorentz vectors
 #
@@ -222,33 +536,457 @@ def delta_r_match(dst_lvs, src_lv, max_dr=None):
     return best_match_dst_lv, dst_lvs
 
 
-def delta_r_match_multiple(dst_lvs, src_lvs, max_dr=None):
+@jit
+def _match_greedy(dist, pair_offset, n_src, n_dst, src_valid, dst_avail, max_dr, matches):
     """
-    Like `delta_r_match`, except source array `src_lvs` can contain more than
-    one entry per event. The matching is done sequentially for each entry in
-    `src_lvs`, with previous matches being filetered from the destination array
-    each time to prevent double counting.
+    Greedy matching for a single event: each source (in order) is matched to the closest
+    available destination with a distance below `max_dr` (no cut if negative), following
+    the conventions of `ak.argmin` for ties and NaN values. Matched destinations are marked
+    as unavailable in `dst_avail`. As in the sequential matching, where a missing match
+    removes all destinations of the event, the remaining sources are not matched once a
+    source is left without a match.
     """
+    for i in range(n_src):
+        if not src_valid[i]:
+            break
+        best = -1
+        best_dist = 0.0
+        for j in range(n_dst):
+            if not dst_avail[j]:
+                continue
+            d = dist[pair_offset + i * n_dst + j]
+            if max_dr >= 0 and not d < max_dr:
+                continue
+            if best == -1 or d < best_dist:
+                best = j
+                best_dist = d
+        matches[i] = best
+        if best < 0:
+            break
+        dst_avail[best] = False
 
-    # save the index structure of the supplied source array
-    src_lvs_idx = ak.local_index(src_lvs, axis=1)
 
-    # pad sub-lists to the same length (but at least 1)
-    max_num = max(1, ak.max(ak.num(src_lvs)))
-    src_lvs = ak.pad_none(src_lvs, max_num)
+@jit
+def _match_optimal(dist, pair_offset, n_src, n_dst, src_valid, dst_avail, max_dr, matches):
+    """
+    Globally optimal matching for a single event: among all assignments of sources to
+    distinct available destinations with distances below `max_dr` (no cut if negative),
+    choose the one with the most matches and, among those, the smallest sum of distances.
+    All assignments are enumerated, so this is only suitable for small matrices.
+    """
+    best_count = -1
+    best_sum = 0.0
+    choice = np.full(n_src, -2, dtype=np.int64)
+    used = np.zeros(n_dst, dtype=np.bool_)
+
+    level = 0
+    while level >= 0:
+        # complete assignment: evaluate
+        if level == n_src:
+            count = 0
+            total = 0.0
+            for i in range(n_src):
+                if choice[i] >= 0:
+                    count += 1
+                    total += dist[pair_offset + i * n_dst + choice[i]]
+            if count > best_count or (count == best_count and total < best_sum):
+                best_count = count
+                best_sum = total
+                matches[:n_src] = choice[:n_src]
+            level -= 1
+            continue
+
+        # release the previous choice at this level and advance to the next allowed one
+        # (first leave the source unmatched, then try all destinations in order)
+        c = choice[level]
+        if c >= 0:
+            used[c] = False
+        c += 1
+        while c >= 0 and c < n_dst:
+            d = dist[pair_offset + level * n_dst + c]
+            if (
+                src_valid[level] and dst_avail[c] and not used[c] and
+                not np.isnan(d) and (max_dr < 0 or d < max_dr)
+            ):
+                break
+            c += 1
+
+        if c >= n_dst:
+            choice[level] = -2
+            level -= 1
+            continue
+
+        choice[level] = c
+        if c >= 0:
+            used[c] = True
+        level += 1
+
+    for i in range(n_src):
+        if matches[i] >= 0:
+            dst_avail[matches[i]] = False
+
+
+@jit
+def _match_kernel(dist, pair_offsets, src_offsets, src_valid, dst_offsets, dst_avail, max_dr, optimal):
+    """
+    Match sources to destinations in all events, given the flat per-event distance matrices
+    `dist` (row-major, sources along the first axis) starting at `pair_offsets`. Returns the
+    local index of the matched destination for each source (-1 if unmatched), and updates
+    the flat destination availability flags `dst_avail` in place.
+    """
+    matches = np.full(src_offsets[-1], -1, dtype=np.int64)
+    for i_event in range(len(src_offsets) - 1):
+        s0, s1 = src_offsets[i_event], src_offsets[i_event + 1]
+        d0, d1 = dst_offsets[i_event], dst_offsets[i_event + 1]
+        if s1 == s0 or d1 == d0:
+            continue
+        # note: direct calls instead of a function variable, which numba can inline
+        if optimal:
+            _match_optimal(
+                dist, pair_offsets[i_event], s1 - s0, d1 - d0,
+                src_valid[s0:s1], dst_avail[d0:d1], max_dr, matches[s0:s1],
+            )
+        else:
+            _match_greedy(
+                dist, pair_offsets[i_event], s1 - s0, d1 - d0,
+                src_valid[s0:s1], dst_avail[d0:d1], max_dr, matches[s0:s1],
+            )
+    return matches
 
-    # run matching for each position,
-    # filtering the destination array each time
-    best_match_dst_lvs = []
-    for i in range(max_num):
-        best_match_dst_lv, dst_lvs = delta_r_match(dst_lvs, src_lvs[:, i], max_dr=max_dr)
-        best_match_dst_lv = ak.unflatten(best_match_dst_lv, 1)
-        best_match_dst_lvs.append(best_match_dst_lv)
 
-    # concatenate matching results
-    result = ak.concatenate(best_match_dst_lvs, axis=-1)
+def delta_r_match_multiple(dst_lvs, src_lvs, max_dr=None, mode="greedy"):
+    """
+    Like `delta_r_match`, except source array `src_lvs` can contain more than
+    one entry per event.
+
+    The matching is done in a single pass over the flat per-event delta-R matrices.
+    The *mode* determines how the matches are chosen:
+      - ``"greedy"``: the entries in `src_lvs` are matched sequentially, with previous
+        matches being filtered from the destination array each time to prevent double
+        counting (identical to calling `delta_r_match` for each source position)
+      - ``"optimal"``: choose the assignment with the largest number of matches and
+        the smallest sum of delta-R values (only suitable for a few sources per event)
+
+    Returns an array with the same structure as `src_lvs` containing the matches in
+    `dst_lvs` (or *None*), and a view of `dst_lvs` with the matches removed.
+    """
+    assert mode in ("greedy", "optimal"), f"invalid matching mode '{mode}'"
+
+    def flat(arr, field):
+        return np.asarray(ak.fill_none(ak.flatten(arr[field], axis=1), np.nan), dtype=np.float64)
+
+    def offsets(counts):
+        return np.concatenate([[0], np.cumsum(counts)])
+
+    # flat inputs (missing events are treated as empty)
+    n_src = np.asarray(ak.fill_none(ak.num(src_lvs, axis=1), 0), dtype=np.int64)
+    n_dst = np.asarray(ak.fill_none(ak.num(dst_lvs, axis=1), 0), dtype=np.int64)
+    src_lvs_flat = ak.fill_none(src_lvs, [], axis=0)
+    dst_lvs_flat = ak.fill_none(dst_lvs, [], axis=0)
+    src_eta, src_phi = flat(src_lvs_flat, "eta"), flat(src_lvs_flat, "phi")
+    dst_eta, dst_phi = flat(dst_lvs_flat, "eta"), flat(dst_lvs_flat, "phi")
+    src_valid = ~np.asarray(ak.flatten(ak.is_none(src_lvs_flat.eta, axis=1), axis=1), dtype=bool)
+    dst_avail = ~np.asarray(ak.flatten(ak.is_none(dst_lvs_flat.eta, axis=1), axis=1), dtype=bool)
+
+    # flat per-event delta-R matrices
+    src_offsets, dst_offsets = offsets(n_src), offsets(n_dst)
+    n_pairs = n_src * n_dst
+    pair_offsets = offsets(n_pairs)
+    pair_event = np.repeat(np.arange(len(n_pairs)), n_pairs)
+    pair_local = np.arange(pair_offsets[-1]) - pair_offsets[pair_event]
+    pair_src = src_offsets[pair_event] + pair_local // np.maximum(n_dst[pair_event], 1)
+    pair_dst = dst_offsets[pair_event] + pair_local % np.maximum(n_dst[pair_event], 1)
+    dist = delta_r(src_eta[pair_src], src_phi[pair_src], dst_eta[pair_dst], dst_phi[pair_dst])
+
+    matches = _match_kernel(
+        dist, pair_offsets, src_offsets, src_valid, dst_offsets, dst_avail,
+        -1.0 if max_dr is None else float(max_dr),
+        mode == "optimal",
+    )
 
-    # remove padding to make result index-compatible with input
-    result = result[src_lvs_idx]
+    # look up matched destinations
+    match_idx = ak.unflatten(matches, n_src)
+    result = dst_lvs_flat[ak.mask(match_idx, match_idx >= 0)]
+
+    # filter dst_lvs to remove the matches (if any)
+    match_event = np.repeat(np.arange(len(n_src)), n_src)
+    is_matched = np.zeros(len(dst_avail), dtype=bool)
+    is_matched[(dst_offsets[:-1][match_event] + matches)[matches >= 0]] = True
+    keep = ak.unflatten(~is_matched, n_dst)
+    if mode == "greedy":
+        # as in the sequential matching of the padded source positions, events in which
+        # any position (including padding up to the maximum number of sources per event)
+        # remains unmatched are left without any destinations
+        n_matched = np.bincount(match_event[matches >= 0], minlength=len(n_src))
+        keep = ak.mask(keep, n_matched == max(1, n_src.max(initial=0)))
+    dst_lvs = ak.mask(dst_lvs, keep)
+    dst_lvs = ak.where(ak.is_none(dst_lvs, axis=0), [[]], dst_lvs)
 
     return result, dst_lvs
+
+
+#
+# fused delta-R reductions between collections of Lorentz vectors
+#
+
+@jit
+def _delta_r_pair(eta_1, phi_1, eta_2, phi_2):
+    # same as `delta_r`, for a single pair of directions
+    return np.hypot(eta_1 - eta_2, (phi_1 - phi_2 + np.pi) % (2 * np.pi) - np.pi)
+
+
+@jit
+def _delta_r_min_kernel(eta, phi, valid, offsets, other_eta, other_phi, other_valid, other_offsets):
+    """
+    Minimum delta-R of each entry to the entries of the other collection in the same event,
+    following the conventions of `ak.min` (NaN values are ignored). Returns the values and
+    a flag indicating whether a minimum exists.
+    """
+    result = np.full(len(eta), np.inf)
+    found = np.zeros(len(eta), dtype=np.bool_)
+    for i_event in range(len(offsets) - 1):
+        for i in range(offsets[i_event], offsets[i_event + 1]):
+            if not valid[i]:
+                continue
+            for j in range(other_offsets[i_event], other_offsets[i_event + 1]):
+                if not other_valid[j]:
+                    continue
+                found[i] = True
+                d = _delta_r_pair(eta[i], phi[i], other_eta[j], other_phi[j])
+                if d < result[i]:
+                    result[i] = d
+    return result, found
+
+
+@jit
+def _delta_r_any_within_kernel(eta, phi, valid, offsets, other_eta, other_phi, other_valid, other_offsets, max_dr):
+    """
+    Whether each entry has any entry of the other collection in the same event that is not
+    separated from it by more than `max_dr` (NaN distances count as not separated).
+    """
+    result = np.zeros(len(eta), dtype=np.bool_)
+    for i_event in range(len(offsets) - 1):
+        for i in range(offsets[i_event], offsets[i_event + 1]):
+            if not valid[i]:
+                continue
+            for j in range(other_offsets[i_event], other_offsets[i_event + 1]):
+                if not other_valid[j]:
+                    continue
+                if not _delta_r_pair(eta[i], phi[i], other_eta[j], other_phi[j]) > max_dr:
+                    result[i] = True
+                    break
+    return result
+
+
+@jit
+def _delta_r_nearest_kernel(eta, phi, valid, offsets, other_eta, other_phi, other_valid, other_offsets):
+    """
+    Local index of the entry of the other collection in the same event that is nearest to each
+    entry (-1 if there is none), following the order of `ak.argsort` (ties are resolved by
+    taking the first entry, NaN distances are sorted first).
+    """
+    result = np.full(len(eta), -1, dtype=np.int64)
+    for i_event in range(len(offsets) - 1):
+        j0 = other_offsets[i_event]
+        for i in range(offsets[i_event], offsets[i_event + 1]):
+            if not valid[i]:
+                continue
+            best_dist = 0.0
+            for j in range(j0, other_offsets[i_event + 1]):
+                if not other_valid[j]:
+                    continue
+                d = _delta_r_pair(eta[i], phi[i], other_eta[j], other_phi[j])
+                if np.isnan(d):
+                    result[i] = j - j0
+                    break
+                if result[i] < 0 or d < best_dist:
+                    result[i] = j - j0
+                    best_dist = d
+    return result
+
+
+def _flat_directions(lvs, mask=None):
+    """
+    Return the flat eta and phi values of the Lorentz vectors `lvs` (lists per event, or a
+    single optional entry per event), a flag for entries that are present (and selected by the
+    optional `mask` with the same structure), the offsets of the events in the flat arrays,
+    and whether `lvs` contains a single entry per event.
+    """
+    single = lvs.ndim == 1
+    if single:
+        lvs = ak.unflatten(lvs, 1)
+        if mask is not None:
+            mask = ak.unflatten(mask, 1)
+    lvs = ak.fill_none(lvs, [], axis=0)
+
+    counts = np.asarray(ak.num(lvs, axis=1), dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    eta = np.asarray(ak.fill_none(ak.flatten(lvs.eta, axis=1), np.nan), dtype=np.float64)
+    phi = np.asarray(ak.fill_none(ak.flatten(lvs.phi, axis=1), np.nan), dtype=np.float64)
+    valid = ~np.asarray(ak.flatten(ak.is_none(lvs.eta, axis=1), axis=1), dtype=bool)
+    if mask is not None:
+        mask = ak.fill_none(ak.fill_none(mask, [], axis=0), False)
+        valid &= np.asarray(ak.flatten(mask, axis=1), dtype=bool)
+
+    return eta, phi, valid, offsets, single
+
+
+def _unflatten_directions(values, offsets, single):
+    # restore the structure of the input to `_flat_directions`
+    arr = ak.unflatten(values, np.diff(offsets))
+    return arr[:, 0] if single else arr
+
+
+def delta_r_min(lvs, other_lvs):
+    """
+    Return the minimum delta-R between each entry in `lvs` and the entries in `other_lvs`
+    of the same event, equivalent to `ak.min(lvs.metric_table(other_lvs), axis=2)` but
+    without building the table. Either argument can also contain a single (optional) entry
+    per event instead of a list. The result has the structure of `lvs` and is *None* if
+    there are no entries to compare to.
+    """
+    eta, phi, valid, offsets, single = _flat_directions(lvs)
+    other_eta, other_phi, other_valid, other_offsets, _ = _flat_directions(other_lvs)
+
+    result, found = _delta_r_min_kernel(
+        eta, phi, valid, offsets,
+        other_eta, other_phi, other_valid, other_offsets,
+    )
+
+    return _unflatten_directions(ak.mask(result, found), offsets, single)
+
+
+def delta_r_any_within(lvs, other_lvs, max_dr):
+    """
+    Return whether each entry in `lvs` has any entry in `other_lvs` of the same event
+    within a delta-R of `max_dr`, equivalent to
+    `~ak.all(lvs.metric_table(other_lvs) > max_dr, axis=2)` but without building the table.
+    Either argument can also contain a single (optional) entry per event instead of a list.
+    The result has the structure of `lvs` and is *False* for missing entries.
+    """
+    eta, phi, valid, offsets, single = _flat_directions(lvs)
+    other_eta, other_phi, other_valid, other_offsets, _ = _flat_directions(other_lvs)
+
+    result = _delta_r_any_within_kernel(
+        eta, phi, valid, offsets,
+        other_eta, other_phi, other_valid, other_offsets,
+        float(max_dr),
+    )
+
+    return _unflatten_directions(result, offsets, single)
+
+
+def delta_r_nearest(lvs, other_lvs, other_mask=None):
+    """
+    Return the local index of the entry in `other_lvs` nearest in delta-R to each entry in
+    `lvs` in the same event, optionally only considering the entries selected by the boolean
+    array `other_mask` (with the same structure as `other_lvs`). Equivalent to the first
+    index of `ak.argsort` applied to the delta-R values, but without building the table.
+    Either argument can also contain a single (optional) entry per event instead of a list.
+    The result has the structure of `lvs` and is *None* if there are no entries to compare to.
+    """
+    eta, phi, valid, offsets, single = _flat_directions(lvs)
+    other_eta, other_phi, other_valid, other_offsets, _ = _flat_directions(other_lvs, mask=other_mask)
+
+    result = _delta_r_nearest_kernel(
+        eta, phi, valid, offsets,
+        other_eta, other_phi, other_valid, other_offsets,
+    )
+
+    return _unflatten_directions(ak.mask(result, result >= 0), offsets, single)
+
+
+#
+# ancestry queries on generator particles
+#
+
+class GenPartAncestry(object):
+    """
+    Precomputed ancestry structure for generator particles, built once from the jagged
+    mother indices `mother_idx` (e.g. `GenPart.genPartIdxMother`, negative if no mother
+    exists) and operating on the flat arrays.
+
+    Ancestors are found by binary lifting: the table `up[k]` contains the `2^k`-th ancestor
+    of each particle (or the sentinel `n_particles` once the chain has ended), so that any
+    ancestor can be reached in `O(log depth)` vectorized steps instead of walking the chain
+    one generation at a time.
+    """
+
+    def __init__(self, mother_idx: ak.Array):
+        self.counts = np.asarray(ak.num(mother_idx, axis=1), dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+        self.n_particles = n = int(self.offsets[-1])
+
+        # event index of each particle
+        self.event_idx = np.repeat(np.arange(len(self.counts)), self.counts)
+
+        # flat mother indices, with the sentinel `n` for particles without mother
+        mother_local = np.asarray(ak.flatten(mother_idx, axis=1), dtype=np.int64)
+        parent = np.where(mother_local >= 0, mother_local + self.offsets[self.event_idx], n)
+
+        # binary lifting table, with an extra entry for the sentinel pointing to itself
+        self.up = [np.append(parent, n)]
+        while np.any(self.up[-1][:n] != n):
+            if len(self.up) == 64:
+                raise ValueError("cyclic mother indices")
+            self.up.append(self.up[-1][self.up[-1]])
+
+        # depth of each particle in its decay chain (0 for particles without mother)
+        self.depth = np.zeros(n + 1, dtype=np.int64)
+        current = np.arange(n + 1)
+        for k in reversed(range(len(self.up))):
+            ancestor = self.up[k][current]
+            has_ancestor = ancestor != n
+            self.depth[has_ancestor] += 1 << k
+            current = np.where(has_ancestor, ancestor, current)
+        self.depth[n] = -1
+
+    def ancestor(self, idx: np.ndarray, generations: np.ndarray) -> np.ndarray:
+        """
+        Return the flat index of the ancestor `generations` levels above the particles with
+        flat indices `idx`, or the sentinel `n_particles` if the chain ends before.
+        """
+        current = np.array(idx, dtype=np.int64)
+        generations = np.broadcast_to(generations, current.shape)
+        for k, up in enumerate(self.up):
+            jump = ((generations >> k) & 1).astype(bool)
+            current = np.where(jump, up[current], current)
+        return current
+
+    def is_descendant(self, root_idxs):
+        """
+        Return jagged boolean arrays with the same structure as the generator particles that
+        indicate whether each particle is part of the decay chain of (i.e. is identical to or
+        descended from) the particle at the local index given per event in `root_idxs`.
+        Missing or negative root indices match no particles.
+
+        `root_idxs` can also be a list of arrays with root indices, in which case all queries
+        are answered in the same vectorized pass and a list of results is returned.
+        """
+        single = not isinstance(root_idxs, (list, tuple))
+        if single:
+            root_idxs = [root_idxs]
+
+        # flat root indices per event and query, sentinel `n` if missing
+        n = self.n_particles
+        roots = np.stack([
+            np.asarray(ak.fill_none(idx, -1), dtype=np.int64)
+            for idx in root_idxs
+        ], axis=1)
+        roots = np.where(
+            (roots >= 0) & (roots < self.counts[:, np.newaxis]),
+            roots + self.offsets[:-1, np.newaxis],
+            n,
+        )
+
+        # lift each particle to the depth of the root, and compare
+        particle_roots = roots[self.event_idx]
+        generations = self.depth[:n, np.newaxis] - self.depth[particle_roots]
+        ancestor = self.ancestor(
+            np.broadcast_to(np.arange(n)[:, np.newaxis], generations.shape),
+            np.maximum(generations, 0),
+        )
+        result = (generations >= 0) & (particle_roots != n) & (ancestor == particle_roots)
+
+        results = [ak.unflatten(result[:, i], self.counts) for i in range(result.shape[1])]
+        return results[0] if single else results
@@ -19,6 +19,7 @@ from columnflow.production.categories import category_ids
 from columnflow.production.cms.mc_weight import mc_weight
 from columnflow.production.processes import process_ids
 
+from mtt.memo import chunk_memo
 from mtt.selection.general import jet_energy_shifts
 from mtt.selection.lepton import lepton_selection
 from mtt.selection.cutflow_features import cutflow_features
@@ -66,6 +67,7 @@ ak = maybe_import("awkward")
     },
     exposed=True,
 )
+@chunk_memo()
 def default_without_2d_selection(
     self: Selector,
     events: ak.Array,
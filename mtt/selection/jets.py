@@ -14,6 +14,7 @@ from mtt.selection.general import jet_energy_shifts
 from mtt.selection.lepton import lepton_selection
 
 from mtt.production.lepton import choose_lepton
+from mtt.production.util import delta_r_any_within, delta_r_nearest
 
 np = maybe_import("numpy")
 ak = maybe_import("awkward")
@@ -158,11 +159,10 @@ def top_tagged_jets(
     lepton = events["Lepton"]
 
     # separation from main lepton
-    delta_r_fatjet_lepton = ak.firsts(events.FatJet.metric_table(lepton), axis=-1)
     fatjet_mask_toptag_delta_r_lepton = (
         fatjet_mask_toptag &
         # pass if no main lepton exists
-        ak.fill_none(delta_r_fatjet_lepton > 0.8, True)
+        ~delta_r_any_within(events.FatJet, lepton, 0.8)
     )
     fatjet_indices_toptag_delta_r_lepton = masked_sorted_indices(
         fatjet_mask_toptag_delta_r_lepton,
@@ -284,14 +284,16 @@ def lepton_jet_2d_selection(
             continue
 
         leptons = ak.firsts(events[route][lepton_indices])
-        lepton_jet_deltar = ak.firsts(jets.metric_table(leptons), axis=-1)
 
-        lepton_closest_jet = ak.firsts(
-            jets[masked_sorted_indices(jets_mask, lepton_jet_deltar, ascending=True)],
+        # closest jet to lepton (note: `jets_mask` refers to all jets and
+        # is applied to the positions of the selected jets)
+        lepton_closest_jet_idx = delta_r_nearest(
+            leptons, jets, other_mask=jets_mask[ak.local_index(jets)],
         )
+        lepton_closest_jet = ak.firsts(jets[ak.singletons(lepton_closest_jet_idx)])
 
         # veto events where there is a jet too close to the lepton
-        sel = ak.all(lepton_jet_deltar > 0.4, axis=-1)
+        sel = ~delta_r_any_within(leptons, jets, 0.4)
 
         # but keep events where the perpendicular lepton momentum relative
         # to the jet is sufficiently large
@@ -11,6 +11,7 @@ from columnflow.columnar_util import set_ak_column
 
 from columnflow.selection import Selector, SelectionResult, selector
 
+from mtt.memo import chunk_memoized
 from mtt.selection.util import masked_sorted_indices
 from mtt.selection.early import check_early
 from mtt.production.lepton import choose_lepton
@@ -251,6 +252,7 @@ def merge_selection_steps(step_dicts):
     },
     exposed=True,
 )
+@chunk_memoized
 def lepton_selection(
     self: Selector,
     events: ak.Array,
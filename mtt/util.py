@@ -3,6 +3,60 @@
 Analysis-wide utility functions
 """
 import math
+import multiprocessing
+import pickle
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from columnflow.util import maybe_import
+
+np = maybe_import("numpy")
+
+
+def chunk_slices(size, max_chunk_size):
+    """
+    Return a list of slices dividing a range of length `size` into chunks
+    of at most `max_chunk_size`. If `max_chunk_size` is negative or zero,
+    a single slice covering the full range is returned.
+    """
+    # compute number of chunks
+    n_chunks = 1
+    if max_chunk_size > 0:
+        n_chunks = int(math.ceil(size / max_chunk_size))
+
+    if n_chunks == 1:
+        return [slice(0, size)]
+
+    return [
+        slice(i_chunk * max_chunk_size, min(size, (i_chunk + 1) * max_chunk_size))
+        for i_chunk in range(n_chunks)
+    ]
+
+
+def cost_chunk_slices(costs, max_chunk_cost, max_chunk_size=None):
+    """
+    Return a list of slices dividing a sequence of items with the given `costs`
+    into contiguous chunks with a total cost of at most `max_chunk_cost`. Items
+    whose cost exceeds `max_chunk_cost` on their own are placed in a chunk of size one.
+    Optionally, the number of items per chunk can be limited to `max_chunk_size`.
+    """
+    costs = np.asarray(costs, dtype=np.float64)
+    cum_costs = np.cumsum(costs)
+    size = len(costs)
+
+    slices = []
+    start = 0
+    while start < size:
+        offset = cum_costs[start - 1] if start > 0 else 0.0
+        stop = int(np.searchsorted(cum_costs, offset + max_chunk_cost, side="right"))
+        stop = max(stop, start + 1)
+        if max_chunk_size is not None and max_chunk_size > 0:
+            stop = min(stop, start + max_chunk_size)
+        slices.append(slice(start, stop))
+        start = stop
+
+    return slices
 
 
 def iter_chunks(*arrays, max_chunk_size):
@@ -17,19 +71,115 @@ def iter_chunks(*arrays, max_chunk_size):
         lengths_str = ", ".join(str(len(arr)) for arr in arrays)
         raise ValueError(f"array length mismatch: {lengths_str}")
 
-    # compute number of chunks
-    n_chunks = 1
-    if max_chunk_size > 0:
-        n_chunks = int(math.ceil(size / max_chunk_size))
+    slices = chunk_slices(size, max_chunk_size)
 
     # if no chunking is needed, yield the arrays directly
-    if n_chunks == 1:
+    if len(slices) == 1:
         yield arrays
         return
 
     # loop over chunks
-    for i_chunk in range(n_chunks):
-        end = min(size, (i_chunk + 1) * max_chunk_size)
-        slc = slice(i_chunk * max_chunk_size, end)
-
+    for slc in slices:
         yield tuple(a[slc] for a in arrays)
+
+
+# state of worker processes used by `map_chunks`
+_worker_state = {}
+
+
+def _init_worker(func, arrays, kwargs):
+    _worker_state["func"] = func
+    _worker_state["arrays"] = arrays
+    _worker_state["kwargs"] = kwargs
+
+
+def _run_chunk(slc, arrays_chk=None):
+    # arrays not shipped with the task are inherited from the parent process
+    if arrays_chk is None:
+        arrays_chk = tuple(a[slc] for a in _worker_state["arrays"])
+    return _worker_state["func"](*arrays_chk, **_worker_state["kwargs"])
+
+
+def map_chunks(
+    func,
+    *arrays,
+    max_chunk_size=None,
+    slices=None,
+    n_workers=0,
+    start_method="fork",
+    max_in_flight=None,
+    **kwargs,
+):
+    """
+    Apply function `func` to chunks of one or more identically-sized `arrays`
+    of at most `max_chunk_size` (see `iter_chunks`) and yield the results in order.
+    Alternatively, the chunks can be given explicitly as a list of `slices`.
+    Additional `kwargs` are passed on to `func`.
+
+    If `n_workers` is positive, the chunks are processed in parallel by a pool of
+    `n_workers` processes created with the given multiprocessing `start_method`.
+    At most `max_in_flight` chunks (default: `n_workers`) are processed or waiting
+    to be yielded at any time, which bounds the memory needed for holding results.
+
+    With the ``"fork"`` start method, the workers inherit `func` and the input
+    arrays from the parent process, so only the chunk boundaries are sent to the
+    workers and `func` may be a closure. With other start methods, `func` must be
+    picklable and each chunk is pickled and sent to a worker. In both cases, the
+    results are pickled and sent back to the parent process.
+    """
+    # validate input sizes
+    size = len(arrays[0])
+    if any(len(arr) != size for arr in arrays[1:]):
+        lengths_str = ", ".join(str(len(arr)) for arr in arrays)
+        raise ValueError(f"array length mismatch: {lengths_str}")
+
+    if (max_chunk_size is None) == (slices is None):
+        raise ValueError("exactly one of 'max_chunk_size' and 'slices' must be given")
+
+    if slices is None:
+        slices = chunk_slices(size, max_chunk_size)
+
+    # serial processing
+    if n_workers <= 0:
+        for slc in slices:
+            yield func(*(a[slc] for a in arrays), **kwargs)
+        return
+
+    if max_in_flight is None:
+        max_in_flight = n_workers
+    if max_in_flight < 1:
+        raise ValueError(f"max_in_flight must be positive, got {max_in_flight}")
+
+    # only forked workers can inherit the function and inputs
+    inherit = (start_method == "fork")
+    if not inherit:
+        try:
+            pickle.dumps(func)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            raise ValueError(
+                f"function {func} cannot be pickled, which is required "
+                f"for start method '{start_method}' (use 'fork' instead)",
+            ) from e
+
+    with ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=_init_worker,
+        initargs=(func, arrays if inherit else None, kwargs),
+    ) as executor:
+
+        def submit(slc):
+            if inherit:
+                return executor.submit(_run_chunk, slc)
+            return executor.submit(_run_chunk, slc, tuple(a[slc] for a in arrays))
+
+        # keep at most `max_in_flight` chunks submitted,
+        # and yield results in order of submission
+        futures = deque(submit(slc) for slc in slices[:max_in_flight])
+        i_next = len(futures)
+        while futures:
+            result = futures.popleft().result()
+            if i_next < len(slices):
+                futures.append(submit(slices[i_next]))
+                i_next += 1
+            yield result